@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+# ---- Batch session runner ----------------------------------------------------
+
+RunItemFn = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+class BatchRunner:
+    """Runs many scripted sessions on a bounded pool of workers.
+
+    Items are fed to ``concurrency`` workers through a small queue, so input of
+    any length is consumed lazily. Results are yielded as they complete (each
+    carries its input ``index``). An item that raises is retried up to
+    ``max_attempts`` times with exponential backoff before it is reported as
+    failed; the batch itself never aborts on a failed item.
+    """
+
+    def __init__(self, run_item: RunItemFn, concurrency: int = 8, max_attempts: int = 3, retry_delay: float = 0.5):
+        self.run_item = run_item
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.started_at: Optional[float] = None
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def _run_one(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = await self.run_item(item)
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.failed += 1
+                    return {"type": "session", "index": index, "id": item.get("id"), "ok": False,
+                            "attempts": attempt, "error": f"{type(e).__name__}: {e}",
+                            "elapsed_ms": round((time.monotonic() - started) * 1000)}
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                continue
+            self.succeeded += 1
+            return {"type": "session", "index": index, "id": item.get("id"), "ok": True, "attempts": attempt,
+                    "elapsed_ms": round((time.monotonic() - started) * 1000), **result}
+
+    async def run(self, items: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        self.started_at = time.monotonic()
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue()
+        done = object()
+        input_errors = []
+
+        async def produce():
+            try:
+                for index, item in enumerate(items):
+                    await pending.put((index, item))
+            except Exception as e:
+                input_errors.append(e)  # finish the items already queued, then re-raise
+            for _ in range(self.concurrency):
+                await pending.put(done)
+
+        async def work():
+            while True:
+                entry = await pending.get()
+                if entry is done:
+                    await results.put(done)
+                    return
+                await results.put(await self._run_one(*entry))
+
+        tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        try:
+            finished_workers = 0
+            while finished_workers < self.concurrency:
+                result = await results.get()
+                if result is done:
+                    finished_workers += 1
+                else:
+                    yield result
+            if input_errors:
+                raise input_errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ndjson(self, items: Iterable[Dict[str, Any]]) -> AsyncIterator[str]:
+        """One JSON line per session as it completes, then a final stats line"""
+        async for result in self.run(items):
+            yield json.dumps(result) + "\n"
+        yield json.dumps(self.stats()) + "\n"
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        sessions = self.succeeded + self.failed
+        return {
+            "type": "stats",
+            "sessions": sessions,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "sessions_per_minute": round(self.succeeded / elapsed * 60, 1) if elapsed else None,
+        }
@@ -0,0 +1,87 @@
+"""Concurrent-session throughput of the sync (threadpool) path vs the AsyncOpenAI path.
+
+Both variants drive full sessions (every question plus the summary) against a
+stubbed upstream with a fixed latency. The sync variant runs ``next_step`` to
+completion on a worker thread (``asyncio.run`` through Starlette's
+``run_in_threadpool``), which is how a ``def`` route handler would call it, so
+it is capped by the default 40-thread limiter.
+The step cache, template routing and the event log are turned off and the
+LLM gateway is opened up, so every step is a generated one and only the
+calling path differs.
+
+Run from the agent directory:
+    python -m benchmarks.bench_async --sessions 200 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+from uuid import uuid4
+
+from starlette.concurrency import run_in_threadpool
+
+for _name, _value in (("STEP_CACHE_ENABLED", "0"), ("STEP_ROUTE_DEFAULT", "llm"), ("EVENT_LOG_ENABLED", "0"),
+                      ("LLM_MAX_CONCURRENCY", "1000"), ("LLM_QUEUE_TIMEOUT_SECONDS", "60")):
+    os.environ.setdefault(_name, _value)
+
+import main
+from benchmarks import stub_upstream
+
+def sample_answer(step: main.Step) -> Dict[str, Any]:
+    kind = step.question.input.kind
+    options = step.question.input.options or [{"value": "other"}]
+    if kind == "yes_no":
+        return {"kind": kind, "value": True}
+    if kind == "multiple_choice":
+        return {"kind": kind, "value": options[0]["value"]}
+    if kind == "multi_select":
+        return {"kind": kind, "value": [o["value"] for o in options[:3]]}
+    return {"kind": kind, "value": "A harsh voice that says I am never good enough."}
+
+async def run_session(use_async: bool, step_latencies: List[float]) -> None:
+    sid = str(uuid4())
+    state = main.session_store.create(sid)
+    while True:
+        started = time.perf_counter()
+        if use_async:
+            step = await main.next_step(sid, state)
+        else:
+            step = await run_in_threadpool(asyncio.run, main.next_step(sid, state))
+        step_latencies.append(time.perf_counter() - started)
+        if step.type != "question":
+            break
+        state["answers"][step.question.id] = sample_answer(step)
+    main.session_store.delete(sid)
+
+async def run(use_async: bool, sessions: int) -> Dict[str, float]:
+    step_latencies: List[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(use_async, step_latencies) for _ in range(sessions)))
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(step_latencies, n=100)
+    return {
+        "elapsed_s": elapsed,
+        "sessions_per_s": sessions / elapsed,
+        "step_p50_ms": quantiles[49] * 1000,
+        "step_p95_ms": quantiles[94] * 1000,
+    }
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200, help="concurrent sessions")
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated upstream latency in seconds")
+    args = parser.parse_args()
+
+    stub_upstream.install(main, args.latency)
+    main.get_questionnaire()  # compile once so both runs start warm
+
+    for label, use_async in (("sync (threadpool)", False), ("async (AsyncOpenAI)", True)):
+        result = asyncio.run(run(use_async, args.sessions))
+        print(f"{label:22} {args.sessions} sessions in {result['elapsed_s']:.2f}s  "
+              f"{result['sessions_per_s']:.1f} sessions/s  "
+              f"step p50 {result['step_p50_ms']:.0f} ms  p95 {result['step_p95_ms']:.0f} ms")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,71 @@
+"""Previous-answer context size per question step, before and after compaction.
+
+Replays one session with multi-paragraph free-text answers and reports, for
+every step, the tokens of the "Previous answers" block as it was built before
+compaction (every answer verbatim), after compaction while the long answers
+are still being condensed (they are truncated), and after they are condensed.
+Also reports the resulting question-prompt sizes. Condensation goes through
+the in-process stub upstream, so its digests have the canned summary's length.
+
+Run from the agent directory:
+    python -m benchmarks.bench_compaction --budget 400 --paragraphs 3
+"""
+import argparse
+import asyncio
+
+import main
+from benchmarks import stub_upstream
+from compaction import ContextCompactor
+from prompts import count_tokens, format_answers
+
+PARAGRAPH = ("When I sit down to present my work the voice starts right away, telling me that I have not prepared "
+             "enough, that the others can see how little I really know, and that it is only a matter of time before "
+             "someone says it out loud. It sounds like my father when I brought home a report card. ")
+
+def scripted_answers(paragraphs: int):
+    long_text = (PARAGRAPH * paragraphs).strip()
+    return [
+        {"kind": "free_text", "value": long_text},
+        {"kind": "free_text", "value": long_text.replace("voice", "critic")},
+        {"kind": "multiple_choice", "value": "shame"},
+        {"kind": "yes_no", "value": True},
+        {"kind": "yes_no", "value": True},
+        {"kind": "yes_no", "value": False},
+        {"kind": "free_text", "value": long_text.replace("present", "share")},
+        {"kind": "multi_select", "value": ["journaling", "daily_practice", "support_network"]},
+    ]
+
+async def replay(args) -> None:
+    questionnaire = main.get_questionnaire()
+    truncating = ContextCompactor(token_budget=args.budget, long_answer_tokens=args.long_answer_tokens)
+    condensing = ContextCompactor(main.condense_answer, token_budget=args.budget,
+                                  long_answer_tokens=args.long_answer_tokens)
+    answers = {}
+    print(f"{'step':>4} {'context before':>15} {'truncated':>10} {'condensed':>10} {'prompt before':>14} {'prompt after':>13}")
+    for sequence, answer in enumerate(scripted_answers(args.paragraphs)[:questionnaire.total - 1], start=2):
+        answers[f"q_ai_{sequence - 1}"] = answer
+        condensing.schedule(answer)
+        await condensing.drain()
+
+        before = format_answers(answers)
+        truncated = truncating.compact(answers, sequence)
+        condensed = condensing.compact(answers, sequence)
+        prompt = main.build_question_prompt(questionnaire, answers, sequence)["messages"]
+        prompt_tokens = main.prompt_builder.estimate(prompt)
+        context_tokens = count_tokens(main.context_compactor.compact(answers, sequence))
+        print(f"{sequence:>4} {count_tokens(before):>15} {count_tokens(truncated):>10} {count_tokens(condensed):>10} "
+              f"{prompt_tokens - context_tokens + count_tokens(before):>14} "
+              f"{prompt_tokens - context_tokens + count_tokens(condensed):>13}")
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=400, help="context token budget")
+    parser.add_argument("--long-answer-tokens", type=int, default=80, help="answers above this are condensed")
+    parser.add_argument("--paragraphs", type=int, default=3, help="paragraphs per free-text answer")
+    args = parser.parse_args()
+
+    stub_upstream.install(main, 0.0)
+    asyncio.run(replay(args))
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,131 @@
+"""Question-prompt size per session: the legacy prompt vs the prompt builder.
+
+Replays one scripted session through both prompt layouts and reports input
+tokens per session, how much of each call's prefix is identical to the
+previous call (what a provider-side prompt cache can reuse; OpenAI caches
+prefixes of 1024+ tokens in 128-token steps), prompt build time, and a
+simulated upstream latency of ``--base-ms`` plus ``--ms-per-1k`` per
+uncached 1k input tokens.
+
+Run from the agent directory:
+    python -m benchmarks.bench_prompts
+"""
+import argparse
+import os
+import time
+from typing import Any, Dict, List
+
+import main
+from benchmarks import stub_upstream
+from prompts import count_tokens
+
+SCRIPTED_ANSWERS = [
+    {"kind": "free_text", "value": "The inner critic that tells me I am never good enough at work. " * 3},
+    {"kind": "free_text", "value": "It says I should have prepared more and that everyone will see I am a fraud. " * 3},
+    {"kind": "multiple_choice", "value": "shame"},
+    {"kind": "yes_no", "value": True},
+    {"kind": "yes_no", "value": True},
+    {"kind": "yes_no", "value": False},
+    {"kind": "free_text", "value": "Being present with my kids in the evening, even when the voice is loud."},
+    {"kind": "multi_select", "value": ["journaling", "daily_practice", "support_network"]},
+]
+
+def legacy_question_messages(questionnaire, answers: Dict[str, Any], sequence: int) -> List[Dict[str, str]]:
+    """The prompt layout generate_ai_question used before the prompt builder"""
+    total_questions = questionnaire.total
+    question_text = questionnaire.text(sequence)
+    target_question_type = questionnaire.type(sequence)
+    context_parts = []
+    for q_id, answer_data in answers.items():
+        context_parts.append(f"Q{len(context_parts)+1} ({answer_data.get('kind', 'unknown')}): {answer_data.get('value', 'No answer')}")
+    context_text = "\n".join(context_parts) if context_parts else "This is the first question."
+    system_prompt = f"""You are conducting a therapeutic self-reflection interview using these specific questions:
+
+{questionnaire.content}
+
+You must ask question #{sequence} of {total_questions} which is: "{question_text}"
+
+CRITICAL REQUIREMENTS:
+1. The question type MUST be: {target_question_type}
+2. Return ONLY a JSON object (no markdown, no explanations)
+3. Use the EXACT question text: "{question_text}"
+4. For multiple_choice: provide realistic emotion options for emotion questions, or relevant options for other questions
+5. For multi_select: provide multiple actionable options that can be selected together
+6. For yes_no: no options needed
+7. For free_text: provide encouraging placeholder text
+
+JSON Format:
+{{
+  "question": "{question_text}",
+  "input_type": "{target_question_type}",
+  "help": "Optional helpful guidance text",
+  "placeholder": "Optional placeholder for free_text",
+  "options": [
+    {{"value": "key1", "label": "Option 1"}},
+    {{"value": "key2", "label": "Option 2"}}
+  ]
+}}
+
+Use therapeutic, supportive language in help text."""
+    if sequence == 1:
+        user_prompt = f"""Generate question #{sequence} of {total_questions} from the questions.md file.
+        Question text: "{question_text}"
+        Question type must be: {target_question_type}
+        Include a supportive placeholder to encourage open sharing."""
+    else:
+        user_prompt = f"""Based on the previous answers:
+{context_text}
+
+Generate question #{sequence} of {total_questions} from the questions.md file. 
+Question text: "{question_text}"
+Question type must be: {target_question_type}
+
+Build on their previous answers to create continuity in this therapeutic conversation."""
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+def builder_question_messages(questionnaire, answers: Dict[str, Any], sequence: int) -> List[Dict[str, str]]:
+    return main.build_question_prompt(questionnaire, answers, sequence)["messages"]
+
+def serialize(messages: List[Dict[str, str]]) -> str:
+    return "".join(f"<{m['role']}>{m['content']}" for m in messages)
+
+def cacheable_tokens(shared_prefix_tokens: int) -> int:
+    return 0 if shared_prefix_tokens < 1024 else shared_prefix_tokens // 128 * 128
+
+def replay(build, questionnaire, args) -> Dict[str, float]:
+    answers: Dict[str, Any] = {}
+    previous = ""
+    totals = {"tokens": 0, "shared": 0, "cacheable": 0, "build_us": 0.0, "latency_ms": 0.0}
+    for sequence in range(1, questionnaire.total + 1):
+        started = time.perf_counter()
+        messages = build(questionnaire, answers, sequence)
+        totals["build_us"] += (time.perf_counter() - started) * 1e6
+        text = serialize(messages)
+        tokens = count_tokens(text)
+        shared = count_tokens(os.path.commonprefix([previous, text])) if previous else 0
+        cacheable = cacheable_tokens(shared)
+        totals["tokens"] += tokens
+        totals["shared"] += shared
+        totals["cacheable"] += cacheable
+        totals["latency_ms"] += args.base_ms + args.ms_per_1k * (tokens - cacheable) / 1000
+        previous = text
+        answers[f"q_ai_{sequence}"] = SCRIPTED_ANSWERS[(sequence - 1) % len(SCRIPTED_ANSWERS)]
+    return totals
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-ms", type=float, default=400.0, help="simulated fixed latency per call")
+    parser.add_argument("--ms-per-1k", type=float, default=60.0, help="simulated latency per 1k uncached input tokens")
+    args = parser.parse_args()
+
+    stub_upstream.install(main, 0.0)
+    questionnaire = main.get_questionnaire()
+    print(f"{'layout':10} {'tokens/session':>15} {'shared prefix':>14} {'cacheable':>10} {'build':>10} {'sim. latency':>13}")
+    for label, build in (("legacy", legacy_question_messages), ("builder", builder_question_messages)):
+        totals = replay(build, questionnaire, args)
+        share = totals["shared"] / totals["tokens"] * 100
+        print(f"{label:10} {totals['tokens']:>15,} {share:>13.0f}% {totals['cacheable']:>10,} "
+              f"{totals['build_us']:>8.0f}us {totals['latency_ms']:>11.0f}ms")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,55 @@
+"""Answer-write throughput of the session stores under concurrent sessions.
+
+Each worker thread plays whole sessions: create, then one read-modify-write
+per answer with ``get()`` and ``save()``, the calls main.py makes for an answer.
+SQLite is measured with write-behind batching and with write-through.
+
+Run from the agent directory:
+    python -m benchmarks.bench_session_store --sessions 2000 --threads 16
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from sessions import InMemorySessionStore, SQLiteSessionStore, SessionStore
+
+ANSWERS_PER_SESSION = 8
+LONG_ANSWER = "The voice tells me I am not good enough and that I will fail. " * 5
+
+def play_session(store: SessionStore) -> None:
+    sid = str(uuid4())
+    store.create(sid)
+    for sequence in range(1, ANSWERS_PER_SESSION + 1):
+        state = store.get(sid)
+        state["answers"][f"q_ai_{sequence}"] = {"kind": "free_text", "value": LONG_ANSWER}
+        state["sequence"] = sequence + 1
+        store.save(sid, state)
+
+def measure(label: str, store: SessionStore, sessions: int, threads: int) -> None:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(play_session, store) for _ in range(sessions)]:
+            future.result()
+    store.close()  # includes the final flush, so batching gets no free pass
+    elapsed = time.perf_counter() - started
+    writes = sessions * (ANSWERS_PER_SESSION + 1)
+    print(f"{label:28} {writes} writes in {elapsed:.2f}s  {writes / elapsed:,.0f} writes/s")
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    measure("memory", InMemorySessionStore(), args.sessions, args.threads)
+    measure("sqlite (batched, WAL)", SQLiteSessionStore(os.path.join(directory, "batched.db")),
+            args.sessions, args.threads)
+    measure("sqlite (write-through, WAL)", SQLiteSessionStore(os.path.join(directory, "direct.db"), flush_interval=0),
+            args.sessions, args.threads)
+
+if __name__ == "__main__":
+    main_cli()
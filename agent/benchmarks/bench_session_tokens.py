@@ -0,0 +1,59 @@
+"""Cost and size of stateless session tokens over a full 8-question session.
+
+At every step the token is verified and re-issued with one more answer, as
+post_answer does in SESSION_MODE=stateless. Reports encode/verify time per
+step and how the token grows compared with the raw state JSON.
+
+Run from the agent directory:
+    python -m benchmarks.bench_session_tokens --iterations 2000
+"""
+import argparse
+import json
+import time
+from uuid import uuid4
+
+from session_tokens import SessionTokenCodec
+from sessions import new_session_state
+
+ANSWERS = [
+    {"kind": "free_text", "value": "The voice that tells me I am not good enough and that everyone will notice I failed."},
+    {"kind": "free_text", "value": "It sounds like my old manager, sharp and impatient, mostly when I present my work."},
+    {"kind": "multiple_choice", "value": "shame"},
+    {"kind": "yes_no", "value": True},
+    {"kind": "yes_no", "value": True},
+    {"kind": "yes_no", "value": False},
+    {"kind": "free_text", "value": "I value honesty and craftsmanship, and I want to keep learning without fear of mistakes."},
+    {"kind": "multi_select", "value": ["daily_practice", "journaling", "support_network"]},
+]
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    codec = SessionTokenCodec(b"benchmark-secret")
+    session_id = str(uuid4())
+    state = new_session_state()
+    token = codec.encode(session_id, state)
+
+    print(f"{'step':>4} {'state json B':>13} {'token B':>8} {'verify us':>10} {'encode us':>10}")
+    for sequence, answer in enumerate(ANSWERS, start=1):
+        state["answers"][f"q_ai_{sequence}"] = answer
+        state["sequence"] = sequence + 1
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            codec.decode(token)
+        verify_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            new_token = codec.encode(session_id, state)
+        encode_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+        token = new_token
+        raw_size = len(json.dumps(state, separators=(",", ":")))
+        print(f"{sequence:>4} {raw_size:>13} {len(token):>8} {verify_us:>10.1f} {encode_us:>10.1f}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,116 @@
+"""First-request latency after a (re)start, with and without waiting for warm-up.
+
+Starts the mock upstream once, then the agent twice on a fresh port:
+
+- cold: no connection warm-up; traffic starts as soon as the port accepts connections.
+- warm: traffic starts once ``GET /ready`` returns 200.
+
+Each time it reports the latency of the first ``POST /sessions`` next to the
+median of the following ones (steady state). The step cache, template routing
+and the bundle are off, so every request generates its first question.
+
+Run from the agent directory:
+    python -m benchmarks.bench_warmup --mock-latency 0.05 --requests 20
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load_test import AGENT_DIR, free_port, wait_until_up
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"port {port} did not open within {timeout:.0f}s")
+
+def wait_until_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+def measure(mode: str, mock_url: str, requests: int) -> Dict[str, float]:
+    port = free_port()
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=mock_url,
+        OPENAI_API_KEY="mock",
+        QUESTION_TYPES_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "questions.types.json"),
+        WARMUP_CONNECTIONS="0" if mode == "cold" else os.getenv("WARMUP_CONNECTIONS", "4"),
+        PREFETCH_ENABLED="0",  # keep background generations out of the timings
+        # Every POST /sessions must generate its first question, or the timings measure cache lookups
+        STEP_CACHE_ENABLED="0",
+        STEP_ROUTE_DEFAULT="llm",
+        BUNDLE_ENABLED="0",
+        EVENT_LOG_ENABLED="0",
+    )
+    agent = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=AGENT_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        started = time.monotonic()
+        if mode == "cold":
+            wait_for_port(port)
+        else:
+            wait_until_ready(f"{base}/ready")
+        ready_after = time.monotonic() - started
+        latencies: List[float] = []
+        with httpx.Client(base_url=base, timeout=60.0) as client:
+            for _ in range(requests):
+                request_started = time.monotonic()
+                client.post("/sessions", json={}).raise_for_status()
+                latencies.append(time.monotonic() - request_started)
+        return {
+            "ready_after": ready_after,
+            "first": latencies[0],
+            "steady_p50": statistics.median(latencies[1:]),
+        }
+    finally:
+        agent.terminate()
+        agent.wait(timeout=10)
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20, help="POST /sessions per run (the first one is cold)")
+    parser.add_argument("--mock-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency", str(args.mock_latency), "--jitter", "0"],
+        cwd=AGENT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{mock_port}/v1/models")
+        print(f"{'mode':6} {'traffic after':>14} {'first request':>14} {'steady p50':>11} {'first/steady':>13}")
+        for mode in ("cold", "warm"):
+            result = measure(mode, f"http://127.0.0.1:{mock_port}/v1", args.requests)
+            print(f"{mode:6} {result['ready_after'] * 1000:>12.0f}ms {result['first'] * 1000:>12.0f}ms "
+                  f"{result['steady_p50'] * 1000:>9.0f}ms {result['first'] / result['steady_p50']:>12.1f}x")
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+if __name__ == "__main__":
+    main_cli()
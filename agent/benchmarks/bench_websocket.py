@@ -0,0 +1,139 @@
+"""Per-step latency of the REST flow vs the WebSocket channel.
+
+Starts the mock upstream and the agent once, then runs the same number of
+sessions twice at the same concurrency:
+
+- rest: ``POST /sessions/{sid}/answer`` per step on a keep-alive client, the
+  summary streamed from ``/summary/stream`` (``?stream_summary=true``).
+- ws: one ``/sessions/{sid}/ws`` connection per session; answers go up, steps
+  and summary tokens are pushed down.
+
+Reports p50/p95 of answer -> next step, answer -> first summary token and
+answer -> final summary step. The step cache and template routing are turned
+off so both runs generate every step.
+
+Run from the agent directory:
+    python -m benchmarks.bench_websocket --sessions 40 --concurrency 10 --mock-latency 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+from websockets.asyncio.client import connect
+
+from benchmarks.load_test import AGENT_DIR, free_port, percentiles, sample_answer, wait_until_up
+
+Latencies = Dict[str, List[float]]
+
+async def rest_session(client: httpx.AsyncClient, latencies: Latencies) -> None:
+    step = (await client.post("/sessions", json={})).raise_for_status().json()
+    sid, step = step["session_id"], step["step"]
+    while step["type"] == "question":
+        started = time.monotonic()
+        response = await client.post(f"/sessions/{sid}/answer", params={"stream_summary": "true"}, json={
+            "session_id": sid, "question_id": step["question"]["id"], "answer": sample_answer(step),
+        })
+        step = response.raise_for_status().json()["step"]
+        if step["type"] == "question":
+            latencies["step"].append(time.monotonic() - started)
+    first_token = None
+    async with client.stream("GET", step["ui"]["stream_url"]) as stream:
+        async for line in stream.aiter_lines():
+            if line.startswith("event: token") and first_token is None:
+                first_token = time.monotonic() - started
+            if line.startswith("event: done"):
+                break
+    latencies["summary_first_token"].append(first_token if first_token is not None else time.monotonic() - started)
+    latencies["summary_done"].append(time.monotonic() - started)
+
+async def ws_session(client: httpx.AsyncClient, base_ws: str, latencies: Latencies) -> None:
+    step = (await client.post("/sessions", json={})).raise_for_status().json()
+    sid, step = step["session_id"], step["step"]
+    async with connect(f"{base_ws}/sessions/{sid}/ws") as ws:
+        assert json.loads(await ws.recv())["type"] == "ready"
+        while step["type"] == "question":
+            started = time.monotonic()
+            await ws.send(json.dumps({
+                "type": "answer", "question_id": step["question"]["id"], "answer": sample_answer(step),
+            }))
+            first_token = None
+            while True:
+                message = json.loads(await ws.recv())
+                if message["type"] == "ping":
+                    await ws.send(json.dumps({"type": "pong"}))
+                elif message["type"] == "error":
+                    raise RuntimeError(message["detail"])
+                elif message["type"] == "summary_token" and first_token is None:
+                    first_token = time.monotonic() - started
+                elif message["type"] == "step" and message["step"]["type"] != "summary":
+                    break  # the streaming placeholder is followed by the tokens and the final step
+            step = message["step"]
+            if step["type"] == "question":
+                latencies["step"].append(time.monotonic() - started)
+        latencies["summary_first_token"].append(first_token if first_token is not None else time.monotonic() - started)
+        latencies["summary_done"].append(time.monotonic() - started)
+
+async def run(mode: str, base: str, sessions: int, concurrency: int) -> Latencies:
+    latencies: Latencies = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=120.0, limits=limits) as client:
+        async def one() -> None:
+            async with semaphore:
+                if mode == "rest":
+                    await rest_session(client, latencies)
+                else:
+                    await ws_session(client, base.replace("http://", "ws://"), latencies)
+
+        await asyncio.gather(*(one() for _ in range(sessions)))
+    return latencies
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    mock_port, agent_port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency", str(args.mock_latency), "--jitter", "0"],
+        cwd=AGENT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        OPENAI_API_KEY="mock",
+        QUESTION_TYPES_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "questions.types.json"),
+        STEP_CACHE_ENABLED="0",
+        STEP_ROUTE_DEFAULT="llm",
+    )
+    agent = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(agent_port), "--log-level", "warning"],
+        cwd=AGENT_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{mock_port}/v1/models")
+        wait_until_up(f"http://127.0.0.1:{agent_port}/ready")
+        print(f"{'mode':5} {'metric':20} {'p50':>8} {'p95':>8}")
+        for mode in ("rest", "ws"):
+            latencies = asyncio.run(run(mode, f"http://127.0.0.1:{agent_port}", args.sessions, args.concurrency))
+            for metric in ("step", "summary_first_token", "summary_done"):
+                q = percentiles(latencies[metric])
+                print(f"{mode:5} {metric:20} {q['p50'] * 1000:>6.0f}ms {q['p95'] * 1000:>6.0f}ms")
+    finally:
+        for process in (agent, mock):
+            process.terminate()
+            process.wait(timeout=10)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,198 @@
+"""Load generator that drives full questionnaire sessions against a running agent.
+
+Each session is ``POST /sessions`` followed by ``POST /sessions/{sid}/answer``
+until the summary step arrives (optionally streamed from
+``/summary/stream``). Sessions run at a fixed concurrency; the report shows
+sessions/sec and p50/p95/p99 latency per request kind.
+
+With ``--spawn`` the mock OpenAI upstream and the agent are started as
+subprocesses on free local ports, so the whole run is offline.
+
+Run from the agent directory:
+    python -m benchmarks.load_test --spawn --sessions 200 --concurrency 50
+    python -m benchmarks.load_test --target http://127.0.0.1:8000 --sessions 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import httpx
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def sample_answer(step: Dict[str, Any]) -> Dict[str, Any]:
+    question_input = step["question"]["input"]
+    kind = question_input["kind"]
+    options = question_input.get("options") or [{"value": "other"}]
+    if kind == "yes_no":
+        return {"kind": kind, "value": True}
+    if kind == "multiple_choice":
+        return {"kind": kind, "value": options[0]["value"]}
+    if kind == "multi_select":
+        return {"kind": kind, "value": [o["value"] for o in options[:3]]}
+    return {"kind": kind, "value": "A harsh voice that says I am never good enough, especially at work."}
+
+class LoadResults:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+
+    def record(self, kind: str, seconds: float) -> None:
+        self.latencies[kind].append(seconds)
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+async def timed(results: LoadResults, kind: str, request) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = await request
+        response.raise_for_status()
+        return response
+    except Exception:
+        results.errors[kind] += 1
+        raise
+    finally:
+        results.record(kind, time.perf_counter() - started)
+
+async def stream_summary(client: httpx.AsyncClient, results: LoadResults, url: str) -> None:
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_byte is None and line.startswith("event:"):
+                first_byte = time.perf_counter() - started
+                results.record("summary_ttfb", first_byte)
+    results.record("summary_stream", time.perf_counter() - started)
+
+async def run_session(client: httpx.AsyncClient, results: LoadResults, stream: bool) -> None:
+    response = await timed(results, "create", client.post("/sessions", json={}))
+    data = response.json()
+    sid, step = data["session_id"], data["step"]
+    query = "?stream_summary=true" if stream else ""
+
+    while step["type"] == "question":
+        answer = {"session_id": sid, "question_id": step["question"]["id"], "answer": sample_answer(step),
+                  "session_token": step["context"].get("session_token")}  # set in stateless mode
+        next_is_last = step["context"].get("sequence") == step["context"].get("total_questions")
+        kind = "answer_to_summary" if next_is_last else "answer"
+        response = await timed(results, kind, client.post(f"/sessions/{sid}/answer{query}", json=answer))
+        step = response.json()["step"]
+
+    if step["type"] == "summary" and step["ui"].get("stream_url"):
+        await stream_summary(client, results, step["ui"]["stream_url"])
+
+async def run_load(target: str, sessions: int, concurrency: int, stream: bool, timeout: float) -> LoadResults:
+    results = LoadResults()
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, limits=limits) as client:
+        async def one_session():
+            async with semaphore:
+                try:
+                    await run_session(client, results, stream)
+                    results.sessions_completed += 1
+                except Exception as e:
+                    results.sessions_failed += 1
+                    print(f"Session failed: {e!r}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_session() for _ in range(sessions)))
+        results.elapsed = time.perf_counter() - started
+    return results
+
+def print_report(results: LoadResults, sessions: int, concurrency: int) -> None:
+    print(f"\n{results.sessions_completed}/{sessions} sessions completed "
+          f"({results.sessions_failed} failed) at concurrency {concurrency} in {results.elapsed:.1f}s")
+    print(f"throughput: {results.sessions_completed / results.elapsed:.2f} sessions/s\n")
+    print(f"{'request':20} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, values in results.latencies.items():
+        p = percentiles(values)
+        print(f"{kind:20} {len(values):>7} {results.errors.get(kind, 0):>7} "
+              f"{p['p50'] * 1000:>9.0f} {p['p95'] * 1000:>9.0f} {p['p99'] * 1000:>9.0f}")
+
+# ---- Offline setup (--spawn) ---------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def spawn(args) -> List[subprocess.Popen]:
+    """Start the mock upstream and the agent; returns the processes and sets args.target"""
+    mock_port, agent_port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency", str(args.mock_latency), "--jitter", str(args.mock_jitter),
+         "--error-rate", str(args.mock_error_rate)],
+        cwd=AGENT_DIR,
+    )
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        OPENAI_API_KEY="mock",
+        # Keep the mock's canned classifications out of the real type cache
+        QUESTION_TYPES_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "questions.types.json"),
+    )
+    agent = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(agent_port), "--log-level", "warning"],
+        cwd=AGENT_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    wait_until_up(f"http://127.0.0.1:{mock_port}/v1/models")
+    wait_until_up(f"http://127.0.0.1:{agent_port}/stats")
+    args.target = f"http://127.0.0.1:{agent_port}"
+    return [agent, mock]
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="agent base URL")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-summary", action="store_true", help="fetch the summary from the SSE endpoint")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--spawn", action="store_true", help="start the mock upstream and the agent locally")
+    parser.add_argument("--mock-latency", type=float, default=0.6)
+    parser.add_argument("--mock-jitter", type=float, default=0.2)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    try:
+        if args.spawn:
+            processes = spawn(args)
+        results = asyncio.run(run_load(args.target, args.sessions, args.concurrency, args.stream_summary, args.timeout))
+        print_report(results, args.sessions, args.concurrency)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+if __name__ == "__main__":
+    main_cli()
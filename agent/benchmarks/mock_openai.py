@@ -0,0 +1,97 @@
+"""Local mock of the OpenAI chat-completions API for offline load tests.
+
+Speaks ``POST /v1/chat/completions`` (plain and ``stream=true``) and
+``GET /v1/models`` with configurable latency, jitter and error rate, replying
+with the same canned payloads as the in-process stub.
+
+Run from the agent directory:
+    python -m benchmarks.mock_openai --port 9100 --latency 0.6 --jitter 0.2 --error-rate 0.01
+and point the agent at it:
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=mock uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks import stub_upstream
+
+class MockSettings:
+    latency = 0.6
+    jitter = 0.2
+    error_rate = 0.0
+    error_status = 500
+
+settings = MockSettings()
+stats = {"requests": 0, "errors": 0, "streams": 0}
+
+app = FastAPI(title="Mock OpenAI upstream")
+
+def simulated_latency() -> float:
+    return max(0.0, random.gauss(settings.latency, settings.jitter))
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"}]}
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body: Dict[str, Any] = await request.json()
+    stats["requests"] += 1
+
+    if random.random() < settings.error_rate:
+        stats["errors"] += 1
+        await asyncio.sleep(simulated_latency() / 4)
+        return JSONResponse(
+            {"error": {"message": "Mock upstream error", "type": "server_error", "code": None}},
+            status_code=settings.error_status,
+        )
+
+    if body.get("stream"):
+        stats["streams"] += 1
+        return StreamingResponse(stream_chunks(body), media_type="text/event-stream")
+
+    await asyncio.sleep(simulated_latency())
+    return JSONResponse(stub_upstream.make_completion(body).model_dump())
+
+async def stream_chunks(body: Dict[str, Any]):
+    total = simulated_latency()
+    chunks = list(stub_upstream.make_chunks(body))
+    await asyncio.sleep(total / 5)  # time to first token
+    for chunk in chunks:
+        yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+        await asyncio.sleep(total / len(chunks))
+    yield "data: [DONE]\n\n"
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=settings.latency, help="mean completion latency in seconds")
+    parser.add_argument("--jitter", type=float, default=settings.jitter, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=settings.error_status, help="HTTP status of failed requests")
+    parser.add_argument("--canned-question", help="JSON file replacing the canned question payload")
+    args = parser.parse_args()
+
+    settings.latency = args.latency
+    settings.jitter = args.jitter
+    settings.error_rate = args.error_rate
+    settings.error_status = args.error_status
+    if args.canned_question:
+        with open(args.canned_question, 'r', encoding='utf-8') as f:
+            stub_upstream.CANNED_QUESTION = json.load(f)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main_cli()
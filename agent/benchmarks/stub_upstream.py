@@ -0,0 +1,166 @@
+"""In-process stand-ins for the OpenAI clients, used by the offline benchmarks.
+
+They answer ``chat.completions.create`` after a fixed simulated latency with
+canned payloads shaped like the real API responses, so the orchestrator code
+paths run unchanged without network access.
+"""
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Dict
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+CANNED_TYPES = {
+    "1": "free_text", "2": "free_text", "3": "multiple_choice", "4": "yes_no",
+    "5": "yes_no", "6": "yes_no", "7": "free_text", "8": "multi_select",
+}
+
+CANNED_QUESTION = {
+    "question": "Canned question text",
+    "input_type": "free_text",
+    "help": "Take your time.",
+    "placeholder": "Share your thoughts...",
+    "options": [
+        {"value": "fear", "label": "Fear"},
+        {"value": "shame", "label": "Shame"},
+        {"value": "anger", "label": "Anger"},
+    ],
+}
+
+CANNED_SUMMARY = "You named a critical inner voice and chose to observe it with curiosity. " * 4
+
+def canned_content(request: Dict[str, Any]) -> str:
+    """Pick a plausible reply for the kind of call being made."""
+    if request.get("response_format", {}).get("type") == "json_object":
+        return json.dumps(CANNED_TYPES)
+    system_prompt = request["messages"][0]["content"]
+    if "summarizer" in system_prompt:
+        return CANNED_SUMMARY
+    # Echo the requested question text and type, like a well-behaved model
+    question = dict(CANNED_QUESTION)
+    user_prompt = "\n".join(m["content"] for m in request["messages"] if m["role"] == "user")
+    requested_type = re.search(r"Question type must be: (\w+)", user_prompt)
+    requested_text = re.search(r'Question text: "(.*)"', user_prompt)
+    if requested_type:
+        question["input_type"] = requested_type.group(1)
+    if requested_text:
+        question["question"] = requested_text.group(1)
+    if question["input_type"] not in ("multiple_choice", "multi_select"):
+        question["options"] = None
+    return json.dumps(question)
+
+def usage_for(request: Dict[str, Any], content: str) -> Dict[str, int]:
+    prompt_chars = sum(len(m["content"]) for m in request["messages"])
+    return {
+        "prompt_tokens": prompt_chars // 4,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": (prompt_chars + len(content)) // 4,
+    }
+
+def make_completion(request: Dict[str, Any]) -> ChatCompletion:
+    content = canned_content(request)
+    return ChatCompletion(
+        id="chatcmpl-stub",
+        object="chat.completion",
+        created=int(time.time()),
+        model=request.get("model", "gpt-4o-mini"),
+        choices=[{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+        usage=usage_for(request, content),
+    )
+
+def make_chunks(request: Dict[str, Any]):
+    """The canned reply split into streaming chunks, one per word"""
+    content = canned_content(request)
+    words = content.split(" ")
+    for index, word in enumerate(words):
+        text = word if index == len(words) - 1 else word + " "
+        yield ChatCompletionChunk(
+            id="chatcmpl-stub",
+            object="chat.completion.chunk",
+            created=int(time.time()),
+            model=request.get("model", "gpt-4o-mini"),
+            choices=[{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+        )
+    if (request.get("stream_options") or {}).get("include_usage"):
+        yield ChatCompletionChunk(
+            id="chatcmpl-stub",
+            object="chat.completion.chunk",
+            created=int(time.time()),
+            model=request.get("model", "gpt-4o-mini"),
+            choices=[],
+            usage=usage_for(request, content),
+        )
+
+class _SyncCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def create(self, **request):
+        self.calls += 1
+        time.sleep(self.latency)
+        return make_completion(request)
+
+class _AsyncCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def create(self, **request):
+        self.calls += 1
+        if request.get("stream"):
+            return _Stream(self._stream(request))
+        await asyncio.sleep(self.latency)
+        return make_completion(request)
+
+    async def _stream(self, request: Dict[str, Any]):
+        # Time to first token is a fraction of the full completion latency
+        await asyncio.sleep(self.latency / 5)
+        chunks = list(make_chunks(request))
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(self.latency / len(chunks))
+
+class _Stream:
+    """Iterable like ``AsyncStream``, including its ``close()``"""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks
+
+    async def close(self) -> None:
+        self.closed = True
+        await self._chunks.aclose()
+
+async def _aclose() -> None:
+    pass
+
+def stub_client(latency: float = 0.5):
+    """Object with the ``chat.completions.create``, ``with_options`` and ``close`` surface of ``OpenAI``"""
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_SyncCompletions(latency)), close=lambda: None)
+    client.with_options = lambda **options: client  # per-call timeouts don't apply to the stub
+    return client
+
+def async_stub_client(latency: float = 0.5):
+    """Object with the ``chat.completions.create``, ``with_options`` and ``close`` surface of ``AsyncOpenAI``"""
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_AsyncCompletions(latency)), close=_aclose)
+    client.with_options = lambda **options: client
+    return client
+
+def install(main_module, latency: float = 0.5) -> None:
+    """Point both of main's OpenAI clients at the stubs"""
+    main_module.openai_client = stub_client(latency)
+    main_module.async_openai_client = async_stub_client(latency)
+    # Keep canned classifications out of the real questions.types.json
+    main_module.type_cache.path = os.path.join(tempfile.mkdtemp(), "questions.types.json")
@@ -0,0 +1,158 @@
+import json
+import os
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+# ---- Pre-compiled question bundle --------------------------------------------
+
+BUNDLE_FORMAT = 1
+
+def bundle_path_for(questions_path: str) -> str:
+    """questions.md -> questions.bundle.json in the same directory"""
+    return os.path.splitext(questions_path)[0] + '.bundle.json'
+
+def default_personalize(sequence: int, question_type: str) -> bool:
+    """Whether a question should still go to the LLM with the user's previous answers.
+
+    The first question has no previous answers, and yes/no and single-choice
+    questions barely change with context, so those are served from the bundle.
+    """
+    return sequence > 1 and question_type in ("free_text", "multi_select")
+
+def write_bundle(path: str, source_hash: str, model: str, questions: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Write a bundle atomically and return its payload"""
+    payload = {
+        "format": BUNDLE_FORMAT,
+        "version": source_hash[:12],
+        "source_hash": source_hash,
+        "model": model,
+        "questions": {str(sequence): entry for sequence, entry in sorted(questions.items())},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return payload
+
+class QuestionBundle:
+    """Read side of the bundle; reloads the JSON file when its mtime changes.
+
+    A bundle is only used while its ``source_hash`` matches the currently
+    compiled questions.md, so editing a question silently routes it back to the
+    LLM until the bundle is recompiled.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._data: Optional[Dict[str, Any]] = None
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.served = 0
+        self.stale = 0
+
+    def _current(self) -> Optional[Dict[str, Any]]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._data, self._mtime = None, None
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    self._data = data if data.get("format") == BUNDLE_FORMAT else None
+                    if self._data:
+                        print(f"Loaded question bundle {self._data.get('version')} ({len(self._data.get('questions', {}))} questions)")
+                except Exception as e:
+                    print(f"Could not load question bundle {self.path}: {e}")
+                    self._data = None
+                self._mtime = mtime
+        return self._data
+
+    def entry(self, source_hash: str, sequence: int) -> Optional[Dict[str, Any]]:
+        """Bundle entry for a question, or None if missing or built from another questions.md"""
+        if not self.enabled:
+            return None
+        data = self._current()
+        if not data:
+            return None
+        if data.get("source_hash") != source_hash:
+            self.stale += 1
+            return None
+        return data["questions"].get(str(sequence))
+
+    def pick_variant(self, source_hash: str, sequence: int, has_answers: bool) -> Optional[Dict[str, Any]]:
+        """A random pre-generated variant when this step needs no personalization"""
+        entry = self.entry(source_hash, sequence)
+        if not entry or not entry.get("variants"):
+            return None
+        if has_answers and entry.get("personalize", True):
+            return None
+        self.served += 1
+        return random.choice(entry["variants"])
+
+    @property
+    def version(self) -> Optional[str]:
+        data = self._current() if self.enabled else None
+        return data.get("version") if data else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "version": self.version,
+            "served": self.served,
+            "stale_lookups": self.stale,
+        }
+
+class BundleSet:
+    """One QuestionBundle per flow, read from the bundle file next to that flow's source.
+
+    A flow without a bundle file simply has no bundle; only a bundle built from
+    another version of its own flow counts as a stale lookup.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._bundles: Dict[str, QuestionBundle] = {}
+        self._lock = threading.Lock()
+
+    def for_flow(self, name: str, source_path: str) -> QuestionBundle:
+        path = bundle_path_for(source_path)
+        bundle = self._bundles.get(name)
+        if bundle is None or bundle.path != path:
+            with self._lock:
+                bundle = self._bundles.get(name)
+                if bundle is None or bundle.path != path:
+                    bundle = self._bundles[name] = QuestionBundle(path, enabled=self.enabled)
+        return bundle
+
+    def stats(self) -> Dict[str, Any]:
+        bundles = dict(self._bundles)
+        return {
+            "enabled": self.enabled,
+            "served": sum(b.served for b in bundles.values()),
+            "stale_lookups": sum(b.stale for b in bundles.values()),
+            "flows": {name: bundle.stats() for name, bundle in sorted(bundles.items()) if bundle.version is not None},
+        }
+
+def variant_from_question(question) -> Dict[str, Any]:
+    """Bundle variant fields from a generated Question"""
+    return {
+        "label": question.label,
+        "help": question.help,
+        "placeholder": question.input.placeholder,
+        "options": question.input.options,
+    }
+
+def unique_variants(variants: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    seen = set()
+    unique = []
+    for variant in variants:
+        key = json.dumps(variant, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            unique.append(variant)
+    return unique
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, Set
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# ---- WebSocket session channel -----------------------------------------------
+
+class SessionChannel:
+    """One client's WebSocket: JSON messages both ways, one ``type`` field each.
+
+    Sends are serialized, so steps, summary tokens and heartbeats pushed from
+    different tasks never interleave. ``messages()`` yields what the client
+    sends and answers its ``ping`` itself. While the client is quiet the server
+    pings every ``heartbeat`` seconds; after ``idle_timeout`` seconds without
+    any message (a ``pong`` counts) the connection is closed.
+    """
+
+    def __init__(self, hub: "ChannelHub", websocket: WebSocket, heartbeat: float, idle_timeout: float):
+        self.hub = hub
+        self.websocket = websocket
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self._send_lock = asyncio.Lock()
+        self.in_order = asyncio.Lock()  # held while handling a message whose replies must not overtake the previous one's
+        self._tasks: Set["asyncio.Task"] = set()
+        self.closed = False
+
+    async def send(self, type: str, **data: Any) -> None:
+        if self.closed:
+            return
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(json.dumps({"type": type, **data}))
+            except (WebSocketDisconnect, RuntimeError):
+                self.closed = True
+                return
+        self.hub.sent += 1
+
+    async def messages(self) -> AsyncIterator[Dict[str, Any]]:
+        last_seen = time.monotonic()
+        while not self.closed:
+            try:
+                text = await asyncio.wait_for(self.websocket.receive_text(), self.heartbeat)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_seen >= self.idle_timeout:
+                    self.hub.idle_closes += 1
+                    await self.close(1001, "idle")
+                    return
+                self.hub.heartbeats += 1
+                await self.send("ping", ts=time.time())
+                continue
+            except WebSocketDisconnect:
+                self.closed = True
+                return
+            last_seen = time.monotonic()
+            self.hub.received += 1
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                await self.send("error", status=400, detail=f"invalid message: {e}")
+                continue
+            if message.get("type") == "ping":
+                await self.send("pong", ts=time.time())
+            elif message.get("type") != "pong":
+                yield message
+
+    def spawn(self, work: Awaitable[Any]) -> None:
+        """Handle a message in the background so heartbeats and other messages keep flowing"""
+        task = asyncio.ensure_future(work)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        if not self.closed:
+            self.closed = True
+            try:
+                await self.websocket.close(code, reason)
+            except RuntimeError:
+                pass  # the client already went away
+
+    async def drain(self) -> None:
+        """Stop work started for a client that disconnected"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+class ChannelHub:
+    """Counters over every session channel, for ``GET /stats``"""
+
+    def __init__(self, heartbeat: float = 20.0, idle_timeout: float = 60.0):
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self.open = 0
+        self.opened = 0
+        self.sent = 0
+        self.received = 0
+        self.heartbeats = 0
+        self.idle_closes = 0
+
+    async def accept(self, websocket: WebSocket) -> SessionChannel:
+        await websocket.accept()
+        self.open += 1
+        self.opened += 1
+        return SessionChannel(self, websocket, self.heartbeat, self.idle_timeout)
+
+    def closed(self) -> None:
+        self.open -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": self.open,
+            "opened": self.opened,
+            "messages_sent": self.sent,
+            "messages_received": self.received,
+            "heartbeats": self.heartbeats,
+            "idle_closes": self.idle_closes,
+            "heartbeat_seconds": self.heartbeat,
+        }
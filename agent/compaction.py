@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from prompts import count_tokens, format_answers
+
+# ---- Previous-answer context compaction --------------------------------------
+
+STRUCTURED_KINDS = ("yes_no", "multiple_choice", "multi_select")
+
+CondenseFn = Callable[[str], Awaitable[str]]
+
+def answer_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def compact_value(answer: Dict[str, Any]) -> str:
+    """Short rendering of a structured answer: yes/no, the option key, or a comma list"""
+    value = answer.get("value")
+    if answer.get("kind") == "yes_no" and isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value) or "none"
+    return "No answer" if value is None else str(value)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at a word boundary so it fits in about max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:  # longest word prefix that still fits
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) < max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " …"
+
+class ContextCompactor:
+    """Keeps the "Previous answers" block of question prompts small.
+
+    - Structured answers are rendered compactly (``Q4: yes``, ``Q8: a, b``).
+    - Free-text answers longer than ``long_answer_tokens`` are condensed once,
+      in the background, by ``condense``; digests are cached by answer hash.
+      Until a digest is ready, an older long answer is cut to that length.
+    - The most recent answer stays verbatim, because the next question builds on it.
+    - When the block is over ``token_budget``, the oldest answers are dropped.
+
+    Context sizes before and after compaction are recorded per step.
+    """
+
+    def __init__(self, condense: Optional[CondenseFn] = None, token_budget: int = 400,
+                 long_answer_tokens: int = 80, max_digests: int = 5000, enabled: bool = True):
+        self.condense = condense
+        self.token_budget = token_budget
+        self.long_answer_tokens = long_answer_tokens
+        self.max_digests = max_digests
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._digests: "OrderedDict[str, str]" = OrderedDict()  # answer hash -> digest
+        self._pending: Dict[str, "asyncio.Task"] = {}
+        self.condensed = 0
+        self.condense_failures = 0
+        self.digest_hits = 0
+        self.truncated = 0
+        self.dropped = 0
+        self._steps: Dict[int, List[int]] = {}  # sequence -> [steps, tokens before, tokens after]
+
+    # -- background condensation --
+
+    def _is_long(self, answer: Dict[str, Any]) -> bool:
+        value = answer.get("value")
+        return (answer.get("kind") not in STRUCTURED_KINDS and isinstance(value, str)
+                and count_tokens(value) > self.long_answer_tokens)
+
+    def schedule(self, answer: Dict[str, Any]) -> None:
+        """Start condensing a long free-text answer, off the response path"""
+        if not self.enabled or self.condense is None or not self._is_long(answer):
+            return
+        key = answer_hash(answer["value"])
+        if key in self._digests or key in self._pending:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._condense(key, answer["value"]))
+        except RuntimeError:
+            return  # no event loop (blocking code path); the answer gets truncated instead
+        self._pending[key] = task
+
+    async def _condense(self, key: str, text: str) -> None:
+        try:
+            digest = await self.condense(text)
+            if not digest:
+                raise ValueError("empty digest")
+        except Exception as e:
+            print(f"Answer condensation failed: {e}")
+            self.condense_failures += 1
+            return
+        finally:
+            self._pending.pop(key, None)
+        with self._lock:
+            self._digests[key] = digest
+            while len(self._digests) > self.max_digests:
+                self._digests.popitem(last=False)
+        self.condensed += 1
+
+    async def drain(self) -> None:
+        """Wait for the condensations currently in flight"""
+        if self._pending:
+            await asyncio.wait(list(self._pending.values()))
+
+    def digest(self, text: str) -> Optional[str]:
+        key = answer_hash(text)
+        with self._lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+        return digest
+
+    # -- compaction --
+
+    def _render(self, answer: Dict[str, Any], latest: bool) -> str:
+        if answer.get("kind") in STRUCTURED_KINDS:
+            return compact_value(answer)
+        text = compact_value(answer)
+        if latest or not self._is_long(answer):
+            return text
+        digest = self.digest(text)
+        if digest is not None:
+            self.digest_hits += 1
+            return digest
+        self.truncated += 1
+        return truncate_to_tokens(text, self.long_answer_tokens)
+
+    def compact(self, answers: Dict[str, Any], sequence: int) -> str:
+        before = format_answers(answers)
+        if not self.enabled:
+            self._record(sequence, count_tokens(before), count_tokens(before))
+            return before
+
+        values = list(answers.values())
+        lines = [f"Q{n}: {self._render(answer, n == len(values))}" for n, answer in enumerate(values, start=1)]
+        sizes = [count_tokens(line) + 1 for line in lines]
+        dropped = 0
+        while dropped < len(lines) - 1 and sum(sizes[dropped:]) > self.token_budget:
+            dropped += 1
+        kept = lines[dropped:]
+        if sizes[-1] > self.token_budget:
+            kept[-1] = truncate_to_tokens(kept[-1], self.token_budget)
+        if dropped:
+            self.dropped += dropped
+            kept.insert(0, f"({dropped} earlier answers omitted)")
+        context = "\n".join(kept)
+        self._record(sequence, count_tokens(before), count_tokens(context))
+        return context
+
+    def _record(self, sequence: int, before: int, after: int) -> None:
+        with self._lock:
+            step = self._steps.setdefault(sequence, [0, 0, 0])
+            step[0] += 1
+            step[1] += before
+            step[2] += after
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {sequence: list(step) for sequence, step in sorted(self._steps.items())}
+            digests = len(self._digests)
+        return {
+            "enabled": self.enabled,
+            "token_budget": self.token_budget,
+            "digests": digests,
+            "pending": len(self._pending),
+            "condensed": self.condensed,
+            "condense_failures": self.condense_failures,
+            "digest_hits": self.digest_hits,
+            "truncated": self.truncated,
+            "dropped_answers": self.dropped,
+            # Average previous-answer context tokens per question step
+            "context_tokens": {
+                sequence: {"before": round(before / count, 1), "after": round(after / count, 1)}
+                for sequence, (count, before, after) in steps.items()
+            },
+        }
@@ -0,0 +1,82 @@
+"""Pre-generate every question's label, options, placeholder and help into a bundle file per flow.
+
+Each flow's bundle is written next to its source (questions.md ->
+questions.bundle.json, flows/checkin.md -> flows/checkin.bundle.json). Steps
+that need no personalization (see bundle.default_personalize) are then served
+from the bundle instead of a chat completion. Re-run this whenever a flow
+changes; a bundle built from another version of the file is ignored.
+
+Usage (from the agent directory):
+    python compile_bundle.py --variants 3
+    python compile_bundle.py --flow checkin        # only this flow (repeatable)
+    python compile_bundle.py --personalize 2,7    # only these go to the LLM with context
+"""
+import argparse
+from typing import Any, Dict, List, Optional, Set
+
+import main
+from bundle import bundle_path_for, default_personalize, unique_variants, variant_from_question, write_bundle
+
+def generate_variant(questionnaire, sequence: int, prompt: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """One variant, validated like a live step; None if every attempt was invalid"""
+    messages = list(prompt["messages"])
+    for _ in range(main.STRUCTURED_OUTPUT_MAX_ATTEMPTS):
+        kwargs = main.question_completion_kwargs(messages)
+        kwargs["temperature"] = 0.9  # Higher than at runtime to get some diversity between variants
+        response = main.create_completion("bundle", sequence, prompt["target_type"], **kwargs)
+        step = main.handle_question_reply("bundle", sequence, questionnaire.total, prompt, messages, response)
+        if step is not None:
+            return variant_from_question(step.question)
+    print(f"Q{sequence}: no valid reply after {main.STRUCTURED_OUTPUT_MAX_ATTEMPTS} attempts, variant skipped")
+    return None
+
+def generate_variants(questionnaire, sequence: int, count: int) -> List[Dict[str, Any]]:
+    prompt = main.build_question_prompt(questionnaire, {}, sequence, generic=True)
+    variants = [generate_variant(questionnaire, sequence, prompt) for _ in range(count)]
+    return unique_variants([v for v in variants if v is not None])
+
+def compile_bundle(questionnaire, variant_count: int, personalize: Optional[Set[int]] = None) -> Dict[str, Any]:
+    main.pinned_flow.set(questionnaire)
+    questions = {}
+    for sequence, question in sorted(questionnaire.questions.items()):
+        print(f"Q{sequence} ({question['type']}): generating {variant_count} variants...")
+        questions[sequence] = {
+            "text": question['text'],
+            "type": question['type'],
+            "personalize": sequence in personalize if personalize is not None
+                           else default_personalize(sequence, question['type']),
+            "variants": generate_variants(questionnaire, sequence, variant_count),
+        }
+    return write_bundle(
+        bundle_path_for(questionnaire.source_path),
+        questionnaire.content_hash,
+        main.QUESTION_MODEL,
+        questions,
+    )
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variants", type=int, default=3, help="variants generated per question")
+    parser.add_argument("--personalize", type=str, default=None,
+                        help="comma-separated question numbers that must stay personalized (default: free_text and multi_select after Q1)")
+    parser.add_argument("--flow", action="append", help="flow to compile (repeatable; default: every flow)")
+    args = parser.parse_args()
+
+    personalize = None
+    if args.personalize is not None:
+        personalize = {int(n) for n in args.personalize.split(',') if n.strip()}
+
+    main.flow_registry.ensure_loaded()
+    unknown = set(args.flow or []) - set(main.flow_registry.names())
+    if unknown:
+        parser.error(f"unknown flow(s): {', '.join(sorted(unknown))}")
+    for name in args.flow or main.flow_registry.names():
+        questionnaire = main.flow_registry.get(name)
+        print(f"Flow {name} ({questionnaire.content_hash[:12]}):")
+        payload = compile_bundle(questionnaire, args.variants, personalize)
+        served = [s for s, q in payload["questions"].items() if s == "1" or not q["personalize"]]
+        print(f"Wrote bundle {payload['version']} to {bundle_path_for(questionnaire.source_path)}")
+        print(f"Served from the bundle without personalization: Q{', Q'.join(served)}")
+
+if __name__ == "__main__":
+    main_cli()
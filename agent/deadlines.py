@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+# ---- Deadline budgets and hedged requests ------------------------------------
+
+class DeadlineExceeded(Exception):
+    """The step's latency budget ran out before a usable reply arrived"""
+    reason = "deadline"
+
+class Deadline:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+class LatencyTracker:
+    """Recent successful call latencies, for percentile-based hedge delays"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class DeadlinePolicy:
+    """Per-purpose latency budgets with hedged requests.
+
+    ``run()`` starts a call and, if it hasn't finished after the recent
+    ``hedge_percentile`` latency of that purpose, starts a second identical
+    call; the first successful reply wins and the other is cancelled. Once
+    the step's deadline passes both are cancelled and ``DeadlineExceeded``
+    is raised so the caller can serve its fallback. Hedging only kicks in
+    after ``min_samples`` latencies have been observed, and never when less
+    than the hedge delay would remain of the budget.
+    """
+
+    def __init__(self, budgets: Dict[str, float], hedge_enabled: bool = True, hedge_percentile: float = 0.95,
+                 min_samples: int = 20, min_hedge_delay: float = 0.25,
+                 listener: Optional[Callable[[str, str], None]] = None):
+        self.budgets = budgets
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.listener = listener
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def deadline(self, purpose: str) -> Optional[Deadline]:
+        """A fresh deadline for one step, or None when the purpose has no budget"""
+        budget = self.budgets.get(purpose, 0)
+        return Deadline(budget) if budget > 0 else None
+
+    def tracker(self, purpose: str) -> LatencyTracker:
+        tracker = self.latencies.get(purpose)
+        if tracker is None:
+            tracker = self.latencies.setdefault(purpose, LatencyTracker())
+        return tracker
+
+    def record_latency(self, purpose: str, seconds: float) -> None:
+        self.tracker(purpose).record(seconds)
+
+    def count(self, purpose: str, event: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(purpose, {"calls": 0, "hedged": 0, "hedge_won": 0, "timeout": 0})
+            counts[event] += 1
+        if self.listener is not None and event != "calls":
+            self.listener(purpose, event)
+
+    def hedge_delay(self, purpose: str) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        tracker = self.tracker(purpose)
+        if len(tracker) < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, tracker.percentile(self.hedge_percentile))
+
+    async def run(self, purpose: str, call: Callable[[], Awaitable[Any]], deadline: Deadline) -> Any:
+        """Await ``call()`` (hedged once if slow) within the deadline"""
+        self.count(purpose, "calls")
+        if deadline.expired:
+            self.count(purpose, "timeout")
+            raise DeadlineExceeded(f"{purpose} budget of {deadline.budget:g}s already spent")
+
+        first = asyncio.ensure_future(call())
+        tasks = [first]
+        delay = self.hedge_delay(purpose)
+        errors = []
+        try:
+            while tasks:
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    break
+                can_hedge = delay is not None and len(tasks) == 1 and not errors and remaining > delay
+                done, _ = await asyncio.wait(
+                    tasks, timeout=delay if can_hedge else remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if can_hedge:
+                        self.count(purpose, "hedged")
+                        tasks.append(asyncio.ensure_future(call()))
+                        delay = None
+                    continue
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is not first:
+                            self.count(purpose, "hedge_won")
+                        return task.result()
+                    errors.append(task.exception())
+            if errors and not tasks:
+                raise errors[0]
+            self.count(purpose, "timeout")
+            raise DeadlineExceeded(f"{purpose} exceeded its {deadline.budget:g}s budget")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {purpose: dict(c) for purpose, c in self._counts.items()}
+        result = {"hedge_enabled": self.hedge_enabled, "budgets": dict(self.budgets)}
+        for purpose, c in counts.items():
+            result[purpose] = {
+                **c,
+                "hedge_rate": round(c["hedged"] / c["calls"], 4) if c["calls"] else None,
+                "timeout_rate": round(c["timeout"] / c["calls"], 4) if c["calls"] else None,
+                "hedge_delay": self.hedge_delay(purpose),
+            }
+        return result
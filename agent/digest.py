@@ -0,0 +1,146 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from prefetch import answer_key
+
+# ---- Rolling session digest for incremental summaries ------------------------
+
+# (session_id, previous digest, answers not yet in it) -> new digest
+UpdateFn = Callable[[str, str, Dict[str, Any]], Awaitable[str]]
+
+@dataclass
+class DigestEntry:
+    text: str = ""
+    covered: Dict[str, str] = field(default_factory=dict)  # question id -> answer_key folded into text
+    task: Optional["asyncio.Task"] = None
+    touched_at: float = field(default_factory=time.monotonic)
+
+    def matches(self, answers: Dict[str, Any]) -> bool:
+        """True while every answer folded into the digest is still the session's answer"""
+        return all(
+            question_id in answers and answer_key(answers[question_id]) == key
+            for question_id, key in self.covered.items()
+        )
+
+class SummaryDigester:
+    """Keeps a compact running digest of each session, updated in the background.
+
+    After each answer ``schedule()`` folds the answers not yet covered into the
+    session's digest with one small completion; updates of a session run one
+    after another. At the end ``take()`` returns the digest plus the answers it
+    does not cover yet (normally just the last one), so the final summary
+    prompt stays small. An in-flight update is awaited for at most
+    ``wait_seconds``; after that the last finished digest is used. Digests are
+    per process: a session whose earlier answers were handled by another worker
+    simply gets the one-shot summary. A digest whose answers were replaced
+    starts over on its next update, and abandoned sessions are purged
+    ``ttl`` seconds after their last answer.
+    """
+
+    def __init__(self, update: UpdateFn, enabled: bool = True, wait_seconds: float = 1.0,
+                 ttl: float = 3600.0, max_sessions: int = 10000):
+        self.update = update
+        self.enabled = enabled
+        self.wait_seconds = wait_seconds
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._entries: Dict[str, DigestEntry] = {}
+        self.updates = 0
+        self.update_failures = 0
+        self.resets = 0
+        self.skipped = 0
+        self.full_hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.waited = 0
+        self._summary_prompt_tokens: Dict[str, Tuple[int, int]] = {}  # mode -> (summaries, prompt tokens)
+
+    def schedule(self, session_id: str, answers: Dict[str, Any]) -> None:
+        """Fold the session's new answers into its digest, off the response path"""
+        if not self.enabled:
+            return
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self._purge_expired()
+            if len(self._entries) >= self.max_sessions:
+                self.skipped += 1
+                return
+            entry = self._entries[session_id] = DigestEntry()
+        entry.touched_at = time.monotonic()
+        entry.task = asyncio.create_task(self._fold(session_id, entry, dict(answers), entry.task))
+
+    async def _fold(self, session_id: str, entry: DigestEntry, answers: Dict[str, Any],
+                    previous: Optional["asyncio.Task"]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])  # never raises; _fold handles its own errors
+        if not entry.matches(answers):
+            # An earlier answer was changed; start the digest over
+            self.resets += 1
+            entry.text, entry.covered = "", {}
+        new_answers = {qid: answer for qid, answer in answers.items() if qid not in entry.covered}
+        if not new_answers:
+            return
+        try:
+            text = await self.update(session_id, entry.text, new_answers)
+        except Exception as e:
+            print(f"Digest update failed: {e}")
+            self.update_failures += 1
+            return
+        entry.text = text
+        entry.covered.update({qid: answer_key(answer) for qid, answer in new_answers.items()})
+        self.updates += 1
+
+    def _usable(self, entry: Optional[DigestEntry], answers: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        if entry is None or not entry.text or not entry.matches(answers):
+            self.misses += 1
+            return None
+        remaining = {qid: answer for qid, answer in answers.items() if qid not in entry.covered}
+        if len(remaining) > 1:
+            self.partial_hits += 1
+        else:
+            self.full_hits += 1
+        return entry.text, remaining
+
+    async def take(self, session_id: str, answers: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(digest, answers it doesn't cover) for the final summary, or None to summarize in one shot"""
+        entry = self._entries.pop(session_id, None)
+        if entry is not None and entry.task is not None and not entry.task.done():
+            self.waited += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(entry.task), self.wait_seconds)
+            except Exception:
+                pass  # use whatever the previous updates produced
+        return self._usable(entry, answers)
+
+    def record_summary(self, mode: str, usage: Optional[Dict[str, int]]) -> None:
+        """Count the final summary's prompt tokens, to compare the two modes"""
+        count, tokens = self._summary_prompt_tokens.get(mode, (0, 0))
+        self._summary_prompt_tokens[mode] = (count + 1, tokens + (usage or {}).get("prompt_tokens", 0))
+
+    def _purge_expired(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        for session_id in [sid for sid, entry in self._entries.items() if entry.touched_at < cutoff]:
+            del self._entries[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        takes = self.full_hits + self.partial_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self._entries),
+            "updates": self.updates,
+            "update_failures": self.update_failures,
+            "resets": self.resets,
+            "skipped": self.skipped,
+            "full_hits": self.full_hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "waited": self.waited,
+            "hit_ratio": round((self.full_hits + self.partial_hits) / takes, 3) if takes else None,
+            "summary_prompt_tokens_avg": {
+                mode: round(tokens / count, 1) for mode, (count, tokens) in self._summary_prompt_tokens.items()
+            },
+        }
@@ -0,0 +1,307 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# ---- Append-only session event log -------------------------------------------
+
+SEGMENT_PATTERN = re.compile(r"^events-(\d{8})\.ndjson$")
+EVENT_TYPES = ("session_created", "answer_received", "step_served", "summary_generated")
+
+def segment_name(number: int) -> str:
+    return f"events-{number:08d}.ndjson"
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds or an ISO 8601 timestamp (naive means UTC) -> epoch seconds"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def event_time(line: bytes) -> Optional[float]:
+    """``ts`` of a logged line, None for a torn or otherwise undecodable one"""
+    try:
+        return json.loads(line).get("ts", 0)
+    except (ValueError, AttributeError):
+        return None
+
+class EventFilter:
+    def __init__(self, session_id: Optional[str] = None, types: Optional[Iterable[str]] = None,
+                 since: Optional[float] = None, until: Optional[float] = None, flow: Optional[str] = None):
+        self.session_id = session_id
+        self.types = set(types) if types else None
+        self.since = since
+        self.until = until
+        self.flow = flow
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        return (
+            (self.session_id is None or event.get("session_id") == self.session_id)
+            and (self.types is None or event.get("type") in self.types)
+            and (self.since is None or event.get("ts", 0) >= self.since)
+            and (self.until is None or event.get("ts", 0) < self.until)
+            and (self.flow is None or event.get("flow") == self.flow)
+        )
+
+class EventLog:
+    """Session events as NDJSON lines in numbered segment files under ``directory``.
+
+    ``append()`` only adds the event to an in-memory buffer. A writer thread
+    writes the buffer every ``flush_interval`` seconds (or once it holds
+    ``flush_events`` events) with one write and one fsync per batch, so request
+    handlers never wait for the disk. Events still buffered when the process
+    dies are lost; ``close()`` flushes them on shutdown.
+
+    The active segment is closed once it exceeds ``segment_bytes`` and a new
+    one is started. ``compact()`` merges closed segments into files of up to
+    ``segment_bytes`` and drops events older than ``retention`` seconds; it
+    runs after every ``compact_every`` rotations and never touches the newest
+    segment, so it is also safe from another process (``export_events.py``). ``read()`` streams matching events segment by segment, one line
+    at a time.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, flush_interval: float = 1.0,
+                 flush_events: int = 1000, fsync: bool = True, retention: Optional[float] = None,
+                 compact_every: int = 8, enabled: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.fsync = fsync
+        self.retention = retention
+        self.compact_every = compact_every
+        self.enabled = enabled
+        self._buffer: List[str] = []
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # active segment, rotation and compaction
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._segment = 0
+        self._size = 0
+        self._rotations_since_compaction = 0
+        self.appended = 0
+        self.written = 0
+        self.flushes = 0
+        self.rotations = 0
+        self.compactions = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    # -- writing --
+
+    def append(self, event_type: str, session_id: str, **fields: Any) -> None:
+        if not self.enabled:
+            return
+        event = {"ts": round(time.time(), 3), "type": event_type, "session_id": session_id, **fields}
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self._buffer_lock:
+            self._buffer.append(line)
+            self.appended += 1
+            full = len(self._buffer) >= self.flush_events
+        if full:
+            self._wake.set()
+
+    def _open_segment(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        if not segments:
+            self._segment = 1
+        else:
+            # Keep appending to the last segment of a previous run unless it is full
+            number, path = segments[-1]
+            self._segment = number + 1 if os.path.getsize(path) >= self.segment_bytes else number
+        self._file = open(os.path.join(self.directory, segment_name(self._segment)), "ab")
+        self._size = self._file.tell()
+
+    def flush(self) -> int:
+        """Write and fsync everything buffered; returns the number of events written"""
+        with self._buffer_lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return 0
+        data = "".join(lines).encode("utf-8")
+        compact = False
+        with self._write_lock:
+            try:
+                if self._file is None:
+                    self._open_segment()
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                print(f"Event log write failed, {len(lines)} events dropped: {e}")
+                self.write_errors += 1
+                self.dropped += len(lines)
+                return 0
+            self._size += len(data)
+            self.written += len(lines)
+            self.flushes += 1
+            if self._size >= self.segment_bytes:
+                self._rotate()
+                compact = self.compact_every > 0 and self._rotations_since_compaction >= self.compact_every
+        if compact:
+            self.compact()
+        return len(lines)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._segment += 1
+        self._file = open(os.path.join(self.directory, segment_name(self._segment)), "ab")
+        self._size = 0
+        self.rotations += 1
+        self._rotations_since_compaction += 1
+
+    # -- segments and compaction --
+
+    def _segments(self) -> List[tuple]:
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for entry in os.scandir(self.directory):
+            match = SEGMENT_PATTERN.match(entry.name)
+            if match:
+                found.append((int(match.group(1)), entry.path))
+        return sorted(found)
+
+    def compact(self) -> Dict[str, int]:
+        """Merge closed segments up to ``segment_bytes`` each, dropping events past retention.
+
+        With a retention every line is decoded, and torn lines from a crash are
+        dropped as well. A failed merge removes its partial ``.tmp`` file and
+        leaves the segments untouched.
+        """
+        cutoff = time.time() - self.retention if self.retention else None
+        removed = kept = expired = torn = 0
+        with self._write_lock:
+            # The newest segment may be the one a running agent appends to
+            closed = self._segments()[:-1]
+            groups: List[List[tuple]] = []
+            size = 0
+            for number, path in closed:
+                segment_size = os.path.getsize(path)
+                if not groups or size + segment_size > self.segment_bytes:
+                    groups.append([])
+                    size = 0
+                groups[-1].append((number, path))
+                size += segment_size
+            for group in groups:
+                if len(group) == 1 and cutoff is None:
+                    continue
+                target = group[0][1]
+                tmp = target + ".tmp"
+                try:
+                    with open(tmp, "wb") as out:
+                        for _, path in group:
+                            with open(path, "rb") as f:
+                                for line in f:
+                                    if cutoff is not None:
+                                        ts = event_time(line)
+                                        if ts is None:
+                                            torn += 1  # read() would skip it anyway
+                                            continue
+                                        if ts < cutoff:
+                                            expired += 1
+                                            continue
+                                    out.write(line)
+                                    kept += 1
+                        out.flush()
+                        os.fsync(out.fileno())
+                except BaseException:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise
+                empty = os.path.getsize(tmp) == 0
+                os.replace(tmp, target)
+                for _, path in group[1:]:
+                    os.remove(path)
+                    removed += 1
+                if empty:
+                    os.remove(target)
+                    removed += 1
+            self.compactions += 1
+            self._rotations_since_compaction = 0
+        return {"segments_removed": removed, "events_kept": kept, "events_expired": expired, "lines_dropped": torn}
+
+    # -- reading --
+
+    def read(self, event_filter: Optional[EventFilter] = None) -> Iterator[Dict[str, Any]]:
+        """Matching events in append order, streamed from disk (buffered events are flushed first)"""
+        self.flush()
+        with ExitStack() as stack:
+            # Open every segment up front: a concurrent compaction then can't pull one away mid-export
+            with self._write_lock:
+                files = [stack.enter_context(open(path, "rb")) for _, path in self._segments()]
+            for f in files:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # a torn last line from a crash
+                    if event_filter is None or event_filter.matches(event):
+                        yield event
+
+    def export(self, event_filter: Optional[EventFilter] = None) -> Iterator[str]:
+        for event in self.read(event_filter):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    # -- writer thread --
+
+    def start(self) -> None:
+        if self.enabled and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Event log flush failed: {e}")
+                self.write_errors += 1
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._write_lock:
+            segments = self._segments()
+            size = sum(os.path.getsize(path) for _, path in segments)
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "segments": len(segments),
+            "bytes": size,
+            "appended": self.appended,
+            "written": self.written,
+            "buffered": len(self._buffer),
+            "flushes": self.flushes,
+            "rotations": self.rotations,
+            "compactions": self.compactions,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
@@ -0,0 +1,52 @@
+"""Export logged session events as NDJSON, optionally compacting the log first.
+
+Reads the segment files of the event log (EVENT_LOG_DIR, default "events")
+one line at a time, so exports of any size run in constant memory. The agent
+can keep writing while this runs.
+
+Usage (from the agent directory):
+    python export_events.py --type step_served --since 2026-10-01 -o steps.ndjson
+    python export_events.py --session SESSION_ID
+    python export_events.py --compact --retention-days 90 -o /dev/null
+"""
+import argparse
+import os
+import sys
+
+from event_log import EVENT_TYPES, EventFilter, EventLog, parse_time
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=os.getenv("EVENT_LOG_DIR", "events"), help="event log directory")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--session", help="only this session id")
+    parser.add_argument("--type", action="append", choices=EVENT_TYPES, help="only these event types (repeatable)")
+    parser.add_argument("--flow", help="only sessions of this flow")
+    parser.add_argument("--since", help="epoch seconds or ISO 8601, inclusive")
+    parser.add_argument("--until", help="epoch seconds or ISO 8601, exclusive")
+    parser.add_argument("--compact", action="store_true", help="merge closed segments before exporting")
+    parser.add_argument("--retention-days", type=float, default=0, help="with --compact, drop events older than this")
+    args = parser.parse_args()
+
+    log = EventLog(args.dir, retention=args.retention_days * 86400 or None)
+    if args.compact:
+        result = log.compact()
+        print(f"Compacted {args.dir}: {result['segments_removed']} segments removed, "
+              f"{result['events_expired']} events expired", file=sys.stderr)
+    event_filter = EventFilter(
+        session_id=args.session, types=args.type, since=parse_time(args.since),
+        until=parse_time(args.until), flow=args.flow,
+    )
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    count = 0
+    try:
+        for line in log.export(event_filter):
+            out.write(line)
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{count} events exported", file=sys.stderr)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from questionnaire import CompiledQuestionnaire, Compiler, QuestionnaireCache
+
+# ---- Flow registry -----------------------------------------------------------
+
+DEFAULT_FLOW = "default"
+
+class UnknownFlow(LookupError):
+    pass
+
+class FlowRegistry:
+    """Every questionnaire ("flow") of the deployment, compiled ahead of requests.
+
+    The default flow is ``default_path`` (questions.md); every ``*.md`` file in
+    ``directory`` is another flow named after the file. ``refresh()`` compiles
+    new and changed files and then swaps the set of current flows in one
+    assignment. A watcher thread calls it every ``poll_interval`` seconds, so
+    request handlers only ever read an already compiled flow and never wait
+    for a reload. The last ``versions_kept`` versions of each flow stay
+    addressable by content hash: a session keeps the version it started on
+    even after its file changed or was removed.
+    """
+
+    def __init__(self, compiler: Compiler, default_path: str, directory: Optional[str] = None,
+                 poll_interval: float = 2.0, versions_kept: int = 10):
+        self.compiler = compiler
+        self.default_path = default_path
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.versions_kept = versions_kept
+        self._caches: Dict[str, QuestionnaireCache] = {}
+        self._current: Dict[str, CompiledQuestionnaire] = {}  # replaced wholesale, never mutated
+        self._versions: Dict[str, "OrderedDict[str, CompiledQuestionnaire]"] = {}
+        self._lock = threading.Lock()  # serializes refreshes; readers don't take it
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.unpinned = 0
+
+    def _discover(self) -> Dict[str, str]:
+        paths = {DEFAULT_FLOW: self.default_path}
+        if self.directory and os.path.isdir(self.directory):
+            for entry in sorted(os.scandir(self.directory), key=lambda e: e.name):
+                name, ext = os.path.splitext(entry.name)
+                if ext != ".md" or not entry.is_file():
+                    continue
+                if name == DEFAULT_FLOW:
+                    print(f"Ignoring {entry.path}: the default flow is {self.default_path}")
+                    continue
+                paths[name] = entry.path
+        return paths
+
+    def refresh(self) -> None:
+        """Compile new or changed flow files and swap them in atomically"""
+        with self._lock:
+            paths = self._discover()
+            current = dict(self._current)
+            for name, path in paths.items():
+                cache = self._caches.get(name)
+                if cache is None or cache.path != path:
+                    cache = self._caches[name] = QuestionnaireCache(path, self.compiler, name=name)
+                previous = current.get(name)
+                try:
+                    compiled = cache.get(count_hit=False)  # a stat unless the file changed
+                except Exception as e:
+                    print(f"Could not compile flow {name}: {e}")
+                    self.reload_errors += 1
+                    continue
+                if previous is not None and not compiled.questions:
+                    # Unreadable or emptied file: keep serving the last good version
+                    continue
+                if previous is None or previous.content_hash != compiled.content_hash:
+                    versions = self._versions.setdefault(name, OrderedDict())
+                    versions[compiled.content_hash] = compiled
+                    while len(versions) > self.versions_kept:
+                        versions.popitem(last=False)
+                    if previous is not None:
+                        self.reloads += 1
+                        print(f"Reloaded flow {name}: {previous.content_hash[:12]} -> {compiled.content_hash[:12]}")
+                current[name] = compiled
+            for name in set(current) - set(paths):
+                # Removed: no new sessions, pinned sessions keep their version
+                del current[name]
+                self._caches.pop(name, None)
+                print(f"Flow {name} removed")
+            self._current = current
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._current)
+
+    def ensure_loaded(self) -> None:
+        """Compile the flows if nothing was loaded yet (blocking; async callers run it in a thread)"""
+        if not self._current:
+            self.refresh()  # first use before start() finished, e.g. from a script or during warm-up
+
+    def get(self, name: Optional[str] = None, version: Optional[str] = None) -> CompiledQuestionnaire:
+        """The given version of a flow if it is still kept, else its current version"""
+        name = name or DEFAULT_FLOW
+        self.ensure_loaded()
+        if version is not None:
+            pinned = self._versions.get(name, {}).get(version)
+            if pinned is not None:
+                self._record_hit(name)
+                return pinned
+        current = self._current.get(name)
+        if current is None:
+            raise UnknownFlow(f"unknown flow {name!r}")
+        if version is not None:
+            self.unpinned += 1  # its version was evicted; move the session to the current one
+        self._record_hit(name)
+        return current
+
+    def _record_hit(self, name: str) -> None:
+        cache = self._caches.get(name)
+        if cache is not None:
+            cache.record_hit()
+
+    def names(self):
+        return sorted(self._current)
+
+    # -- watcher --
+
+    def start(self) -> None:
+        """Compile every flow, then keep watching the files in a daemon thread"""
+        self.refresh()
+        if self._thread is None and self.poll_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="flow-watcher", daemon=True)
+            self._thread.start()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Flow refresh failed: {e}")
+                self.reload_errors += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit, revalidation and rebuild counters of each flow's QuestionnaireCache"""
+        return {name: cache.stats() for name, cache in sorted(dict(self._caches).items())}
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._current
+        return {
+            "watching": self._thread is not None,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "unpinned_sessions": self.unpinned,
+            "flows": {
+                name: {
+                    "version": compiled.content_hash[:12],
+                    "total_questions": compiled.total,
+                    "source": os.path.basename(compiled.source_path),
+                    "versions_kept": len(self._versions.get(name, {})),
+                }
+                for name, compiled in sorted(current.items())
+            },
+        }
@@ -0,0 +1,306 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# ---- Upstream LLM gateway ----------------------------------------------------
+
+# Lower value = served first when the pool is saturated
+PRIORITIES = {"summary": 0, "first_question": 0, "question": 1, "prefetch": 2, "classify": 2, "digest": 2, "condense": 2, "batch": 3, "bundle": 3}
+
+class LLMUnavailable(Exception):
+    """The gateway refused a call; callers should serve their fallback right away"""
+    reason = "unavailable"
+
+class CircuitOpenError(LLMUnavailable):
+    reason = "circuit_open"
+
+class AdmissionTimeout(LLMUnavailable):
+    reason = "queue_timeout"
+
+class TokenBucket:
+    """Classic token bucket; ``rate <= 0`` means unlimited. Not thread-safe on its own."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until the next token is available"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class CircuitBreaker:
+    """Trips when the failure or slow-call rate over the last ``window`` calls crosses a threshold.
+
+    While open every call is refused for ``open_seconds``; then up to
+    ``half_open_calls`` probes are let through and the first outcome decides
+    between closing again and another open period. Not thread-safe on its own.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, window: int = 20, min_calls: int = 10, error_rate: float = 0.5,
+                 slow_call_seconds: float = 10.0, slow_rate: float = 0.5,
+                 open_seconds: float = 30.0, half_open_calls: int = 1):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.trips = 0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state, self.probes = self.HALF_OPEN, 0
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                # A probe that never reported back (e.g. timed out in the queue) must not wedge the breaker
+                if time.monotonic() - self.opened_at < 2 * self.open_seconds:
+                    return False
+                self.probes = 0
+            self.probes += 1
+        return True
+
+    def record(self, failed: bool, latency: Optional[float]) -> None:
+        slow = latency is not None and latency > self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            if failed or slow:
+                self._open()
+            else:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append((failed, slow))
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes.clear()
+        print(f"LLM circuit breaker opened for {self.open_seconds:g}s")
+
+class _Waiter:
+    __slots__ = ("priority", "notify", "granted", "cancelled")
+
+    def __init__(self, priority: int, notify: Callable[[], None]):
+        self.priority = priority
+        self.notify = notify
+        self.granted = False
+        self.cancelled = False
+
+class LLMGateway:
+    """Single admission point for every upstream completion call.
+
+    At most ``max_concurrency`` calls run at once and new calls start no faster
+    than the token bucket allows. When either limit is hit, callers queue by
+    priority (see ``PRIORITIES``) and give up after ``queue_timeout`` seconds.
+    A circuit breaker refuses calls outright while upstream is failing or slow,
+    so request handlers fall back immediately instead of waiting on it.
+
+    Both event-loop callers (``aslot``) and threads (``slot``) share the same
+    pool; state is guarded by a threading lock that is only held briefly.
+    """
+
+    def __init__(self, max_concurrency: int = 16, rate: float = 0.0, burst: float = 10.0,
+                 queue_timeout: float = 5.0, breaker: Optional[CircuitBreaker] = None,
+                 is_failure: Callable[[BaseException], bool] = lambda e: True):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.is_failure = is_failure
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[int, int, _Waiter]] = []  # heap of (priority, arrival, waiter)
+        self._arrivals = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {"circuit_open": 0, "queue_timeout": 0}
+        self.failures = 0
+
+    # -- admission --
+
+    def _try_admit(self, priority: int) -> bool:
+        """Fast path: take a slot now if nobody with the same or higher priority is waiting"""
+        if not self.breaker.allow():
+            self.rejected["circuit_open"] += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+        if self._waiters and self._waiters[0][0] <= priority:
+            return False
+        if self.in_flight < self.max_concurrency and self.bucket.take():
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        return False
+
+    def _enqueue(self, priority: int, notify: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(priority, notify)
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), waiter))
+        self.queued += 1
+        return waiter
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the best waiters; called with the lock held"""
+        while self._waiters and self.in_flight < self.max_concurrency:
+            waiter = self._waiters[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if not self.bucket.take():
+                self._schedule_dispatch(self.bucket.wait_time())
+                return
+            heapq.heappop(self._waiters)
+            waiter.granted = True
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.notify()
+
+    def _schedule_dispatch(self, delay: float) -> None:
+        if self._timer is not None:
+            return
+        def run():
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+        self._timer = threading.Timer(delay, run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Give up waiting; returns True if the slot was granted in the meantime"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.rejected["queue_timeout"] += 1
+            return False
+
+    def acquire(self, priority: str) -> None:
+        """Blocking admission for worker threads"""
+        rank = PRIORITIES.get(priority, 1)
+        with self._lock:
+            if self._try_admit(rank):
+                return
+            event = threading.Event()
+            waiter = self._enqueue(rank, event.set)
+            self._dispatch()
+        if not event.wait(self.queue_timeout) and not self._abandon(waiter):
+            raise AdmissionTimeout(f"no LLM slot within {self.queue_timeout:.1f}s")
+
+    async def acquire_async(self, priority: str) -> None:
+        """Admission for event-loop callers; never blocks the loop"""
+        rank = PRIORITIES.get(priority, 1)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            if self._try_admit(rank):
+                return
+            waiter = self._enqueue(rank, notify)
+            self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise AdmissionTimeout(f"no LLM slot within {self.queue_timeout:.1f}s")
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release(failed=False, latency=None)
+            raise
+
+    def release(self, failed: bool, latency: Optional[float]) -> None:
+        """Return the slot and feed the outcome to the circuit breaker"""
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.failures += 1
+            self.breaker.record(failed, latency)
+            self._dispatch()
+
+    # -- context managers --
+
+    def _outcome(self, error: Optional[BaseException]) -> bool:
+        return error is not None and not isinstance(error, asyncio.CancelledError) and self.is_failure(error)
+
+    @contextmanager
+    def slot(self, priority: str):
+        self.acquire(priority)
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(self._outcome(error), time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aslot(self, priority: str):
+        await self.acquire_async(priority)
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(self._outcome(error), time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting = sum(1 for _, _, waiter in self._waiters if not waiter.cancelled)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": self.bucket.rate or None,
+            "in_flight": self.in_flight,
+            "waiting": waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "failures": self.failures,
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+        }
@@ -10,23 +10,64 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-from typing import List, Optional, Literal, Dict, Any
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from typing import List, Optional, Literal, Dict, Any, AsyncIterator, Tuple
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from uuid import uuid4
 import os
 import json
+import time
+import asyncio
+from contextvars import ContextVar
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+from questionnaire import CompiledQuestionnaire
+from type_cache import QuestionTypeCache
+from prefetch import StepPrefetcher
+from bundle import BundleSet
+from sessions import SessionStore, create_session_store, new_session_state
+from session_tokens import InvalidSessionToken, create_token_codec
+from batch import BatchRunner
+from digest import SummaryDigester
+from compaction import ContextCompactor
+from flows import DEFAULT_FLOW, FlowRegistry, UnknownFlow
+from step_cache import StepCache, parse_skip_list
+from singleflight import SingleFlight, submission_key
+from routing import LLM, TEMPLATE, QuestionRouter, parse_routes
+from channel import ChannelHub, SessionChannel
+from event_log import EventLog
+from prompts import QuestionPromptBuilder, build_question_system_prompt
+from structured_output import OutputStats, json_schema_response_format, question_payload_model
+from metrics import CONTENT_TYPE, MetricsRegistry, RequestMetricsMiddleware, current_endpoint
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable
+from deadlines import Deadline, DeadlineExceeded, DeadlinePolicy
+from upstream import UpstreamPool, Warmup, open_connections
 
 # Load environment variables
 load_dotenv()
 
 app = FastAPI(title="AI Question Orchestrator (Prototype)")
 
-# Initialize OpenAI client
+# Initialize OpenAI clients (sync for scripts/classification, async for the request path)
+# OPENAI_BASE_URL points them at another endpoint, e.g. benchmarks/mock_openai.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+upstream_pool = UpstreamPool(
+    max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100")),
+    max_keepalive=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_SECONDS", "30")),
+    http2=os.getenv("UPSTREAM_HTTP2", "1") == "1",
+)
 openai_client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY", "your-openai-api-key-here")
+    api_key=os.getenv("OPENAI_API_KEY", "your-openai-api-key-here"),
+    base_url=OPENAI_BASE_URL,
+    http_client=upstream_pool.sync_client()
+)
+async_openai_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY", "your-openai-api-key-here"),
+    base_url=OPENAI_BASE_URL,
+    http_client=upstream_pool.async_client()
 )
 
 # ---- Models -----------------------------------------------------------------
@@ -64,27 +105,236 @@ class Answer(BaseModel):
     session_id: str
     question_id: str
     answer: Dict[str, Any]
+    session_token: Optional[str] = None  # required when SESSION_MODE=stateless
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    flow: Optional[str] = None
+    answers: List[Dict[str, Any]]  # scripted answers, in question order
+    summary: bool = True
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    concurrency: Optional[int] = None
+
+# Shape of a generated question reply, derived from Question/Input (see structured_output.py)
+QuestionPayload = question_payload_model(Question, Input)
+
+# ---- Session store -----------------------------------------------------------
+
+# session_id -> {"answers":{}, "sequence": int}; backend picked by SESSION_STORE (memory | sqlite)
+session_store: SessionStore = create_session_store()
+
+# SESSION_MODE=stateless: no server-side state, it travels in a signed token returned with every step
+STATELESS_SESSIONS = os.getenv("SESSION_MODE", "store") == "stateless"
+token_codec = create_token_codec() if STATELESS_SESSIONS else None
 
-# ---- In-memory store (for prototype) ----------------------------------------
+def load_session(session_id: str, session_token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Session state from the store, or from the verified token in stateless mode"""
+    if not STATELESS_SESSIONS:
+        return session_store.get(session_id)
+    if not session_token:
+        return None
+    try:
+        token_session_id, state = token_codec.decode(session_token)
+    except InvalidSessionToken as e:
+        raise HTTPException(401, f"Invalid session token: {e}")
+    return state if token_session_id == session_id else None
+
+def save_session(session_id: str, state: Dict[str, Any]) -> None:
+    if not STATELESS_SESSIONS:
+        session_store.save(session_id, state)
+
+def attach_session_token(session_id: str, state: Dict[str, Any], step: "Step") -> "Step":
+    """In stateless mode, put the (extended) session token in the step's context"""
+    if STATELESS_SESSIONS:
+        step.context["session_token"] = token_codec.encode(session_id, state)
+    return step
+
+# ---- Metrics -----------------------------------------------------------------
+
+metrics_registry = MetricsRegistry()
+request_seconds = metrics_registry.histogram(
+    "agent_request_seconds", "HTTP request latency.", ["endpoint", "method", "status"]
+)
+stage_seconds = metrics_registry.histogram(
+    "agent_stage_seconds", "Latency of one processing stage of a request.",
+    ["stage", "endpoint", "sequence", "question_type"]
+)
+llm_calls = metrics_registry.counter(
+    "agent_llm_calls", "Chat-completion calls by purpose and outcome.", ["purpose", "outcome"]
+)
+llm_tokens = metrics_registry.counter(
+    "agent_llm_tokens", "Tokens reported by chat completions.", ["purpose", "kind"]
+)
+fallback_count = metrics_registry.counter(
+    "agent_fallbacks", "Template output served because the AI call failed.", ["kind"]
+)
+active_sessions = metrics_registry.gauge(
+    "agent_active_sessions", "Sessions held by the session store.",
+    function=lambda: session_store.stats()["sessions"]
+)
+app.add_middleware(RequestMetricsMiddleware, histogram=request_seconds)
 
-SESSIONS: Dict[str, Dict[str, Any]] = {}  # session_id -> {"answers":{}, "sequence": int}
+# ---- LLM gateway -------------------------------------------------------------
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Errors that say something about upstream health (not our own bad requests)"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409, 429)
+    return True
+
+# Every completion goes through this: bounded pool, rate limit, priorities, circuit breaker
+llm_gateway = LLMGateway(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+    rate=float(os.getenv("LLM_RATE_PER_SECOND", "0")),
+    burst=float(os.getenv("LLM_BURST", "10")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "5")),
+    breaker=CircuitBreaker(
+        window=int(os.getenv("BREAKER_WINDOW", "20")),
+        min_calls=int(os.getenv("BREAKER_MIN_CALLS", "10")),
+        error_rate=float(os.getenv("BREAKER_ERROR_RATE", "0.5")),
+        slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "10")),
+        slow_rate=float(os.getenv("BREAKER_SLOW_RATE", "0.5")),
+        open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+    ),
+    is_failure=is_upstream_failure,
+)
+metrics_registry.gauge(
+    "agent_llm_in_flight", "Completion calls currently running upstream.",
+    function=lambda: llm_gateway.in_flight
+)
+metrics_registry.gauge(
+    "agent_llm_waiting", "Completion calls queued for a gateway slot.",
+    function=lambda: llm_gateway.stats()["waiting"]
+)
+metrics_registry.gauge(
+    "agent_llm_circuit_open", "1 while the LLM circuit breaker refuses calls.",
+    function=lambda: int(llm_gateway.breaker.state != CircuitBreaker.CLOSED)
+)
+
+def llm_priority(purpose: str, sequence: Optional[int] = None) -> str:
+    """Gateway priority: summaries and first questions first, prefetch and classification next, batch runs and bundle compiles last"""
+    if current_endpoint.get() == "batch":
+        return "batch"
+    if purpose == "question":
+        if current_endpoint.get() == "prefetch":
+            return "prefetch"
+        if sequence == 1:
+            return "first_question"
+    return purpose
+
+# ---- Deadline budgets --------------------------------------------------------
+
+deadline_events = metrics_registry.counter(
+    "agent_deadline_events", "Hedged requests sent, hedges that won and budgets exceeded.", ["purpose", "event"]
+)
+
+# Per-step latency budgets; slow calls are hedged once after the recent p95 latency
+deadline_policy = DeadlinePolicy(
+    budgets={
+        "question": float(os.getenv("QUESTION_BUDGET_SECONDS", "8")),
+        "summary": float(os.getenv("SUMMARY_BUDGET_SECONDS", "20")),
+    },
+    hedge_enabled=os.getenv("HEDGE_ENABLED", "1") == "1",
+    hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "0.95")),
+    min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+    listener=lambda purpose, event: deadline_events.inc(purpose=purpose, event=event),
+)
+
+def degraded_reason_for(error: BaseException) -> str:
+    if isinstance(error, (LLMUnavailable, DeadlineExceeded)):
+        return error.reason
+    return "error"
+
+# Stage recorded around each kind of completion call
+LLM_STAGES = {"classify": "classify", "question": "completion", "summary": "summary", "digest": "digest", "condense": "condense", "bundle": "bundle"}
+
+def stage(name: str, sequence: Optional[int] = None, question_type: Optional[str] = None):
+    """Timing span for one stage, labeled with the endpoint being served"""
+    return stage_seconds.time(
+        stage=name, endpoint=current_endpoint.get(), sequence=sequence or "", question_type=question_type or ""
+    )
+
+def record_llm_call(purpose: str, outcome: str, usage: Optional[Dict[str, int]] = None) -> None:
+    llm_calls.inc(purpose=purpose, outcome=outcome)
+    for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        if (usage or {}).get(kind):
+            llm_tokens.inc(usage[kind], purpose=purpose, kind=kind.replace("_tokens", ""))
+
+def create_completion(purpose: str, sequence: Optional[int] = None, question_type: Optional[str] = None,
+                      deadline: Optional[Deadline] = None, **kwargs):
+    """openai_client.chat.completions.create() through the gateway, with a timing span and call/token counters.
+
+    With a deadline the call times out once the step budget is spent (no
+    hedging on this blocking path).
+    """
+    client = openai_client
+    if deadline is not None:
+        deadline_policy.count(purpose, "calls")
+        if deadline.expired:
+            deadline_policy.count(purpose, "timeout")
+            raise DeadlineExceeded(f"{purpose} budget of {deadline.budget:g}s already spent")
+        client = openai_client.with_options(timeout=deadline.remaining(), max_retries=0)
+    try:
+        with llm_gateway.slot(llm_priority(purpose, sequence)):
+            with stage(LLM_STAGES[purpose], sequence, question_type):
+                started = time.monotonic()
+                response = client.chat.completions.create(**kwargs)
+                deadline_policy.record_latency(purpose, time.monotonic() - started)
+    except openai.APITimeoutError:
+        record_llm_call(purpose, "error")
+        if deadline is None:
+            raise
+        deadline_policy.count(purpose, "timeout")
+        raise DeadlineExceeded(f"{purpose} exceeded its {deadline.budget:g}s budget")
+    except LLMUnavailable as e:
+        record_llm_call(purpose, e.reason)
+        raise
+    except Exception:
+        record_llm_call(purpose, "error")
+        raise
+    record_llm_call(purpose, "ok", usage_dict(response))
+    return response
+
+async def completion_attempt_async(purpose: str, sequence: Optional[int], question_type: Optional[str], **kwargs):
+    """One async completion call through the gateway, with a timing span and call/token counters"""
+    try:
+        async with llm_gateway.aslot(llm_priority(purpose, sequence)):
+            with stage(LLM_STAGES[purpose], sequence, question_type):
+                started = time.monotonic()
+                response = await async_openai_client.chat.completions.create(**kwargs)
+                deadline_policy.record_latency(purpose, time.monotonic() - started)
+    except LLMUnavailable as e:
+        record_llm_call(purpose, e.reason)
+        raise
+    except Exception:
+        record_llm_call(purpose, "error")
+        raise
+    record_llm_call(purpose, "ok", usage_dict(response))
+    return response
+
+async def create_completion_async(purpose: str, sequence: Optional[int] = None, question_type: Optional[str] = None,
+                                  deadline: Optional[Deadline] = None, **kwargs):
+    """Async variant of create_completion; with a deadline, slow calls are hedged (see deadlines.py)"""
+    if deadline is None:
+        return await completion_attempt_async(purpose, sequence, question_type, **kwargs)
+    return await deadline_policy.run(
+        purpose, lambda: completion_attempt_async(purpose, sequence, question_type, **kwargs), deadline
+    )
 
 # ---- AI Question Generation --------------------------------------------------
 
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), '..', 'questions.md')
+
 # Load specific questions configuration
 def load_questions_config():
     """Load the specific questions from questions.md file"""
-    try:
-        config_path = os.path.join(os.path.dirname(__file__), '..', 'questions.md')
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        print(f"Could not load questions.md: {e}")
-        return ""
+    return get_questionnaire().content
 
 def parse_questions_from_config(config_content: str) -> Dict[int, Dict[str, str]]:
     """Parse questions from the markdown content and return structured data"""
-    questions = {}
+    question_texts = {}
     lines = config_content.split('\n')
     current_question = None
     current_text = ""
@@ -95,11 +345,7 @@ def parse_questions_from_config(config_content: str) -> Dict[int, Dict[str, str]
         if line.startswith('## ') and any(char.isdigit() for char in line):
             # Save previous question if exists
             if current_question is not None:
-                question_text = current_text.strip()
-                questions[current_question] = {
-                    'text': question_text,
-                    'type': determine_question_type_with_ai(question_text, current_question)
-                }
+                question_texts[current_question] = current_text.strip()
             
             # Extract question number
             try:
@@ -119,18 +365,51 @@ def parse_questions_from_config(config_content: str) -> Dict[int, Dict[str, str]
     
     # Don't forget the last question
     if current_question is not None:
-        question_text = current_text.strip()
-        questions[current_question] = {
-            'text': question_text,
-            'type': determine_question_type_with_ai(question_text, current_question)
-        }
+        question_texts[current_question] = current_text.strip()
     
-    return questions
+    # Classify all questions at once (cached per question text)
+    question_types = classify_question_types(question_texts)
+    return {
+        sequence: {'text': text, 'type': question_types[sequence]}
+        for sequence, text in question_texts.items()
+    }
+
+VALID_QUESTION_TYPES = ["free_text", "yes_no", "multiple_choice", "multi_select"]
+CLASSIFIER_MODEL = "gpt-4o-mini"
+
+# Question types keyed by a hash of the question text, persisted next to questions.md
+type_cache = QuestionTypeCache(
+    os.getenv("QUESTION_TYPES_CACHE_PATH") or os.path.join(os.path.dirname(QUESTIONS_PATH), 'questions.types.json'),
+    model=CLASSIFIER_MODEL,
+)
 
-def determine_question_type_with_ai(question_text: str, sequence: int) -> str:
-    """Use AI to determine the most appropriate question type with high confidence"""
+def classify_question_types(question_texts: Dict[int, str]) -> Dict[int, str]:
+    """Resolve the input type of every question, using the sidecar cache and one batched AI call for the rest"""
+    question_types = {}
+    missing = {}
+    for sequence, text in question_texts.items():
+        cached_type = type_cache.get(text)
+        if cached_type:
+            question_types[sequence] = cached_type
+        else:
+            missing[sequence] = text
+    
+    if missing:
+        ai_types = determine_question_types_with_ai(missing)
+        type_cache.update({missing[sequence]: t for sequence, t in ai_types.items()})
+        for sequence, text in missing.items():
+            question_types[sequence] = ai_types.get(sequence) or determine_question_type_from_content(text)
+    
+    return question_types
+
+def determine_question_types_with_ai(question_texts: Dict[int, str]) -> Dict[int, str]:
+    """Use AI to classify a batch of questions in a single call.
+
+    Returns only the questions the model classified with a valid type; callers fall
+    back to content analysis for anything missing.
+    """
     
-    system_prompt = """You are an expert in questionnaire design. Your task is to analyze a question and determine the BEST input type for it.
+    system_prompt = """You are an expert in questionnaire design. Your task is to analyze questions and determine the BEST input type for each of them.
 
 Available input types:
 - free_text: Open-ended questions requiring written responses (stories, descriptions, explanations)
@@ -144,11 +423,12 @@ Rules for classification:
 3. multiple_choice: For questions asking to choose ONE from categories (emotions, preferences, methods)
 4. multi_select: For questions asking for multiple selections (skills, activities, multiple actions)
 
-Return ONLY the type name (free_text, yes_no, multiple_choice, or multi_select). Be 90%+ certain of your choice."""
+Return ONLY a JSON object mapping each question number to its type name (free_text, yes_no, multiple_choice, or multi_select). Be 90%+ certain of every choice."""
 
-    user_prompt = f"""Analyze this question and determine the best input type:
+    numbered_questions = "\n".join(f'{sequence}. "{text}"' for sequence, text in sorted(question_texts.items()))
+    user_prompt = f"""Analyze these questions and determine the best input type for each:
 
-Question: "{question_text}"
+{numbered_questions}
 
 Consider:
 - Is this asking for an open description/explanation? → free_text
@@ -156,70 +436,86 @@ Consider:
 - Is this asking to select ONE option from categories? → multiple_choice
 - Is this asking to select MULTIPLE items? → multi_select
 
-Return only the input type."""
+Return JSON like {{"1": "free_text", "2": "yes_no"}}."""
 
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = create_completion(
+            "classify",
+            model=CLASSIFIER_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            max_tokens=50,
-            temperature=0.1  # Low temperature for consistency
+            max_tokens=20 * len(question_texts) + 20,
+            temperature=0.1,  # Low temperature for consistency
+            response_format={"type": "json_object"}
         )
         
-        ai_type = response.choices[0].message.content.strip().lower()
-        
-        # Validate the response
-        valid_types = ["free_text", "yes_no", "multiple_choice", "multi_select"]
-        if ai_type in valid_types:
-            print(f"AI determined type for Q{sequence}: '{question_text[:50]}...' → {ai_type}")
-            return ai_type
-        else:
-            print(f"AI returned invalid type '{ai_type}', falling back to content analysis")
-            return determine_question_type_from_content(question_text)
-            
+        ai_types = json.loads(response.choices[0].message.content)
     except Exception as e:
         print(f"Error in AI type determination: {e}")
-        return determine_question_type_from_content(question_text)
-    """Determine question type based on content analysis"""
-    question_lower = question_text.lower().strip()
-    
-    # Yes/No questions - be more specific
-    if (question_lower.startswith('does this voice') or 
-        question_lower.startswith('are you willing') or 
-        question_lower.startswith('can you accept') or
-        'yes / no' in question_lower or 
-        'yes/no' in question_lower):
-        return "yes_no"
-    
-    # Multiple choice indicators (emotion, feelings)
-    if any(indicator in question_lower for indicator in ['what emotion', 'which emotion']):
-        return "multiple_choice"
-    
-    # Multi-select indicators (multiple actions, steps)
-    if any(indicator in question_lower for indicator in ['choose minimal', 'select multiple', 'specific steps', 'multiple actions']):
-        return "multi_select"
+        return {}
     
-    # Default to free text
-    return "free_text"
+    # Validate the response
+    question_types = {}
+    for sequence, text in question_texts.items():
+        ai_type = str(ai_types.get(str(sequence), "")).strip().lower()
+        if ai_type in VALID_QUESTION_TYPES:
+            print(f"AI determined type for Q{sequence}: '{text[:50]}...' → {ai_type}")
+            question_types[sequence] = ai_type
+        else:
+            print(f"AI returned invalid type '{ai_type}' for Q{sequence}, falling back to content analysis")
+    return question_types
+
+def compile_questionnaire(config_content: str):
+    """Parse questions.md and pre-render the prompt fragments that only depend on the file"""
+    # Includes the classify stage when question types are not cached yet
+    with stage("parse"):
+        questions = parse_questions_from_config(config_content)
+        fragments = {
+            "question_system": build_question_system_prompt(config_content),
+        }
+    return questions, fragments
+
+# questions.md is the "default" flow; every *.md in FLOWS_DIR is another flow named after its file
+FLOWS_DIR = os.getenv("FLOWS_DIR") or os.path.join(os.path.dirname(__file__), '..', 'flows')
+flow_registry = FlowRegistry(
+    compile_questionnaire,
+    default_path=QUESTIONS_PATH,
+    directory=FLOWS_DIR,
+    poll_interval=float(os.getenv("FLOW_POLL_SECONDS", "2")),
+    versions_kept=int(os.getenv("FLOW_VERSIONS_KEPT", "10")),
+)
+
+# The flow version the session being served is pinned to; inherited by the tasks a request starts
+pinned_flow: ContextVar[Optional[CompiledQuestionnaire]] = ContextVar("pinned_flow", default=None)
+
+def get_questionnaire() -> CompiledQuestionnaire:
+    """Return the compiled flow of the current session (the default flow outside a session)"""
+    return pinned_flow.get() or flow_registry.get()
+
+async def flows_loaded() -> None:
+    """Wait for the first compile off the event loop when a request arrives before the warm-up finished"""
+    if not flow_registry.loaded:
+        await asyncio.to_thread(flow_registry.ensure_loaded)
+
+def pin_flow(state: Dict[str, Any]) -> CompiledQuestionnaire:
+    """Serve this session from the flow version it started on (recorded in its state)"""
+    try:
+        questionnaire = flow_registry.get(state.get("flow"), state.get("flow_version"))
+    except UnknownFlow as e:
+        raise HTTPException(404, str(e))
+    state["flow"], state["flow_version"] = questionnaire.name, questionnaire.content_hash
+    pinned_flow.set(questionnaire)
+    return questionnaire
 
 def get_total_questions() -> int:
     """Get the total number of questions from the current questions.md file"""
-    config_content = load_questions_config()
-    questions = parse_questions_from_config(config_content)
-    return len(questions)
+    return get_questionnaire().total
 
 def determine_question_type(sequence: int, answers: Dict[str, Any]) -> str:
     """Determine the appropriate question type based on the specific question sequence from questions.md"""
-    config_content = load_questions_config()
-    questions = parse_questions_from_config(config_content)
-    
-    if sequence in questions:
-        return questions[sequence]['type']
-    
-    return "free_text"  # fallback
+    return get_questionnaire().type(sequence) or "free_text"  # fallback
 
 def determine_question_type_from_content(question_text: str) -> str:
     """Determine question type based on content analysis (fallback method)"""
@@ -250,191 +546,415 @@ def determine_question_type_from_content(question_text: str) -> str:
     # Default to free text for open-ended questions
     return "free_text"
 
-def generate_ai_question(session_id: str, answers: Dict[str, Any], sequence: int) -> Step:
-    """Generate a question using OpenAI based on previous answers and configuration."""
-    
-    # Load fresh questions config and parse it
-    questions_config = load_questions_config()
-    parsed_questions = parse_questions_from_config(questions_config)
-    total_questions = len(parsed_questions)
+QUESTION_MODEL = "gpt-4o-mini"
+SUMMARY_MODEL = "gpt-4o-mini"
+
+CONDENSE_SYSTEM_PROMPT = """You are a careful summarizer. Condense one answer from a therapeutic self-reflection interview
+                    to at most 40 words. Keep their own words for feelings, people, situations and commitments.
+                    Reply with the condensed answer only, written in the first person like the original."""
+
+async def condense_answer(text: str) -> str:
+    # Runs in its own task, so this only labels the condensation's own stage spans
+    current_endpoint.set("condense")
+    response = await create_completion_async(
+        "condense",
+        model=QUESTION_MODEL,
+        messages=[
+            {"role": "system", "content": CONDENSE_SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        max_tokens=90,
+        temperature=0.2
+    )
+    return (response.choices[0].message.content or "").strip()
+
+# Previous answers in question prompts: long answers condensed once, oldest dropped past the budget
+context_compactor = ContextCompactor(
+    condense=condense_answer,
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "400")),
+    long_answer_tokens=int(os.getenv("CONTEXT_LONG_ANSWER_TOKENS", "80")),
+    enabled=os.getenv("CONTEXT_COMPACTION", "1") == "1",
+)
+prompt_builder = QuestionPromptBuilder(context_compactor)
+
+def build_question_prompt(questionnaire: CompiledQuestionnaire, answers: Dict[str, Any], sequence: int, generic: bool = False) -> Optional[Dict[str, Any]]:
+    """Build the chat messages for question #sequence, or None when the summary is due.
+
+    ``generic`` asks for a version that works for every user (used when
+    pre-compiling the question bundle).
+    """
+    parsed_questions = questionnaire.questions
+    total_questions = questionnaire.total
     
     # Check if we've answered all questions - generate summary
     if sequence > total_questions:
-        return generate_summary_step(session_id, answers)
+        return None
     
     # Get the specific question for this sequence
     current_question_data = parsed_questions.get(sequence)
     if not current_question_data:
-        return generate_summary_step(session_id, answers)
+        return None
     
     target_question_type = current_question_data['type']
     question_text = current_question_data['text']
     
-    # Create context from previous answers
-    context_parts = []
-    for q_id, answer_data in answers.items():
-        answer_value = answer_data.get('value', 'No answer')
-        answer_type = answer_data.get('kind', 'unknown')
-        context_parts.append(f"Q{len(context_parts)+1} ({answer_type}): {answer_value}")
-    
-    context_text = "\n".join(context_parts) if context_parts else "This is the first question."
-    
-    # Create comprehensive system prompt with your specific questions
-    system_prompt = f"""You are conducting a therapeutic self-reflection interview using these specific questions:
-
-{questions_config}
-
-You must ask question #{sequence} of {total_questions} which is: "{question_text}"
-
-CRITICAL REQUIREMENTS:
-1. The question type MUST be: {target_question_type}
-2. Return ONLY a JSON object (no markdown, no explanations)
-3. Use the EXACT question text: "{question_text}"
-4. For multiple_choice: provide realistic emotion options for emotion questions, or relevant options for other questions
-5. For multi_select: provide multiple actionable options that can be selected together
-6. For yes_no: no options needed
-7. For free_text: provide encouraging placeholder text
-
-JSON Format:
-{{
-  "question": "{question_text}",
-  "input_type": "{target_question_type}",
-  "help": "Optional helpful guidance text",
-  "placeholder": "Optional placeholder for free_text",
-  "options": [
-    {{"value": "key1", "label": "Option 1"}},
-    {{"value": "key2", "label": "Option 2"}}
-  ]
-}}
-
-Use therapeutic, supportive language in help text."""
-
-    if sequence == 1:
-        user_prompt = f"""Generate question #{sequence} of {total_questions} from the questions.md file.
-        Question text: "{question_text}"
-        Question type must be: {target_question_type}
-        Include a supportive placeholder to encourage open sharing."""
+    # Static prefix first, per-step fields last (see prompts.py)
+    messages = prompt_builder.build(
+        questionnaire.prompt_fragments["question_system"], answers, sequence, total_questions,
+        question_text, target_question_type, generic=generic
+    )
     
-    else:
-        user_prompt = f"""Based on the previous answers:
-{context_text}
+    return {
+        "messages": messages,
+        "target_type": target_question_type,
+        "question_text": question_text,
+        "estimated_tokens": prompt_builder.estimate(messages),
+    }
 
-Generate question #{sequence} of {total_questions} from the questions.md file. 
-Question text: "{question_text}"
-Question type must be: {target_question_type}
+def usage_dict(response) -> Dict[str, int]:
+    """Token usage of a completion as a plain dict (empty if the response has none)"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+    }
 
-Build on their previous answers to create continuity in this therapeutic conversation."""
+# Structured output: the model must reply with JSON matching QuestionPayload
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+STRUCTURED_OUTPUT_MAX_ATTEMPTS = max(1, int(os.getenv("STRUCTURED_OUTPUT_MAX_ATTEMPTS", "2")))
+QUESTION_RESPONSE_FORMAT = json_schema_response_format("question", QuestionPayload)
+output_stats = OutputStats(STRUCTURED_OUTPUT, STRUCTURED_OUTPUT_MAX_ATTEMPTS)
+
+DEFAULT_OPTIONS = [
+    {"value": "opt1", "label": "Option 1"},
+    {"value": "opt2", "label": "Option 2"},
+    {"value": "opt3", "label": "Option 3"}
+]
+
+def question_step_from_data(session_id: str, sequence: int, total_questions: int, target_question_type: str, actual_question_type: str, question_data: Dict[str, Any], usage: Optional[Dict[str, int]] = None) -> Step:
+    """Create the question Step from parsed reply fields."""
+    # Create input object based on type
+    if target_question_type in ("multiple_choice", "multi_select"):
+        options = question_data.get("options")
+        if not options:
+            output_stats.count("default_options")
+            options = DEFAULT_OPTIONS
+        input_obj = Input(kind=target_question_type, options=options)
+    elif target_question_type == "yes_no":
+        input_obj = Input(kind="yes_no")
+    else:  # free_text
+        input_obj = Input(
+            kind="free_text",
+            placeholder=question_data.get("placeholder") or "Share your thoughts..."
+        )
+    
+    # Create question
+    question = Question(
+        id=f"q_ai_{sequence}",
+        label=question_data["question"],
+        input=input_obj,
+        required=True,
+        help=question_data.get("help")
+    )
     
+    # Dynamic button label based on total questions
+    button_label = "Continue" if sequence < total_questions else "Finish"
+    
+    return Step(
+        id=f"step_{sequence}",
+        type="question",
+        question=question,
+        ui={"next_button_label": button_label},
+        context={
+            "session_id": session_id, 
+            "sequence": sequence, 
+            "ai_generated": True,
+            "target_type": target_question_type,
+            "actual_type": actual_question_type,
+            "total_questions": total_questions,
+            "usage": usage or {}
+        }
+    )
+
+def build_question_step(session_id: str, sequence: int, total_questions: int, target_question_type: str, ai_response: str, usage: Optional[Dict[str, int]] = None) -> Step:
+    """Turn free-form completion text into a question Step, repairing what it can."""
+    ai_response = ai_response.strip()
+    
+    # Remove markdown code blocks if present
+    if ai_response.startswith("```json"):
+        ai_response = ai_response.replace("```json", "").replace("```", "").strip()
+    elif ai_response.startswith("```"):
+        ai_response = ai_response.replace("```", "").strip()
+    
+    # Try to parse as JSON
     try:
-        # Call OpenAI API
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=400,
-            temperature=0.7
-        )
-        
-        # Parse AI response
-        ai_response = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if ai_response.startswith("```json"):
-            ai_response = ai_response.replace("```json", "").replace("```", "").strip()
-        elif ai_response.startswith("```"):
-            ai_response = ai_response.replace("```", "").strip()
-        
-        # Try to parse as JSON
-        try:
-            question_data = json.loads(ai_response)
-        except json.JSONDecodeError:
-            print(f"Failed to parse AI response as JSON: {ai_response}")
-            # Fallback if AI doesn't return valid JSON
-            question_data = {
-                "question": ai_response.replace('"', '').replace('\n', ' ')[:200],
-                "input_type": target_question_type,
-                "placeholder": "Type your answer here" if target_question_type == "free_text" else None
-            }
-        
-        # Validate and fix the question type
-        actual_question_type = question_data.get("input_type", target_question_type)
-        if actual_question_type != target_question_type:
-            question_data["input_type"] = target_question_type
-            
-        # Create input object based on type
-        if target_question_type == "multiple_choice":
-            options = question_data.get("options", [
-                {"value": "opt1", "label": "Option 1"},
-                {"value": "opt2", "label": "Option 2"},
-                {"value": "opt3", "label": "Option 3"}
-            ])
-            input_obj = Input(kind="multiple_choice", options=options)
-        elif target_question_type == "multi_select":
-            options = question_data.get("options", [
-                {"value": "opt1", "label": "Option 1"},
-                {"value": "opt2", "label": "Option 2"},
-                {"value": "opt3", "label": "Option 3"}
-            ])
-            input_obj = Input(kind="multi_select", options=options)
-        elif target_question_type == "yes_no":
-            input_obj = Input(kind="yes_no")
-        else:  # free_text
-            input_obj = Input(
-                kind="free_text",
-                placeholder=question_data.get("placeholder", "Share your thoughts...")
-            )
-        
-        # Create question
-        question = Question(
-            id=f"q_ai_{sequence}",
-            label=question_data["question"],
-            input=input_obj,
-            required=True,
-            help=question_data.get("help")
-        )
-        
-        # Dynamic button label based on total questions
-        total_questions = get_total_questions()
-        button_label = "Continue" if sequence < total_questions else "Finish"
-        
-        return Step(
-            id=f"step_{sequence}",
-            type="question",
-            question=question,
-            ui={"next_button_label": button_label},
-            context={
-                "session_id": session_id, 
-                "sequence": sequence, 
-                "ai_generated": True,
-                "target_type": target_question_type,
-                "actual_type": actual_question_type,
-                "total_questions": total_questions
-            }
-        )
+        question_data = json.loads(ai_response)
+    except json.JSONDecodeError:
+        print(f"Failed to parse AI response as JSON: {ai_response}")
+        output_stats.count("parse_failures")
+        # Fallback if AI doesn't return valid JSON
+        question_data = {
+            "question": ai_response.replace('"', '').replace('\n', ' ')[:200],
+            "input_type": target_question_type,
+            "placeholder": "Type your answer here" if target_question_type == "free_text" else None
+        }
     
-    except Exception as e:
-        print(f"Error generating AI question: {e}")
-        # Fallback to a simple question
-        return fallback_question(session_id, sequence, target_question_type)
+    # Validate and fix the question type
+    actual_question_type = question_data.get("input_type", target_question_type)
+    if actual_question_type != target_question_type:
+        question_data["input_type"] = target_question_type
+    
+    return question_step_from_data(
+        session_id, sequence, total_questions, target_question_type, actual_question_type, question_data, usage
+    )
 
-def fallback_question(session_id: str, sequence: int, target_type: str = "free_text") -> Step:
-    """Fallback question when AI generation fails - uses your specific questions."""
+def parse_structured_question(ai_response: Optional[str], target_question_type: str) -> Dict[str, Any]:
+    """Validate a structured-output reply; raises ValueError if it can't be used as-is."""
+    payload = QuestionPayload.model_validate_json(ai_response or "")
+    if payload.input_type != target_question_type:
+        raise ValueError(f"input_type must be {target_question_type}, got {payload.input_type}")
+    if target_question_type in ("multiple_choice", "multi_select") and len(payload.options or []) < 2:
+        raise ValueError(f"{target_question_type} questions need at least two options")
+    return payload.model_dump()
+
+def question_completion_kwargs(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    kwargs = {
+        "model": QUESTION_MODEL,
+        "messages": messages,
+        "max_tokens": 400,
+        "temperature": 0.7,
+    }
+    if STRUCTURED_OUTPUT:
+        kwargs["response_format"] = QUESTION_RESPONSE_FORMAT
+    return kwargs
+
+def handle_question_reply(session_id: str, sequence: int, total_questions: int, prompt: Dict[str, Any], messages: List[Dict[str, str]], response) -> Optional[Step]:
+    """Step for a completion, or None if a structured reply was invalid.
+
+    On an invalid reply the rejected answer and the validation error are appended
+    to ``messages`` so the next attempt can correct itself.
+    """
+    usage = usage_dict(response)
+    prompt_builder.record(sequence, prompt["estimated_tokens"], usage)
+    output_stats.count("responses")
+    message = response.choices[0].message
     
-    # Load and parse questions dynamically
-    questions_config = load_questions_config()
-    parsed_questions = parse_questions_from_config(questions_config)
-    total_questions = len(parsed_questions)
+    if not STRUCTURED_OUTPUT:
+        with stage("json_parse", sequence, prompt["target_type"]):
+            return build_question_step(session_id, sequence, total_questions, prompt["target_type"], message.content, usage)
     
-    # Get the question for this sequence
-    current_question_data = parsed_questions.get(sequence)
-    if current_question_data:
-        question_text = current_question_data['text']
+    try:
+        if getattr(message, "refusal", None):
+            raise ValueError(f"model refused: {message.refusal}")
+        with stage("json_parse", sequence, prompt["target_type"]):
+            question_data = parse_structured_question(message.content, prompt["target_type"])
+    except ValueError as e:
+        print(f"Invalid structured question reply for Q{sequence}: {e}")
+        output_stats.count("parse_failures")
+        messages.extend([
+            {"role": "assistant", "content": message.content or ""},
+            {"role": "user", "content": f"That reply was invalid: {e}. Return the corrected JSON object only."}
+        ])
+        return None
+    
+    return question_step_from_data(
+        session_id, sequence, total_questions, prompt["target_type"], question_data["input_type"], question_data, usage
+    )
+
+# Pre-generated question variants, one bundle file per flow (see compile_bundle.py)
+question_bundles = BundleSet(enabled=os.getenv("BUNDLE_ENABLED", "1") == "1")
+
+def bundled_question_step(session_id: str, answers: Dict[str, Any], sequence: int, questionnaire: CompiledQuestionnaire) -> Optional[Step]:
+    """Serve a pre-generated variant from the bundle when the step needs no personalization."""
+    question_type = questionnaire.type(sequence)
+    if question_type is None:
+        return None
+    bundle = question_bundles.for_flow(questionnaire.name, questionnaire.source_path)
+    variant = bundle.pick_variant(questionnaire.content_hash, sequence, has_answers=bool(answers))
+    if variant is None:
+        return None
+    
+    if question_type in ("multiple_choice", "multi_select"):
+        input_obj = Input(kind=question_type, options=variant.get("options"))
+    elif question_type == "yes_no":
+        input_obj = Input(kind="yes_no")
     else:
-        question_text = "What's on your mind right now?"
+        input_obj = Input(kind="free_text", placeholder=variant.get("placeholder") or "Share your thoughts...")
+    
+    total_questions = questionnaire.total
+    return Step(
+        id=f"step_{sequence}",
+        type="question",
+        question=Question(
+            id=f"q_bundle_{sequence}",
+            label=variant["label"],
+            input=input_obj,
+            required=True,
+            help=variant.get("help")
+        ),
+        ui={"next_button_label": "Continue" if sequence < total_questions else "Finish"},
+        context={
+            "session_id": session_id,
+            "sequence": sequence,
+            "bundled": True,
+            "bundle_version": bundle.version,
+            "target_type": question_type,
+            "total_questions": total_questions
+        }
+    )
+
+# ---- Generated-step cache ----------------------------------------------------
+
+step_cache_lookups = metrics_registry.counter(
+    "agent_step_cache_lookups", "Generated-step cache lookups by result.", ["result"]
+)
+
+# Generated steps shared across sessions with the same flow version, sequence and normalized history
+step_cache = StepCache(
+    max_entries=int(os.getenv("STEP_CACHE_MAX_ENTRIES", "5000")),
+    ttl=float(os.getenv("STEP_CACHE_TTL_SECONDS", "86400")),
+    variants=int(os.getenv("STEP_CACHE_VARIANTS", "3")),
+    skip=parse_skip_list(os.getenv("STEP_CACHE_SKIP", "")),
+    spill_path=os.getenv("STEP_CACHE_SPILL_PATH") or None,
+    enabled=os.getenv("STEP_CACHE_ENABLED", "1") == "1",
+    listener=lambda result: step_cache_lookups.inc(result=result),
+)
+
+def step_cache_key(questionnaire: CompiledQuestionnaire, answers: Dict[str, Any], sequence: int, prompt: Dict[str, Any]) -> Optional[str]:
+    return step_cache.key(
+        questionnaire.name, questionnaire.content_hash, QUESTION_MODEL, sequence, prompt["target_type"], answers
+    )
+
+def cached_question_step(session_id: str, cache_key: Optional[str]) -> Optional[Step]:
+    cached = step_cache.get(cache_key)
+    if cached is None:
+        return None
+    step = Step.model_validate(cached)
+    step.context["session_id"] = session_id
+    step.context["cached"] = True
+    return step
+
+def cache_question_step(cache_key: Optional[str], step: Step) -> None:
+    """Store a freshly generated step for other sessions, minus what belongs to this one"""
+    if cache_key is None or step.context.get("degraded"):
+        return
+    cached = step.model_dump()
+    cached["context"].pop("session_id", None)
+    cached["context"]["usage"] = {}  # a cache hit costs no tokens
+    step_cache.put(cache_key, cached)
+
+# ---- Template / LLM routing --------------------------------------------------
+
+question_route_seconds = metrics_registry.histogram(
+    "agent_question_route_seconds", "Time to produce a question step, by who wrote it.", ["route"]
+)
+
+# Which questions the template engine writes instead of the LLM; "auto" (opt-in) learns it from the LLM's steps
+_route_types, _route_questions = parse_routes(os.getenv("STEP_ROUTES", ""))
+step_router = QuestionRouter(
+    by_type=_route_types,
+    by_question=_route_questions,
+    default=os.getenv("STEP_ROUTE_DEFAULT", "llm"),
+    min_samples=int(os.getenv("STEP_ROUTE_MIN_SAMPLES", "20")),
+    threshold=float(os.getenv("STEP_ROUTE_SIMILARITY", "0.9")),
+    explore_rate=float(os.getenv("STEP_ROUTE_EXPLORE_RATE", "0.05")),
+)
+
+def record_route(route: str, started: float) -> None:
+    elapsed = time.monotonic() - started
+    step_router.record_latency(route, elapsed)
+    question_route_seconds.observe(elapsed, route=route)
+
+def routed_template_step(session_id: str, sequence: int, questionnaire: CompiledQuestionnaire, target_type: str) -> Optional[Step]:
+    """The template step when the router sends this question to the template engine."""
+    # Prefetched branches are counted when one of them is served (see count_prefetched_route)
+    route = step_router.route(
+        questionnaire.name, questionnaire.content_hash, sequence, target_type, session_id,
+        count=current_endpoint.get() != "prefetch",
+    )
+    if route != TEMPLATE:
+        return None
+    started = time.monotonic()
+    step = template_question_step(session_id, sequence, target_type)
+    record_route(TEMPLATE, started)
+    return step
+
+def count_prefetched_route(session_id: str, step: Step) -> None:
+    """Route accounting for a prefetched step once it is served (bundled steps never reach the router)"""
+    if step.type == "question" and not step.context.get("bundled"):
+        step_router.count(TEMPLATE if step.context.get("template") else LLM, session_id)
+
+def route_fields(question: Question) -> Dict[str, Any]:
+    """The fields of a question the router compares (see routing.COMPARED_FIELDS)"""
+    return {
+        "label": question.label,
+        "options": [o.get("label", "") for o in question.input.options or []] or None,
+        "help": question.help,
+        "placeholder": question.input.placeholder,
+    }
+
+def observe_llm_step(questionnaire: CompiledQuestionnaire, sequence: int, target_type: str, step: Step, started: float) -> None:
+    """Record how far a generated step strayed from the template one, so "auto" routes can learn"""
+    record_route(LLM, started)
+    template = template_question_step(step.context["session_id"], sequence, target_type)
+    step_router.observe(questionnaire.content_hash, sequence, route_fields(template.question), route_fields(step.question))
+
+async def generate_ai_question(session_id: str, answers: Dict[str, Any], sequence: int) -> Step:
+    """Generate a question using OpenAI based on previous answers and configuration."""
+    
+    # Compiled questions (re-parsed only when questions.md changes)
+    questionnaire = get_questionnaire()
+    bundled = bundled_question_step(session_id, answers, sequence, questionnaire)
+    if bundled is not None:
+        return bundled
+    
+    prompt = build_question_prompt(questionnaire, answers, sequence)
+    if prompt is None:
+        return await generate_summary_step(session_id, answers)
     
-    # Create appropriate input based on type and question content
+    templated = routed_template_step(session_id, sequence, questionnaire, prompt["target_type"])
+    if templated is not None:
+        return templated
+    
+    cache_key = step_cache_key(questionnaire, answers, sequence, prompt)
+    cached = cached_question_step(session_id, cache_key)
+    if cached is not None:
+        return cached
+    
+    output_stats.count("steps")
+    messages = list(prompt["messages"])
+    deadline = deadline_policy.deadline("question")
+    degraded_reason = "invalid_output"
+    started = time.monotonic()
+    try:
+        for attempt in range(STRUCTURED_OUTPUT_MAX_ATTEMPTS):
+            if attempt:
+                output_stats.count("retries")
+            response = await create_completion_async(
+                "question", sequence, prompt["target_type"], deadline, **question_completion_kwargs(messages)
+            )
+            step = handle_question_reply(session_id, sequence, questionnaire.total, prompt, messages, response)
+            if step is not None:
+                observe_llm_step(questionnaire, sequence, prompt["target_type"], step, started)
+                cache_question_step(cache_key, step)
+                return step
+        print(f"No valid question reply for Q{sequence} after {STRUCTURED_OUTPUT_MAX_ATTEMPTS} attempts")
+    
+    except Exception as e:
+        print(f"Error generating AI question: {e}")
+        degraded_reason = degraded_reason_for(e)
+    
+    output_stats.count("fallbacks")
+    fallback_count.inc(kind="question")
+    return fallback_question(session_id, sequence, prompt["target_type"], degraded_reason)
+
+def template_input(question_text: str, target_type: str, sequence: int) -> Input:
+    """Input for a question built without the LLM, from its type and wording."""
     if target_type == "multiple_choice":
         if "emotion" in question_text.lower():
             # Emotion options
@@ -453,7 +973,7 @@ def fallback_question(session_id: str, sequence: int, target_type: str = "free_t
                 {"value": "opt2", "label": "Option 2"},
                 {"value": "opt3", "label": "Option 3"}
             ]
-        input_obj = Input(kind="multiple_choice", options=options)
+        return Input(kind="multiple_choice", options=options)
     elif target_type == "multi_select":
         if "action" in question_text.lower() or "steps" in question_text.lower():
             # Action plan options
@@ -471,9 +991,9 @@ def fallback_question(session_id: str, sequence: int, target_type: str = "free_t
                 {"value": "opt2", "label": "Option 2"},
                 {"value": "opt3", "label": "Option 3"}
             ]
-        input_obj = Input(kind="multi_select", options=options)
+        return Input(kind="multi_select", options=options)
     elif target_type == "yes_no":
-        input_obj = Input(kind="yes_no")
+        return Input(kind="yes_no")
     else:
         # Free text - create appropriate placeholder
         if "voice" in question_text.lower() and sequence <= 2:
@@ -482,7 +1002,21 @@ def fallback_question(session_id: str, sequence: int, target_type: str = "free_t
             placeholder = "Write your commitment or value here..."
         else:
             placeholder = "Share your thoughts..."
-        input_obj = Input(kind="free_text", placeholder=placeholder)
+        return Input(kind="free_text", placeholder=placeholder)
+
+def template_question_step(session_id: str, sequence: int, target_type: str = "free_text") -> Step:
+    """Question step built locally from questions.md: the exact question text and a type-appropriate input."""
+    
+    # Compiled questions (re-parsed only when questions.md changes)
+    questionnaire = get_questionnaire()
+    total_questions = questionnaire.total
+    
+    # Get the question for this sequence
+    current_question_data = questionnaire.questions.get(sequence)
+    if current_question_data:
+        question_text = current_question_data['text']
+    else:
+        question_text = "What's on your mind right now?"
     
     # Dynamic button label
     button_label = "Continue" if sequence < total_questions else "Finish"
@@ -491,21 +1025,48 @@ def fallback_question(session_id: str, sequence: int, target_type: str = "free_t
         id=f"step_{sequence}",
         type="question",
         question=Question(
-            id=f"q_fallback_{sequence}",
+            id=f"q_template_{sequence}",
             label=question_text,
-            input=input_obj,
+            input=template_input(question_text, target_type, sequence),
             required=True
         ),
         ui={"next_button_label": button_label},
-        context={"session_id": session_id, "sequence": sequence, "fallback": True, "total_questions": total_questions}
+        context={
+            "session_id": session_id,
+            "sequence": sequence,
+            "template": True,
+            "target_type": target_type,
+            "total_questions": total_questions
+        }
     )
 
-def generate_summary_step(session_id: str, answers: Dict[str, Any]) -> Step:
-    """Generate a detailed AI-powered summary of all questions and answers."""
-    
-    # Load questions to get the actual question texts
-    questions_config = load_questions_config()
-    parsed_questions = parse_questions_from_config(questions_config)
+def fallback_question(session_id: str, sequence: int, target_type: str = "free_text", degraded_reason: str = "error") -> Step:
+    """Fallback question when AI generation fails - uses your specific questions."""
+    step = template_question_step(session_id, sequence, target_type)
+    step.question.id = f"q_fallback_{sequence}"
+    step.context = {
+        "session_id": session_id,
+        "sequence": sequence,
+        "fallback": True,
+        "degraded": True,
+        "degraded_reason": degraded_reason,
+        "total_questions": step.context["total_questions"]
+    }
+    return step
+
+SUMMARY_SYSTEM_PROMPT = """You are a skilled therapeutic summarizer. Create a comprehensive, personalized summary that:
+                    
+                    1. SPECIFIC CONTENT: Reference their actual answers and insights, not generic statements
+                    2. THERAPEUTIC INSIGHTS: Identify patterns in their responses about their inner voice, emotions, and behaviors
+                    3. STRENGTHS & PROGRESS: Highlight their self-awareness, willingness to change, and specific commitments
+                    4. ACTIONABLE REFLECTION: Connect their answers to show a coherent picture of their journey
+                    5. ENCOURAGING TONE: Warm, professional, and validating
+                    
+                    Structure: 2-3 paragraphs, 4-6 sentences total. Be specific to their responses, not generic."""
+
+def format_qa_pairs(questionnaire: CompiledQuestionnaire, answers: Dict[str, Any]) -> str:
+    """"Q: ... / A: ..." blocks for the given answers, with the configured question texts."""
+    parsed_questions = questionnaire.questions
     
     # Create detailed context with questions and answers
     qa_pairs = []
@@ -522,31 +1083,38 @@ def generate_summary_step(session_id: str, answers: Dict[str, Any]) -> Step:
         
         qa_pairs.append(f"Q: {question_text}\nA: {answer_value}")
     
-    qa_text = "\n\n".join(qa_pairs)
-    total_questions = len(parsed_questions)
+    return "\n\n".join(qa_pairs)
+
+def build_summary_messages(questionnaire: CompiledQuestionnaire, answers: Dict[str, Any], digest: Optional[str] = None) -> List[Dict[str, str]]:
+    """Build the chat messages for the final summary from all question-answer pairs.
     
-    try:
-        # Generate comprehensive summary using AI
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": """You are a skilled therapeutic summarizer. Create a comprehensive, personalized summary that:
-                    
-                    1. SPECIFIC CONTENT: Reference their actual answers and insights, not generic statements
-                    2. THERAPEUTIC INSIGHTS: Identify patterns in their responses about their inner voice, emotions, and behaviors
-                    3. STRENGTHS & PROGRESS: Highlight their self-awareness, willingness to change, and specific commitments
-                    4. ACTIONABLE REFLECTION: Connect their answers to show a coherent picture of their journey
-                    5. ENCOURAGING TONE: Warm, professional, and validating
-                    
-                    Structure: 2-3 paragraphs, 4-6 sentences total. Be specific to their responses, not generic."""
-                },
-                {
-                    "role": "user", 
-                    "content": f"""Please create a detailed therapeutic summary based on these specific question-answer pairs from a self-reflection session:
+    With a rolling digest (SUMMARY_MODE=incremental), ``answers`` only holds
+    the answers the digest doesn't cover yet.
+    """
+    qa_text = format_qa_pairs(questionnaire, answers)
+    if digest is None:
+        context = f"""Please create a detailed therapeutic summary based on these specific question-answer pairs from a self-reflection session:
+
+{qa_text}"""
+    else:
+        context = f"""Please create a detailed therapeutic summary of a self-reflection session. These are running notes on their answers so far:
+
+{digest}"""
+        if qa_text:
+            context += f"""
 
-{qa_text}
+Their final question-answer pairs:
+
+{qa_text}"""
+    
+    return [
+        {
+            "role": "system", 
+            "content": SUMMARY_SYSTEM_PROMPT
+        },
+        {
+            "role": "user", 
+            "content": f"""{context}
 
 Create a summary that:
 - References their specific answers (the voice they identified, emotions they selected, etc.)
@@ -556,77 +1124,647 @@ Create a summary that:
 - Encourages their continued growth journey
 
 Make it personal and specific to what they shared, not a generic response."""
-                }
-            ],
+        }
+    ]
+
+def fallback_summary_text(answers: Dict[str, Any]) -> str:
+    """Basic summary built from their actual content when the AI summary fails."""
+    first_answer = list(answers.values())[0].get('value', 'your inner voice') if answers else 'your inner voice'
+    return f"Thank you for exploring your relationship with {first_answer} and reflecting on its impact on your life. Your willingness to examine these patterns and commit to positive change demonstrates real courage and self-awareness. This kind of honest self-reflection is a powerful foundation for continued growth and healing."
+
+def build_summary_step(session_id: str, answers: Dict[str, Any], summary: str, total_questions: int, degraded_reason: Optional[str] = None, summary_mode: Optional[str] = None, usage: Optional[Dict[str, int]] = None) -> Step:
+    context = {
+        "session_id": session_id, 
+        "sequence": len(answers) + 1, 
+        "summary": summary,
+        "total_questions": total_questions,
+        "completed": True,
+        "llm_calls_avoided": step_router.avoided(session_id),
+        "usage": usage or {}
+    }
+    if summary_mode:
+        context["summary_mode"] = summary_mode
+    if degraded_reason:
+        # Template summary served instead of the AI one
+        context.update(degraded=True, degraded_reason=degraded_reason)
+    return Step(
+        id="step_summary",
+        type="info",  # Flutter app expects 'info' type for summary
+        question=None,
+        ui={
+            "next_button_label": "Start New Session",
+            "summary_text": summary,
+            "show_restart": True
+        },
+        context=context
+    )
+
+async def generate_summary_step(session_id: str, answers: Dict[str, Any]) -> Step:
+    """Generate a detailed AI-powered summary of all questions and answers."""
+    
+    questionnaire = get_questionnaire()
+    messages, summary_mode = summary_request(questionnaire, answers, await summary_digester.take(session_id, answers))
+    degraded_reason = None
+    usage = None
+    
+    try:
+        response = await create_completion_async(
+            "summary",
+            deadline=deadline_policy.deadline("summary"),
+            model=SUMMARY_MODEL,
+            messages=messages,
             max_tokens=400,
             temperature=0.6
         )
         
         summary = response.choices[0].message.content.strip()
+        usage = usage_dict(response)
+        summary_digester.record_summary(summary_mode, usage)
         
     except Exception as e:
         print(f"Error generating AI summary: {e}")
-        # Create a basic fallback summary with their actual content
-        first_answer = list(answers.values())[0].get('value', 'your inner voice') if answers else 'your inner voice'
-        summary = f"Thank you for exploring your relationship with {first_answer} and reflecting on its impact on your life. Your willingness to examine these patterns and commit to positive change demonstrates real courage and self-awareness. This kind of honest self-reflection is a powerful foundation for continued growth and healing."
+        fallback_count.inc(kind="summary")
+        degraded_reason = degraded_reason_for(e)
+        summary = fallback_summary_text(answers)
     
-    return Step(
+    return build_summary_step(session_id, answers, summary, questionnaire.total, degraded_reason, summary_mode, usage)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def summary_stream_step(session_id: str, state: Dict[str, Any], total_questions: int) -> Step:
+    """Placeholder returned instead of the summary when the client will stream it"""
+    step = attach_session_token(session_id, state, Step(
         id="step_summary",
-        type="info",  # Flutter app expects 'info' type for summary
+        type="summary",
         question=None,
-        ui={
-            "next_button_label": "Start New Session",
-            "summary_text": summary,
-            "show_restart": True
-        },
+        ui={"stream_url": f"/sessions/{session_id}/summary/stream"},
         context={
-            "session_id": session_id, 
-            "sequence": len(answers) + 1, 
-            "summary": summary,
+            "session_id": session_id,
+            "sequence": len(state["answers"]) + 1,
             "total_questions": total_questions,
-            "completed": True
+            "streaming": True
         }
-    )
+    ))
+    if STATELESS_SESSIONS:
+        step.ui["stream_url"] += f"?session_token={step.context['session_token']}"
+    return step
+
+async def stream_summary_events(session_id: str, state: Dict[str, Any]) -> AsyncIterator[str]:
+    """Stream the summary as SSE frames (see summary_events)"""
+    async for event, data in summary_events(session_id, state):
+        yield sse_event(event, data)
+
+async def summary_events(session_id: str, state: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Stream the summary as 'token' events, then a 'done' event carrying the final summary Step.
 
-def next_step(session_id: str) -> Step:
+    If the gateway refuses the call, no token arrives within the summary budget,
+    or the upstream stream fails (before or after the first token), a 'fallback'
+    event with the template summary is sent and that text becomes the summary.
+    """
+    served_started = time.monotonic()
+    answers = state["answers"]
+    await flows_loaded()
+    questionnaire = pin_flow(state)
+    messages, summary_mode = summary_request(questionnaire, answers, await summary_digester.take(session_id, answers))
+    deadline = deadline_policy.deadline("summary")
+    parts = []
+    usage = None
+    degraded_reason = None
+    try:
+        await llm_gateway.acquire_async("summary")
+    except LLMUnavailable as e:
+        print(f"AI summary unavailable: {e}")
+        record_llm_call("summary", e.reason)
+        parts, degraded_reason = None, e.reason
+    
+    if parts is not None:
+        # The breaker judges latency to the first token, the slot is held until the stream ends
+        failed, first_token_latency = False, None
+        started = time.monotonic()
+        stream, finished = None, False
+        if deadline is not None:
+            deadline_policy.count("summary", "calls")
+        try:
+            with stage("summary"):
+                stream = await asyncio.wait_for(async_openai_client.chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=messages,
+                    max_tokens=400,
+                    temperature=0.6,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                ), deadline.remaining() if deadline else None)
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        if first_token_latency is None and deadline is not None:
+                            # The budget covers the wait for the first token only
+                            chunk = await asyncio.wait_for(chunks.__anext__(), deadline.remaining())
+                        else:
+                            chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        finished = True
+                        break
+                    if chunk.usage is not None:
+                        usage = usage_dict(chunk)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token_latency is None:
+                            first_token_latency = time.monotonic() - started
+                            deadline_policy.record_latency("summary", first_token_latency)
+                        parts.append(delta)
+                        yield "token", {"text": delta}
+            if not "".join(parts).strip():
+                raise ValueError("empty summary stream")
+            record_llm_call("summary", "ok", usage)
+            summary_digester.record_summary(summary_mode, usage)
+        
+        except asyncio.TimeoutError:
+            print(f"AI summary stream exceeded its {deadline.budget:g}s budget")
+            deadline_policy.count("summary", "timeout")
+            record_llm_call("summary", "error")
+            parts, degraded_reason = None, DeadlineExceeded.reason
+        except Exception as e:
+            print(f"Error streaming AI summary: {e}")
+            failed = is_upstream_failure(e)
+            record_llm_call("summary", "error")
+            parts, degraded_reason = None, "error"
+        finally:
+            llm_gateway.release(failed, first_token_latency if first_token_latency is not None else time.monotonic() - started)
+            if stream is not None and not finished:
+                # Failed, timed out, or the client went away mid-stream: free the upstream connection now
+                await stream.close()
+    
+    if parts:
+        summary = "".join(parts).strip()
+    else:
+        fallback_count.inc(kind="summary")
+        summary = fallback_summary_text(answers)
+        yield "fallback", {"text": summary}
+    
+    step = build_summary_step(session_id, answers, summary, questionnaire.total, degraded_reason, summary_mode, usage)
+    log_step_served(session_id, state, step, served_started)
+    if STATELESS_SESSIONS:
+        state["summary"] = summary
+        attach_session_token(session_id, state, step)
+    else:
+        stored = session_store.get(session_id)
+        if stored is not None:
+            stored["summary"] = summary
+            session_store.save(session_id, stored)
+    yield "done", {"step": step.model_dump()}
+
+async def next_step(session_id: str, state: Optional[Dict[str, Any]] = None) -> Step:
     """Generate the next step using AI."""
-    state = SESSIONS[session_id]
+    if state is None:
+        state = session_store.get(session_id)
     answers = state["answers"]
     sequence = len(answers) + 1
     
-    # Update sequence
     state["sequence"] = sequence
+    save_session(session_id, state)
     
-    # Generate AI question
-    return generate_ai_question(session_id, answers, sequence)
+    return await generate_ai_question(session_id, answers, sequence)
+
+# ---- Incremental summary -----------------------------------------------------
+
+# "incremental" keeps a rolling digest per session so the final summary prompt stays small
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "oneshot")
+
+DIGEST_SYSTEM_PROMPT = """You are a note-taking summarizer for a self-reflection session about a person's inner critical voice.
+                    Keep running notes that preserve what the final summary will need: the voice they identified, the emotions and
+                    situations they mentioned, what they are willing to observe or accept, and the values and actions they committed to.
+                    Use their own words for key details. Plain sentences, at most 120 words, no preamble."""
+
+def build_digest_messages(questionnaire: CompiledQuestionnaire, digest: str, new_answers: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": DIGEST_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"""Current notes:
+{digest or "(none yet)"}
+
+New question-answer pairs:
+
+{format_qa_pairs(questionnaire, new_answers)}
+
+Return the updated notes."""
+        }
+    ]
+
+async def update_digest(session_id: str, digest: str, new_answers: Dict[str, Any]) -> str:
+    # Runs in its own task, so this only labels the digest's own stage spans
+    current_endpoint.set("digest")
+    questionnaire = get_questionnaire()
+    response = await create_completion_async(
+        "digest",
+        model=SUMMARY_MODEL,
+        messages=build_digest_messages(questionnaire, digest, new_answers),
+        max_tokens=250,
+        temperature=0.3
+    )
+    text = (response.choices[0].message.content or "").strip()
+    if not text:
+        raise ValueError("empty digest")
+    return text
+
+summary_digester = SummaryDigester(
+    update=update_digest,
+    enabled=SUMMARY_MODE == "incremental",
+    wait_seconds=float(os.getenv("DIGEST_WAIT_SECONDS", "1")),
+    ttl=float(os.getenv("SESSION_TTL_SECONDS", "86400")),
+)
+
+def summary_request(questionnaire: CompiledQuestionnaire, answers: Dict[str, Any],
+                    digest: Optional[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Dict[str, str]], str]:
+    """Final summary messages and the mode actually used (a missing digest falls back to one-shot)"""
+    if digest is None:
+        return build_summary_messages(questionnaire, answers), "oneshot"
+    text, remaining = digest
+    return build_summary_messages(questionnaire, remaining, text), "incremental"
+
+# ---- Speculative prefetch ----------------------------------------------------
+
+async def generate_prefetched_step(session_id: str, answers: Dict[str, Any], sequence: int) -> Step:
+    # Runs in its own task, so this only labels the prefetch's own stage spans
+    current_endpoint.set("prefetch")
+    return await generate_ai_question(session_id, answers, sequence)
+
+prefetcher = StepPrefetcher(
+    generate=generate_prefetched_step,
+    next_question_type=lambda sequence: get_questionnaire().type(sequence),
+    max_concurrency=int(os.getenv("PREFETCH_MAX_CONCURRENCY", "8")),
+    max_branches=int(os.getenv("PREFETCH_MAX_BRANCHES", "4")),
+    max_pending=int(os.getenv("PREFETCH_MAX_PENDING", "200")),
+    ttl=float(os.getenv("PREFETCH_TTL_SECONDS", "300")),
+    enabled=os.getenv("PREFETCH_ENABLED", "1") == "1",
+)
+
+# ---- Batch sessions -----------------------------------------------------------
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
+BATCH_RETRY_DELAY = float(os.getenv("BATCH_RETRY_DELAY_SECONDS", "0.5"))
+
+async def generate_batch_step(generate, attempts: int) -> Tuple[Step, int]:
+    """Run one generation, retrying degraded (fallback) results with backoff"""
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(BATCH_RETRY_DELAY * 2 ** (attempt - 1))
+        step = await generate()
+        if not step.context.get("degraded"):
+            break
+    return step, attempt
+
+async def run_batch_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay one scripted session: every question step in order, then the summary.
+
+    Batch sessions are not stored and their completions run at the lowest
+    gateway priority, behind interactive traffic.
+    """
+    current_endpoint.set("batch")
+    session_id = f"batch-{uuid4()}"
+    questionnaire = pin_flow({"flow": item.get("flow")})
+    answers: Dict[str, Any] = {}
+    questions = []
+    retries = degraded = 0
+    for sequence, answer in enumerate(item["answers"][:questionnaire.total], start=1):
+        step, step_retries = await generate_batch_step(
+            lambda: generate_ai_question(session_id, dict(answers), sequence), BATCH_MAX_ATTEMPTS
+        )
+        retries += step_retries
+        degraded += bool(step.context.get("degraded"))
+        questions.append({
+            "sequence": sequence,
+            "id": step.question.id,
+            "label": step.question.label,
+            "kind": step.question.input.kind,
+            "options": step.question.input.options,
+            "degraded": bool(step.context.get("degraded")),
+        })
+        answers[step.question.id] = answer
+        context_compactor.schedule(answer)
+
+    summary = None
+    if item.get("summary", True):
+        step, step_retries = await generate_batch_step(
+            lambda: generate_summary_step(session_id, answers), BATCH_MAX_ATTEMPTS
+        )
+        retries += step_retries
+        degraded += bool(step.context.get("degraded"))
+        summary = step.context["summary"]
+    return {
+        "session_id": session_id,
+        "questions": questions,
+        "answers": answers,
+        "summary": summary,
+        "step_retries": retries,
+        "degraded_steps": degraded,
+    }
+
+def batch_runner(concurrency: Optional[int] = None) -> BatchRunner:
+    return BatchRunner(
+        run_batch_item,
+        concurrency=min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY),
+        max_attempts=BATCH_MAX_ATTEMPTS,
+        retry_delay=BATCH_RETRY_DELAY,
+    )
+
+# ---- Session event log -------------------------------------------------------
+
+# Append-only NDJSON record of every session, for analytics (see export_events.py)
+event_log = EventLog(
+    os.getenv("EVENT_LOG_DIR", "events"),
+    segment_bytes=int(float(os.getenv("EVENT_LOG_SEGMENT_MB", "64")) * 1024 * 1024),
+    flush_interval=float(os.getenv("EVENT_LOG_FLUSH_SECONDS", "1")),
+    fsync=os.getenv("EVENT_LOG_FSYNC", "1") == "1",
+    retention=float(os.getenv("EVENT_LOG_RETENTION_DAYS", "0")) * 86400 or None,
+    enabled=os.getenv("EVENT_LOG_ENABLED", "1") == "1",
+)
+# Answers are free-text reflections; only their shape is logged unless this is switched on
+EVENT_LOG_ANSWER_VALUES = os.getenv("EVENT_LOG_ANSWER_VALUES", "0") == "1"
+
+def step_source(step: Step, prefetched: bool = False) -> str:
+    """Who produced a served step, for the event log"""
+    if prefetched:
+        return "prefetch"
+    for flag, source in (("fallback", "fallback"), ("bundled", "bundle"), ("template", "template"), ("cached", "cache"),
+                         ("streaming", "stream")):
+        if step.context.get(flag):
+            return source
+    return "llm"
+
+def log_step_served(session_id: str, state: Dict[str, Any], step: Step, started: float, prefetched: bool = False) -> None:
+    context = step.context
+    event_log.append(
+        "step_served", session_id,
+        flow=state.get("flow"),
+        step_type=step.type,
+        sequence=context.get("sequence"),
+        question_id=step.question.id if step.question else None,
+        question_type=step.question.input.kind if step.question else None,
+        source=step_source(step, prefetched),
+        degraded=bool(context.get("degraded")),
+        latency_ms=round((time.monotonic() - started) * 1000, 1),
+        usage=context.get("usage") or None,
+    )
+    if context.get("completed"):
+        event_log.append(
+            "summary_generated", session_id,
+            flow=state.get("flow"),
+            summary_mode=context.get("summary_mode"),
+            degraded=bool(context.get("degraded")),
+            summary_chars=len(context.get("summary") or ""),
+            usage=context.get("usage") or None,
+        )
+
+def log_answer(session_id: str, state: Dict[str, Any], question_id: str, answer: Dict[str, Any]) -> None:
+    value = answer.get("value")
+    fields = {"value": value} if EVENT_LOG_ANSWER_VALUES else {}
+    event_log.append(
+        "answer_received", session_id,
+        flow=state.get("flow"),
+        endpoint=current_endpoint.get(),
+        question_id=question_id,
+        kind=answer.get("kind"),
+        length=len(value) if isinstance(value, (str, list)) else None,
+        **fields,
+    )
+
+# ---- Duplicate submissions ---------------------------------------------------
+
+coalesced_requests = metrics_registry.counter(
+    "agent_coalesced_requests", "Submissions answered by an identical in-flight or just finished one.", ["endpoint", "via"]
+)
+
+# Retried or concurrent identical submissions share one generation and its response
+submissions = SingleFlight(
+    ttl=float(os.getenv("DEDUP_TTL_SECONDS", "60")),
+    enabled=os.getenv("DEDUP_ENABLED", "1") == "1",
+    listener=lambda endpoint, via: coalesced_requests.inc(endpoint=endpoint, via=via),
+)
 
 # ---- Routes ------------------------------------------------------------------
 
 @app.post("/sessions")
-def create_session(payload: CreateSession):
+async def create_session(payload: CreateSession):
+    started = time.monotonic()
     sid = str(uuid4())
-    SESSIONS[sid] = {"answers": {}, "sequence": 0}
-    step = next_step(sid)
-    return {"session_id": sid, "step": step}
+    await flows_loaded()
+    if payload.flow is not None and payload.flow not in flow_registry.names():
+        raise HTTPException(404, f"unknown flow {payload.flow!r}")
+    state = new_session_state() if STATELESS_SESSIONS else session_store.create(sid)
+    state["flow"] = payload.flow or DEFAULT_FLOW
+    pin_flow(state)
+    event_log.append("session_created", sid, flow=state["flow"], flow_version=state["flow_version"], user_id=payload.user_id)
+    step = await next_step(sid, state)
+    log_step_served(sid, state, step, started)
+    prefetcher.schedule(sid, step, state["answers"])
+    return {"session_id": sid, "step": attach_session_token(sid, state, step)}
 
-@app.post("/sessions/{sid}/answer")
-def post_answer(sid: str, ans: Answer):
-    if sid not in SESSIONS or ans.session_id != sid:
-        raise HTTPException(404, "Session not found")
-    state = SESSIONS[sid]
+@app.post("/sessions/batch")
+async def post_batch(payload: BatchRequest):
+    """Run many scripted sessions concurrently; results stream back as NDJSON, one line per session plus a stats line."""
+    if len(payload.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"at most {BATCH_MAX_ITEMS} items per batch, got {len(payload.items)}")
+    await flows_loaded()
+    for item in payload.items:
+        if item.flow is not None and item.flow not in flow_registry.names():
+            raise HTTPException(404, f"unknown flow {item.flow!r}")
+    runner = batch_runner(payload.concurrency)
+    return StreamingResponse(
+        runner.ndjson(item.model_dump() for item in payload.items),
+        media_type="application/x-ndjson"
+    )
+
+async def record_answer(sid: str, state: Dict[str, Any], ans: Answer, stream_summary: bool) -> Dict[str, Any]:
+    started = time.monotonic()
     # very light validation: ensure question progression is sensible
     state["answers"][ans.question_id] = ans.answer
-    step = next_step(sid)
-    return {"step": step}
+    log_answer(sid, state, ans.question_id, ans.answer)
+    context_compactor.schedule(ans.answer)
+    
+    # Streaming clients fetch the summary from /summary/stream instead of waiting here
+    total_questions = get_questionnaire().total
+    if len(state["answers"]) < total_questions:
+        summary_digester.schedule(sid, state["answers"])
+    if stream_summary and len(state["answers"]) >= total_questions:
+        state["sequence"] = len(state["answers"]) + 1
+        save_session(sid, state)
+        prefetcher.discard(sid)
+        step = summary_stream_step(sid, state, total_questions)
+        log_step_served(sid, state, step, started)
+        return {"step": step}
+    step = await prefetcher.take(sid, ans.question_id, ans.answer)
+    prefetched = step is not None
+    if prefetched:
+        count_prefetched_route(sid, step)
+        state["sequence"] = len(state["answers"]) + 1
+        save_session(sid, state)
+    else:
+        step = await next_step(sid, state)
+    log_step_served(sid, state, step, started, prefetched)
+    prefetcher.schedule(sid, step, state["answers"])
+    return {"step": attach_session_token(sid, state, step)}
+
+async def submit_answer(sid: str, ans: Answer, stream_summary: bool, endpoint: str = "answer") -> Dict[str, Any]:
+    state = load_session(sid, ans.session_token) if ans.session_id == sid else None
+    if state is None:
+        raise HTTPException(404, "Session not found")
+    await flows_loaded()
+    pin_flow(state)
+    key = submission_key(sid, ans.question_id, ans.answer, stream_summary)
+    return await submissions.run(key, lambda: record_answer(sid, state, ans, stream_summary), endpoint)
+
+@app.post("/sessions/{sid}/answer")
+async def post_answer(sid: str, ans: Answer, stream_summary: bool = False):
+    return await submit_answer(sid, ans, stream_summary)
+
+@app.get("/sessions/{sid}/summary/stream")
+async def stream_summary(sid: str, session_token: Optional[str] = None):
+    """Server-sent events stream of the session summary."""
+    state = load_session(sid, session_token)
+    if state is None:
+        raise HTTPException(404, "Session not found")
+    return StreamingResponse(
+        stream_summary_events(sid, state),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ---- WebSocket session channel -----------------------------------------------
+
+WS_ENDPOINT = "/sessions/{sid}/ws"
+
+ws_answer_seconds = metrics_registry.histogram(
+    "agent_ws_answer_seconds", "Time from an answer arriving over a WebSocket to its step being pushed.", ["status"]
+)
+
+channel_hub = ChannelHub(
+    heartbeat=float(os.getenv("WS_HEARTBEAT_SECONDS", "20")),
+    idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60")),
+)
+
+async def channel_answer(channel: SessionChannel, sid: str, message: Dict[str, Any]) -> None:
+    """Handle one answer message: push the next step, or the summary placeholder followed by its tokens"""
+    started = time.perf_counter()
+    try:
+        ans = Answer.model_validate({**message, "session_id": sid})
+    except ValidationError as e:
+        await channel.send("error", status=422, detail=json.loads(e.json(include_url=False)))
+        return
+    async with channel.in_order:
+        try:
+            result = await submit_answer(sid, ans, stream_summary=True, endpoint="ws")
+        except HTTPException as e:
+            ws_answer_seconds.observe(time.perf_counter() - started, status=e.status_code)
+            await channel.send("error", status=e.status_code, detail=e.detail, question_id=ans.question_id)
+            return
+        step = result["step"]
+        await channel.send("step", step=step.model_dump())
+        ws_answer_seconds.observe(time.perf_counter() - started, status=200)
+        if step.type == "summary" and step.context.get("streaming"):
+            state = load_session(sid, step.context.get("session_token"))
+            async for event, data in summary_events(sid, state):
+                if event == "done":
+                    await channel.send("step", step=data["step"])
+                else:
+                    await channel.send(f"summary_{event}", **data)
+
+@app.websocket("/sessions/{sid}/ws")
+async def session_channel(websocket: WebSocket, sid: str, session_token: Optional[str] = None):
+    """Answers up, steps and summary tokens down over one long-lived connection."""
+    current_endpoint.set(WS_ENDPOINT)
+    channel = await channel_hub.accept(websocket)
+    try:
+        try:
+            state = load_session(sid, session_token)
+        except HTTPException:
+            state = None
+        if state is None:
+            await channel.send("error", status=404, detail="Session not found")
+            await channel.close(4404, "session not found")
+            return
+        await channel.send("ready", session_id=sid)
+        async for message in channel.messages():
+            if message.get("type") == "answer":
+                channel.spawn(channel_answer(channel, sid, message))
+            else:
+                await channel.send("error", status=400, detail=f"unknown message type {message.get('type')!r}")
+    finally:
+        await channel.drain()
+        channel_hub.closed()
 
 @app.get("/sessions/{sid}")
-def get_state(sid: str):
-    if sid not in SESSIONS:
+def get_state(sid: str, session_token: Optional[str] = None):
+    state = load_session(sid, session_token)
+    if state is None:
         raise HTTPException(404, "Session not found")
-    return SESSIONS[sid]
+    return state
+
+@app.get("/stats")
+def get_stats():
+    """Cache counters for the in-memory questionnaire model."""
+    return {
+        "questionnaire": flow_registry.cache_stats(),
+        "flows": flow_registry.stats(),
+        "question_types": type_cache.stats(),
+        "prefetch": prefetcher.stats(),
+        "bundle": question_bundles.stats(),
+        "sessions": {"mode": "stateless", **token_codec.stats()} if STATELESS_SESSIONS else session_store.stats(),
+        "prompts": prompt_builder.stats(),
+        "context_compaction": context_compactor.stats(),
+        "question_output": output_stats.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "deadlines": deadline_policy.stats(),
+        "summary_digest": {"mode": SUMMARY_MODE, **summary_digester.stats()},
+        "upstream": {**upstream_pool.stats(), "warmup": warmup.stats()},
+        "step_cache": step_cache.stats(),
+        "submissions": submissions.stats(),
+        "routing": step_router.stats(),
+        "websockets": channel_hub.stats(),
+        "event_log": event_log.stats(),
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    """Request/stage latency histograms and LLM, token, fallback and session counters (Prometheus text format)."""
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
+
+async def advance_session(session_id: str, answers: Dict[str, Any], payload: Dict[str, Any]) -> Step:
+    started = time.monotonic()
+    # Initialize session if it doesn't exist
+    if STATELESS_SESSIONS:
+        state = load_session(session_id, payload.get("session_token")) or new_session_state()
+    else:
+        state = session_store.get_or_create(session_id)
+    
+    state.setdefault("flow", payload.get("flow"))
+    await flows_loaded()
+    pin_flow(state)
+    
+    # Update session with provided answers
+    state["answers"].update(answers)
+    prefetcher.discard(session_id)
+    for question_id, answer in answers.items():
+        log_answer(session_id, state, question_id, answer)
+        context_compactor.schedule(answer)
+    if len(state["answers"]) < get_questionnaire().total:
+        summary_digester.schedule(session_id, state["answers"])
+    
+    # Generate next step
+    step = await next_step(session_id, state)
+    log_step_served(session_id, state, step, started)
+    return attach_session_token(session_id, state, step)
 
 @app.post("/next_step")
-def post_next_step(payload: Dict[str, Any]):
+async def post_next_step(payload: Dict[str, Any]):
     """Get the next step for a session based on current answers."""
     session_id = payload.get("session_id")
     answers = payload.get("answers", {})
@@ -634,17 +1772,66 @@ def post_next_step(payload: Dict[str, Any]):
     if not session_id:
         raise HTTPException(400, "session_id is required")
     
-    # Initialize session if it doesn't exist
-    if session_id not in SESSIONS:
-        SESSIONS[session_id] = {"answers": {}, "sequence": 0}
-    
-    # Update session with provided answers
-    state = SESSIONS[session_id]
-    state["answers"].update(answers)
-    
-    # Generate next step
-    step = next_step(session_id)
-    return step
+    key = submission_key(session_id, answers, payload.get("flow"))
+    return await submissions.run(key, lambda: advance_session(session_id, answers, payload), "next_step")
+
+@app.get("/flows")
+async def get_flows():
+    """Flows that new sessions can start, with their current version."""
+    await flows_loaded()
+    return flow_registry.stats()["flows"]
+
+@app.get("/ready")
+def get_ready():
+    """Readiness probe: 200 once the startup warm-up has finished, 503 until then."""
+    return JSONResponse(warmup.stats(), status_code=200 if warmup.ready else 503)
+
+# ---- Startup warm-up ---------------------------------------------------------
+
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+warmup = Warmup()
+
+async def warm_up_flows() -> Dict[str, Any]:
+    # Compile every flow up front (classification included), then watch the files for changes
+    await asyncio.to_thread(flow_registry.start)
+    for name in flow_registry.names():
+        build_question_prompt(flow_registry.get(name), {}, 1)
+    return {"flows": flow_registry.names()}
+
+async def warm_up_upstream() -> Dict[str, Any]:
+    # One pooled connection for the blocking client, WARMUP_CONNECTIONS for the async one
+    sync_probe = openai_client.with_options(max_retries=0, timeout=10.0)
+    try:
+        await asyncio.to_thread(sync_probe.models.list)
+    except openai.APIStatusError:
+        pass
+    return await open_connections(async_openai_client, WARMUP_CONNECTIONS)
+
+@app.on_event("startup")
+async def start_warmup():
+    steps = [("flows", warm_up_flows)]
+    if WARMUP_CONNECTIONS > 0:
+        steps.append(("upstream", warm_up_upstream))
+    warmup.start(steps)
+
+@app.on_event("startup")
+def start_event_log():
+    event_log.start()
+
+@app.on_event("shutdown")
+def close_event_log():
+    event_log.close()
+
+@app.on_event("shutdown")
+def close_session_store():
+    session_store.close()
+    flow_registry.stop()
+    step_cache.close()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    openai_client.close()
+    await async_openai_client.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,238 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+# ---- Metrics (Prometheus text exposition format) -----------------------------
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Route template of the request being served ("/sessions/{sid}/answer", "prefetch", ...)
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    """Base for labeled metrics: one child series per label-value combination.
+
+    Children are created on first use and cached, so the hot path is a dict
+    lookup plus one small lock; nothing is computed until ``render()``.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> Iterator[Tuple[str, str, float]]:
+        """(suffix, label string, value) for every series"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        self.labels(**labels).inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield "_total", _format_labels(self.labelnames, key), child.value
+
+class Gauge(Metric):
+    """Gauge whose value is set directly, or read from ``function`` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float, **labels) -> None:
+        self.labels(**labels).set(value)
+
+    def _samples(self):
+        if self.function is not None:
+            try:
+                yield "", "", float(self.function())
+            except Exception as e:
+                print(f"Gauge {self.name} failed: {e}")
+            return
+        for key, child in list(self._children.items()):
+            yield "", _format_labels(self.labelnames, key), child.value
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        self.labels(**labels).observe(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block, also when it raises"""
+        child = self.labels(**labels)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            child.observe(time.perf_counter() - started)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"'), cumulative
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), cumulative
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, function))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def route_template(scope) -> str:
+    """Path template of the route that will serve this request (keeps label cardinality bounded)"""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+class RequestMetricsMiddleware:
+    """Plain ASGI middleware observing request latency by endpoint, method and status.
+
+    The matched route template is also published in ``current_endpoint`` so
+    stage spans recorded while serving the request carry the endpoint label.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_template(scope)
+        token = current_endpoint.set(endpoint)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.histogram.observe(
+                time.perf_counter() - started, endpoint=endpoint, method=scope["method"], status=status[0]
+            )
+            current_endpoint.reset(token)
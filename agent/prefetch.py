@@ -0,0 +1,199 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# ---- Speculative next-step prefetch ------------------------------------------
+
+ANY_ANSWER = "*"  # branch key for steps generated without the pending answer
+
+GenerateFn = Callable[[str, Dict[str, Any], int], Awaitable[Any]]
+
+def answer_key(answer: Dict[str, Any]) -> str:
+    """Stable key for an answer value (kind is implied by the question)"""
+    return json.dumps(answer.get("value"), sort_keys=True)
+
+@dataclass
+class PrefetchEntry:
+    question_id: str
+    sequence: int
+    task: "asyncio.Task"
+    expires_at: float
+
+    def tokens(self) -> int:
+        if not self.task.done() or self.task.cancelled() or self.task.exception():
+            return 0
+        return self.task.result().context.get("usage", {}).get("total_tokens", 0)
+
+class StepPrefetcher:
+    """Generates likely next steps in the background while the user is still answering.
+
+    After a question step is served, ``schedule()`` starts one generation per
+    plausible answer (``yes_no`` and ``multiple_choice`` questions), or a single
+    answer-independent generation when the *next* question's type does not need
+    the pending answer as context. ``take()`` hands out the matching branch when
+    the real answer arrives; every other branch of that step is discarded and its
+    tokens are counted as wasted.
+    """
+
+    def __init__(
+        self,
+        generate: GenerateFn,
+        next_question_type: Callable[[int], Optional[str]],
+        max_concurrency: int = 8,
+        max_branches: int = 4,
+        max_pending: int = 200,
+        ttl: float = 300.0,
+        context_free_types: Tuple[str, ...] = ("yes_no",),
+        enabled: bool = True,
+    ):
+        self.generate = generate
+        self.next_question_type = next_question_type
+        self.max_concurrency = max_concurrency
+        self.max_branches = max_branches
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.context_free_types = context_free_types
+        self.enabled = enabled
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._entries: Dict[str, Dict[str, PrefetchEntry]] = {}  # session_id -> branch key -> entry
+        self.scheduled = 0
+        self.skipped = 0
+        self.hits = 0
+        self.inflight_hits = 0
+        self.misses = 0
+        self.not_prefetched = 0  # answers to steps that had no branches; not lookups
+        self.expired = 0
+        self.used_tokens = 0
+        self.wasted_tokens = 0
+
+    def _candidate_answers(self, step) -> List[Optional[Dict[str, Any]]]:
+        """Answers worth prefetching for; None stands for 'answer-independent'"""
+        question = step.question
+        next_type = self.next_question_type(step.context.get("sequence", 0) + 1)
+        if next_type is None:
+            return []  # next step is the summary, which depends on every answer
+        if next_type in self.context_free_types:
+            return [None]
+        kind = question.input.kind
+        if kind == "yes_no":
+            return [{"kind": kind, "value": True}, {"kind": kind, "value": False}]
+        if kind == "multiple_choice" and question.input.options:
+            options = question.input.options[:self.max_branches]
+            return [{"kind": kind, "value": option["value"]} for option in options]
+        return []
+
+    def _pending(self) -> int:
+        return sum(
+            1 for branches in self._entries.values()
+            for entry in branches.values() if not entry.task.done()
+        )
+
+    async def _run(self, session_id: str, answers: Dict[str, Any], sequence: int):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await self.generate(session_id, answers, sequence)
+
+    def schedule(self, session_id: str, step, answers: Dict[str, Any]) -> None:
+        """Start prefetching the step that follows ``step`` for this session"""
+        self.discard(session_id)
+        if not self.enabled or step.type != "question" or step.question is None:
+            return
+        self._purge_expired()
+
+        candidates = self._candidate_answers(step)
+        if not candidates:
+            return
+        if self._pending() + len(candidates) > self.max_pending:
+            self.skipped += len(candidates)
+            return
+
+        question_id = step.question.id
+        sequence = step.context.get("sequence", 0) + 1
+        expires_at = time.monotonic() + self.ttl
+        branches = {}
+        for candidate in candidates:
+            if candidate is None:
+                key, branch_answers = ANY_ANSWER, dict(answers)
+            else:
+                key, branch_answers = answer_key(candidate), {**answers, question_id: candidate}
+            task = asyncio.create_task(self._run(session_id, branch_answers, sequence))
+            branches[key] = PrefetchEntry(question_id, sequence, task, expires_at)
+        self._entries[session_id] = branches
+        self.scheduled += len(branches)
+
+    async def take(self, session_id: str, question_id: str, answer: Dict[str, Any]):
+        """Return the prefetched step for this answer, or None on a miss"""
+        branches = self._entries.pop(session_id, None)
+        if not branches:
+            # Nothing was speculated for this step (summary next, free text, or skipped over max_pending)
+            self.not_prefetched += 1
+            return None
+
+        entry = branches.pop(answer_key(answer), None) or branches.pop(ANY_ANSWER, None)
+        self._discard_branches(branches)
+        if entry is None or entry.question_id != question_id or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self._discard_branches({"": entry})
+            self.misses += 1
+            return None
+
+        if not entry.task.done():
+            # Still generating - waiting for it is cheaper than starting over
+            self.inflight_hits += 1
+        try:
+            step = await asyncio.shield(entry.task)
+        except Exception as e:
+            print(f"Prefetched step failed: {e}")
+            self.misses += 1
+            return None
+        if step.context.get("degraded"):
+            # A fallback generated in the background; the foreground call may still succeed
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used_tokens += entry.tokens()
+        return step
+
+    def discard(self, session_id: str) -> None:
+        """Drop all prefetched branches of a session (e.g. its answers were replaced)"""
+        self._discard_branches(self._entries.pop(session_id, {}))
+
+    def _discard_branches(self, branches: Dict[str, PrefetchEntry]) -> None:
+        for entry in branches.values():
+            if entry.task.done():
+                self.wasted_tokens += entry.tokens()
+            else:
+                # Let it finish so the tokens we already paid for are accounted for
+                entry.task.add_done_callback(self._count_wasted)
+
+    def _count_wasted(self, task: "asyncio.Task") -> None:
+        if not task.cancelled() and task.exception() is None:
+            self.wasted_tokens += task.result().context.get("usage", {}).get("total_tokens", 0)
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for session_id in [sid for sid, branches in self._entries.items()
+                           if all(entry.expires_at < now for entry in branches.values())]:
+            self.expired += len(self._entries[session_id])
+            self.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "pending": self._pending(),
+            "sessions": len(self._entries),
+            "hits": self.hits,
+            "inflight_hits": self.inflight_hits,
+            "misses": self.misses,
+            "not_prefetched": self.not_prefetched,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "expired": self.expired,
+            "used_tokens": self.used_tokens,
+            "wasted_tokens": self.wasted_tokens,
+        }
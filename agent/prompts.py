@@ -0,0 +1,167 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+# ---- Question prompt builder -------------------------------------------------
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o family
+except Exception:  # tiktoken is optional
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    """Exact token count with tiktoken, else the usual ~4 characters per token estimate"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def strip_markdown(config_content: str) -> str:
+    """Compact questions.md for embedding in a prompt.
+
+    Headings become "1. Title: question text" lines; rules, emphasis markers,
+    example/note lines and blank lines are dropped.
+    """
+    lines = []
+    heading_open = False
+    for line in config_content.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('---') or line.startswith('*') or line.startswith('('):
+            continue
+        if line.startswith('#'):
+            lines.append(line.lstrip('#').strip())
+            heading_open = True
+            continue
+        line = re.sub(r'[*_`]+', '', line)
+        if heading_open:
+            lines[-1] = f"{lines[-1]}: {line}"
+            heading_open = False
+        elif lines:
+            lines[-1] = f"{lines[-1]} {line}"
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+QUESTION_INSTRUCTIONS = """For every request you generate ONE question of this interview. The request names the question number, the exact question text and the required input type.
+
+CRITICAL REQUIREMENTS:
+1. The question type MUST be the requested input type
+2. Return ONLY a JSON object (no markdown, no explanations)
+3. Use the EXACT question text from the request
+4. For multiple_choice: provide realistic emotion options for emotion questions, or relevant options for other questions
+5. For multi_select: provide multiple actionable options that can be selected together
+6. For yes_no: no options needed
+7. For free_text: provide encouraging placeholder text
+
+JSON Format:
+{
+  "question": "<the exact question text>",
+  "input_type": "<the requested input type>",
+  "help": "Optional helpful guidance text",
+  "placeholder": "Optional placeholder for free_text",
+  "options": [
+    {"value": "key1", "label": "Option 1"},
+    {"value": "key2", "label": "Option 2"}
+  ]
+}
+
+Use therapeutic, supportive language in help text."""
+
+def build_question_system_prompt(config_content: str) -> str:
+    """The static system prompt: identical for every step and session of one questions.md version"""
+    return f"""You are conducting a therapeutic self-reflection interview using these specific questions:
+
+{strip_markdown(config_content)}
+
+{QUESTION_INSTRUCTIONS}"""
+
+def format_answers(answers: Dict[str, Any]) -> str:
+    """Every previous answer verbatim, with its kind"""
+    context_parts = []
+    for q_id, answer_data in answers.items():
+        answer_value = answer_data.get('value', 'No answer')
+        answer_type = answer_data.get('kind', 'unknown')
+        context_parts.append(f"Q{len(context_parts)+1} ({answer_type}): {answer_value}")
+    return "\n".join(context_parts)
+
+class QuestionPromptBuilder:
+    """Builds question prompts as a stable prefix plus a small per-step tail.
+
+    The system message only depends on questions.md, so consecutive calls share
+    an identical prefix that the provider's prompt cache can reuse; everything
+    specific to the step (number, question text, type, previous answers) goes
+    in the final user message. With a compactor, the previous answers are
+    condensed to fit a token budget. Input token counts are tracked per call,
+    both as estimated here and as reported by the API.
+    """
+
+    def __init__(self, compactor=None):
+        self.compactor = compactor  # optional compaction.ContextCompactor for the previous answers
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.estimated_input_tokens = 0
+        self.reported_input_tokens = 0
+        self.cached_input_tokens = 0
+        self.last_call: Dict[str, Any] = {}
+
+    def format_context(self, answers: Dict[str, Any], sequence: int) -> str:
+        if self.compactor is not None:
+            return self.compactor.compact(answers, sequence)
+        return format_answers(answers)
+
+    def build(self, system_prompt: str, answers: Dict[str, Any], sequence: int, total_questions: int,
+              question_text: str, target_question_type: str, generic: bool = False) -> List[Dict[str, str]]:
+        request = f"""Generate question #{sequence} of {total_questions}.
+Question text: "{question_text}"
+Question type must be: {target_question_type}"""
+
+        if generic:
+            user_prompt = f"""{request}
+
+This version is pre-generated and shown to every user, so do not refer to previous answers."""
+        elif sequence == 1 or not answers:
+            user_prompt = f"""{request}
+
+Include a supportive placeholder to encourage open sharing."""
+        else:
+            user_prompt = f"""Previous answers:
+{self.format_context(answers, sequence)}
+
+{request}
+
+Build on their previous answers to create continuity in this therapeutic conversation."""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def estimate(self, messages: List[Dict[str, str]]) -> int:
+        # ~4 tokens of chat framing per message
+        return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+    def record(self, sequence: int, estimated_tokens: int, usage: Optional[Dict[str, int]] = None) -> None:
+        """Account one completion's input tokens"""
+        usage = usage or {}
+        with self._lock:
+            self.calls += 1
+            self.estimated_input_tokens += estimated_tokens
+            self.reported_input_tokens += usage.get("prompt_tokens", 0)
+            self.cached_input_tokens += usage.get("cached_tokens", 0)
+            self.last_call = {
+                "sequence": sequence,
+                "estimated_input_tokens": estimated_tokens,
+                "reported_input_tokens": usage.get("prompt_tokens"),
+                "cached_input_tokens": usage.get("cached_tokens"),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "estimated_input_tokens": self.estimated_input_tokens,
+            "reported_input_tokens": self.reported_input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "avg_input_tokens": round(self.reported_input_tokens / self.calls, 1) if self.calls else None,
+            "token_counter": "tiktoken" if _encoding is not None else "estimate",
+            "last_call": self.last_call,
+        }
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Optional, Tuple, Any
+
+# ---- Compiled questionnaire --------------------------------------------------
+
+ParsedQuestions = Dict[int, Dict[str, str]]
+Compiler = Callable[[str], Tuple[ParsedQuestions, Dict[str, str]]]
+
+@dataclass(frozen=True)
+class CompiledQuestionnaire:
+    """Parsed questions.md plus everything derived from it, built once per file version."""
+    source_path: str
+    content: str
+    content_hash: str
+    mtime: Optional[float]
+    questions: ParsedQuestions = field(default_factory=dict)
+    prompt_fragments: Dict[str, str] = field(default_factory=dict)
+    name: str = "default"  # flow name (see flows.py)
+
+    @property
+    def total(self) -> int:
+        return len(self.questions)
+
+    def text(self, sequence: int) -> Optional[str]:
+        question = self.questions.get(sequence)
+        return question['text'] if question else None
+
+    def type(self, sequence: int) -> Optional[str]:
+        question = self.questions.get(sequence)
+        return question['type'] if question else None
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+class QuestionnaireCache:
+    """Keeps one compiled questionnaire in memory and rebuilds it only when the file changes.
+
+    A cheap ``os.stat`` is done on every ``get()``. When the mtime moved, the file
+    is re-read and hashed; the (expensive) compiler only runs if the content hash
+    actually differs from the compiled version. The flow watcher polls with
+    ``count_hit=False`` so ``hits`` only counts lookups made for requests.
+    """
+
+    def __init__(self, path: str, compiler: Compiler, name: str = "default"):
+        self.path = path
+        self.compiler = compiler
+        self.name = name
+        self._compiled: Optional[CompiledQuestionnaire] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.rebuilds = 0
+
+    def _stat_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _read(self) -> str:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception as e:
+            print(f"Could not load {os.path.basename(self.path)}: {e}")
+            return ""
+
+    def get(self, count_hit: bool = True) -> CompiledQuestionnaire:
+        mtime = self._stat_mtime()
+        compiled = self._compiled
+        if compiled is not None and compiled.mtime == mtime:
+            if count_hit:
+                self.hits += 1
+            return compiled
+
+        with self._lock:
+            # Another thread may have rebuilt while we waited for the lock
+            compiled = self._compiled
+            if compiled is not None and compiled.mtime == mtime:
+                if count_hit:
+                    self.hits += 1
+                return compiled
+
+            content = self._read()
+            digest = content_hash(content)
+            if compiled is not None and compiled.content_hash == digest:
+                # File was touched but not changed - keep the compiled model
+                self.revalidations += 1
+                self._compiled = replace(compiled, mtime=mtime)
+                return self._compiled
+
+            questions, fragments = self.compiler(content)
+            self._compiled = CompiledQuestionnaire(
+                source_path=self.path,
+                content=content,
+                content_hash=digest,
+                mtime=mtime,
+                questions=questions,
+                prompt_fragments=fragments,
+                name=self.name,
+            )
+            self.rebuilds += 1
+            print(f"Compiled questionnaire {os.path.basename(self.path)}: {len(questions)} questions ({digest[:12]})")
+            return self._compiled
+
+    def record_hit(self) -> None:
+        """A request served from the compiled model that a refresh already checked"""
+        self.hits += 1
+
+    def stats(self) -> Dict[str, Any]:
+        compiled = self._compiled
+        return {
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "rebuilds": self.rebuilds,
+            "total_questions": compiled.total if compiled else None,
+            "content_hash": compiled.content_hash if compiled else None,
+        }
@@ -0,0 +1,167 @@
+import difflib
+import random
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from deadlines import LatencyTracker
+
+# ---- Template / LLM routing of question steps --------------------------------
+
+TEMPLATE = "template"
+LLM = "llm"
+AUTO = "auto"
+ROUTES = (TEMPLATE, LLM, AUTO)
+
+def parse_routes(spec: str) -> Tuple[Dict[str, str], Dict[Tuple[Optional[str], int], str]]:
+    """"yes_no=template,3=llm,checkin:2=auto" -> ({"yes_no": "template"}, {(None, 3): "llm", ("checkin", 2): "auto"})"""
+    by_type: Dict[str, str] = {}
+    by_question: Dict[Tuple[Optional[str], int], str] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        target, _, route = item.partition("=")
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError(f"unknown route {route!r} for {target!r}, expected one of {', '.join(ROUTES)}")
+        flow, _, sequence = target.strip().rpartition(":")
+        if sequence.isdigit():
+            by_question[(flow or None, int(sequence))] = route
+        else:
+            by_type[target.strip()] = route
+    return by_type, by_question
+
+# Everything the LLM may personalize in a question step
+COMPARED_FIELDS = ("label", "options", "help", "placeholder")
+
+def text_similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, " ".join(a.casefold().split()), " ".join(b.casefold().split())).ratio()
+
+def field_text(value: Any) -> str:
+    if isinstance(value, list):
+        return "\n".join(value)
+    return value or ""
+
+@dataclass
+class RouteSamples:
+    """How close the LLM's steps came to the template for one question of one flow version"""
+    count: int = 0
+    similarity_sum: float = 0.0
+
+    @property
+    def similarity(self) -> float:
+        return self.similarity_sum / self.count if self.count else 0.0
+
+class QuestionRouter:
+    """Decides per step whether the template engine or the LLM writes the question.
+
+    Routes come from ``by_question`` ((flow or None, sequence) -> route), then
+    ``by_type`` (question type -> route), then ``default``. ``template`` and
+    ``llm`` are fixed; ``auto`` learns: LLM steps of that question are
+    compared with what the template would have produced, field by field
+    (``COMPARED_FIELDS``), and the least similar field counts. Fields the
+    template leaves empty (its help, a yes/no placeholder) carry no signal
+    and are skipped. Once
+    ``min_samples`` of them averaged at least ``threshold`` similarity,
+    personalization isn't changing anything and the template serves the
+    question, except for ``explore_rate`` of the steps that keep checking.
+    Samples are kept per flow version, so an edited question starts learning
+    again.
+    """
+
+    def __init__(self, by_type: Optional[Dict[str, str]] = None,
+                 by_question: Optional[Dict[Tuple[Optional[str], int], str]] = None,
+                 default: str = LLM, min_samples: int = 20, threshold: float = 0.9,
+                 explore_rate: float = 0.05, max_sessions: int = 10000):
+        self.by_type = by_type or {}
+        self.by_question = by_question or {}
+        self.default = default
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self.explore_rate = explore_rate
+        self.max_sessions = max_sessions
+        self._samples: Dict[Tuple[str, int], RouteSamples] = {}
+        self._avoided: "OrderedDict[str, int]" = OrderedDict()  # session_id -> LLM calls avoided
+        self._latency = {TEMPLATE: LatencyTracker(), LLM: LatencyTracker()}
+        self._lock = threading.Lock()
+        self.routed = {TEMPLATE: 0, LLM: 0}
+        self.learned = 0
+
+    def configured(self, flow: str, sequence: int, question_type: str) -> str:
+        route = self.by_question.get((flow, sequence)) or self.by_question.get((None, sequence))
+        return route or self.by_type.get(question_type) or self.default
+
+    def route(self, flow: str, flow_version: str, sequence: int, question_type: str, session_id: str,
+              count: bool = True) -> str:
+        """``template`` or ``llm`` for this step; ``count=False`` for speculative steps, see ``count()``"""
+        route = self.configured(flow, sequence, question_type)
+        if route == AUTO:
+            route = TEMPLATE if self._learned_template(flow_version, sequence) else LLM
+        if count:
+            self.count(route, session_id)
+        return route
+
+    def count(self, route: str, session_id: str) -> None:
+        """Account for a routed step served to the client"""
+        with self._lock:
+            self.routed[route] += 1
+            if route == TEMPLATE:
+                self._avoided[session_id] = self._avoided.get(session_id, 0) + 1
+            else:
+                self._avoided.setdefault(session_id, 0)
+            self._avoided.move_to_end(session_id)
+            while len(self._avoided) > self.max_sessions:
+                self._avoided.popitem(last=False)
+
+    def _learned_template(self, flow_version: str, sequence: int) -> bool:
+        samples = self._samples.get((flow_version, sequence))
+        if samples is None or samples.count < self.min_samples or samples.similarity < self.threshold:
+            return False
+        return random.random() >= self.explore_rate
+
+    def observe(self, flow_version: str, sequence: int, template: Dict[str, Any], generated: Dict[str, Any]) -> None:
+        """Compare an LLM step with the template step of the same question, field by field"""
+        similarity = min(
+            text_similarity(field_text(template[name]), field_text(generated.get(name)))
+            for name in COMPARED_FIELDS if template.get(name)
+        )
+        with self._lock:
+            samples = self._samples.setdefault((flow_version, sequence), RouteSamples())
+            was_learned = samples.count >= self.min_samples and samples.similarity >= self.threshold
+            samples.count += 1
+            samples.similarity_sum += similarity
+            if not was_learned and samples.count >= self.min_samples and samples.similarity >= self.threshold:
+                self.learned += 1
+
+    def record_latency(self, route: str, seconds: float) -> None:
+        self._latency[route].record(seconds)
+
+    def avoided(self, session_id: str) -> int:
+        return self._avoided.get(session_id, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_session: List[int] = list(self._avoided.values())
+            questions = {
+                f"{version[:12]}:{sequence}": {"samples": s.count, "similarity": round(s.similarity, 3)}
+                for (version, sequence), s in sorted(self._samples.items())
+            }
+
+        def ms(route: str, fraction: float) -> Optional[float]:
+            value = self._latency[route].percentile(fraction)
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "default": self.default,
+            "routes": dict(self.by_type, **{f"{flow + ':' if flow else ''}{seq}": r for (flow, seq), r in self.by_question.items()}),
+            "routed": dict(self.routed),
+            "learned_templates": self.learned,
+            "llm_calls_avoided": sum(per_session),
+            "avoided_per_session": round(sum(per_session) / len(per_session), 2) if per_session else None,
+            "latency_ms": {
+                route: {"p50": ms(route, 0.5), "p95": ms(route, 0.95)} for route in (TEMPLATE, LLM)
+            },
+            "questions": questions,
+        }
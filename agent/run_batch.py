@@ -0,0 +1,62 @@
+"""Run many scripted sessions (questions + summary) offline through the batch worker pool.
+
+Input is a JSON array or NDJSON file of answer sets, each either a list of
+answers in question order or {"id": ..., "answers": [...], "summary": true}.
+Results are written as NDJSON in completion order (each line carries its input
+"index"), followed by a stats line with the throughput in sessions per minute.
+
+Usage (from the agent directory):
+    python run_batch.py answers.ndjson -o results.ndjson --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, Iterator
+
+import main
+from batch import BatchRunner
+
+def read_items(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = (json.loads(line) for line in text.splitlines() if line.strip())
+    for entry in entries:
+        yield main.BatchItem.model_validate(
+            {"answers": entry} if isinstance(entry, list) else entry
+        ).model_dump()
+
+async def run(path: str, out, runner: BatchRunner) -> Dict[str, Any]:
+    async for result in runner.run(read_items(path)):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        status = "ok" if result["ok"] else f"failed: {result['error']}"
+        print(f"#{result['index']} {result.get('id') or ''} {status} ({result['elapsed_ms']} ms)", file=sys.stderr)
+    stats = runner.stats()
+    out.write(json.dumps(stats) + "\n")
+    return stats
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSON array or NDJSON file of answer sets")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON results file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=main.BATCH_CONCURRENCY, help="sessions run at once")
+    parser.add_argument("--attempts", type=int, default=main.BATCH_MAX_ATTEMPTS, help="attempts per failing session")
+    args = parser.parse_args()
+
+    runner = BatchRunner(main.run_batch_item, concurrency=args.concurrency,
+                         max_attempts=args.attempts, retry_delay=main.BATCH_RETRY_DELAY)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        stats = asyncio.run(run(args.input, out, runner))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{stats['succeeded']}/{stats['sessions']} sessions in {stats['elapsed_s']}s "
+          f"({stats['sessions_per_minute']} sessions/min, {stats['retries']} retries)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Any, Dict, Tuple
+
+from sessions import decode_state, encode_state
+
+# ---- Stateless signed session tokens -----------------------------------------
+
+TOKEN_VERSION = "v1"
+
+class InvalidSessionToken(ValueError):
+    pass
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+class SessionTokenCodec:
+    """Packs a whole session state into a URL-safe, HMAC-SHA256 signed token.
+
+    Format: ``v1.<payload>.<signature>``, where the payload is the state in the
+    session store's compact encoding (minified JSON, zlib-compressed once it
+    grows) together with the session id and an expiry time. Any worker holding
+    the same secret can verify and extend a token, so no shared storage is
+    needed. Tokens are signed, not encrypted: clients can read their answers.
+    """
+
+    def __init__(self, secret: bytes, ttl: float = 86400.0):
+        self.secret = secret
+        self.ttl = ttl
+        self.encoded = 0
+        self.verified = 0
+        self.rejected = 0
+
+    def _sign(self, signed_part: bytes) -> bytes:
+        return hmac.new(self.secret, signed_part, hashlib.sha256).digest()
+
+    def encode(self, session_id: str, state: Dict[str, Any]) -> str:
+        payload = _b64encode(encode_state({"sid": session_id, "exp": int(time.time() + self.ttl), "state": state}))
+        signed_part = f"{TOKEN_VERSION}.{payload}"
+        self.encoded += 1
+        return f"{signed_part}.{_b64encode(self._sign(signed_part.encode('ascii')))}"
+
+    def decode(self, token: str) -> Tuple[str, Dict[str, Any]]:
+        """Verify a token and return (session_id, state); raises InvalidSessionToken"""
+        try:
+            version, payload, signature = token.split(".")
+            if version != TOKEN_VERSION:
+                raise InvalidSessionToken(f"unsupported token version {version!r}")
+            expected = self._sign(f"{version}.{payload}".encode("ascii"))
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                raise InvalidSessionToken("bad signature")
+            body = decode_state(_b64decode(payload))
+        except InvalidSessionToken:
+            self.rejected += 1
+            raise
+        except Exception as e:
+            self.rejected += 1
+            raise InvalidSessionToken(f"malformed token: {e}")
+        if body["exp"] < time.time():
+            self.rejected += 1
+            raise InvalidSessionToken("token expired")
+        self.verified += 1
+        return body["sid"], body["state"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"encoded": self.encoded, "verified": self.verified, "rejected": self.rejected}
+
+def create_token_codec() -> SessionTokenCodec:
+    """Codec keyed by SESSION_TOKEN_SECRET (all workers must share it)"""
+    secret = os.getenv("SESSION_TOKEN_SECRET")
+    if not secret:
+        print("SESSION_TOKEN_SECRET is not set - using a random per-process secret; "
+              "tokens will not verify on other workers")
+        return SessionTokenCodec(secrets.token_bytes(32), ttl=float(os.getenv("SESSION_TTL_SECONDS", "86400")))
+    return SessionTokenCodec(secret.encode("utf-8"), ttl=float(os.getenv("SESSION_TTL_SECONDS", "86400")))
@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# ---- Session stores ----------------------------------------------------------
+
+def new_session_state() -> Dict[str, Any]:
+    return {"answers": {}, "sequence": 0}
+
+COMPRESS_THRESHOLD = 512
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Compact binary form of a state dict: minified JSON, zlib-compressed once it is large enough"""
+    raw = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(raw)
+    return b"j" + raw
+
+def decode_state(blob: bytes) -> Dict[str, Any]:
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(raw)
+
+class SessionStore(ABC):
+    """Where session state ({"answers": {...}, "sequence": int, ...}) lives.
+
+    ``get()`` returns a state dict the caller may modify; changes are only
+    guaranteed to persist once passed back to ``save()``.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    def create(self, session_id: str) -> Dict[str, Any]:
+        state = new_session_state()
+        self.save(session_id, state)
+        return state
+
+    def get_or_create(self, session_id: str) -> Dict[str, Any]:
+        state = self.get(session_id)
+        return state if state is not None else self.create(session_id)
+
+    def close(self) -> None:
+        pass
+
+class InMemorySessionStore(SessionStore):
+    """Process-local LRU cache of sessions with an idle TTL, an entry cap and a byte budget.
+
+    Sessions are kept in a compact form - minified JSON, zlib-compressed once it
+    grows past ``COMPRESS_THRESHOLD`` - so the byte budget can be accounted
+    exactly per entry (plus a fixed estimate for the key and bookkeeping).
+    Every ``get()``/``save()`` marks a session as recently used; the least
+    recently used sessions are evicted first.
+    """
+
+    ENTRY_OVERHEAD = 200  # rough bytes per entry for the key, tuple and OrderedDict node
+
+    def __init__(self, ttl: float = 86400.0, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()  # session_id -> (blob, last access)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _size(self, blob: bytes) -> int:
+        return len(blob) + self.ENTRY_OVERHEAD
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            blob, last_access = entry
+            if now - last_access > self.ttl:
+                self._remove(session_id)
+                self.expired += 1
+                return None
+            self._entries[session_id] = (blob, now)
+            self._entries.move_to_end(session_id)
+        return decode_state(blob)
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        blob = encode_state(state)
+        with self._lock:
+            self._remove(session_id)
+            self._entries[session_id] = (blob, time.monotonic())
+            self._bytes += self._size(blob)
+            self._evict()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._remove(session_id)
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= self._size(entry[0])
+
+    def _evict(self) -> None:
+        """Drop idle sessions, then least recently used ones until both limits hold"""
+        cutoff = time.monotonic() - self.ttl
+        while self._entries:
+            session_id, (blob, last_access) = next(iter(self._entries.items()))
+            if last_access >= cutoff:
+                break
+            self._remove(session_id)
+            self.expired += 1
+        while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+            session_id = next(iter(self._entries))
+            self._remove(session_id)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions": len(self._entries),
+            "estimated_bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+class SQLiteSessionStore(SessionStore):
+    """Durable store shared by every worker on the host.
+
+    Uses WAL mode so readers never block the writer, one cached prepared
+    statement per query, and write-behind batching: ``save()`` puts the state
+    in a pending buffer (read back by ``get()``) that a background thread
+    flushes in a single transaction every ``flush_interval`` seconds.
+    ``flush_interval=0`` writes through immediately instead. Rows past
+    their TTL are ignored on read and deleted periodically.
+    """
+
+    SELECT_SQL = "SELECT state FROM sessions WHERE id = ? AND expires_at > ?"
+    UPSERT_SQL = ("INSERT INTO sessions (id, state, updated_at, expires_at) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT(id) DO UPDATE SET state = excluded.state, "
+                  "updated_at = excluded.updated_at, expires_at = excluded.expires_at")
+    DELETE_SQL = "DELETE FROM sessions WHERE id = ?"
+    PURGE_SQL = "DELETE FROM sessions WHERE expires_at <= ?"
+
+    def __init__(self, path: str, ttl: float = 86400.0, flush_interval: float = 0.05,
+                 max_batch: int = 500, purge_interval: float = 60.0):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._pending: Dict[str, Optional[str]] = {}  # session_id -> serialized state (None = delete)
+        self._flushing: Dict[str, Optional[str]] = {}  # batch being committed, still visible to get()
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_needed = threading.Event()
+        self._closed = threading.Event()
+        self.writes = 0
+        self.flushes = 0
+        self.purged = 0
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        conn.commit()
+
+        self._writer = None
+        if flush_interval > 0:
+            self._writer = threading.Thread(target=self._flush_loop, name="session-store-writer", daemon=True)
+            self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 keeps its prepared statements cached"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, cached_statements=64, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._pending_lock:
+            for buffered in (self._pending, self._flushing):
+                if session_id in buffered:
+                    serialized = buffered[session_id]
+                    return json.loads(serialized) if serialized is not None else None
+        row = self._conn().execute(self.SELECT_SQL, (session_id, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        self._enqueue(session_id, json.dumps(state, separators=(",", ":")))
+
+    def delete(self, session_id: str) -> None:
+        self._enqueue(session_id, None)
+
+    def _enqueue(self, session_id: str, serialized: Optional[str]) -> None:
+        with self._pending_lock:
+            self._pending[session_id] = serialized
+            batch_full = len(self._pending) >= self.max_batch
+        if self._writer is None:
+            self.flush()
+        elif batch_full:
+            self._flush_needed.set()
+
+    def flush(self) -> None:
+        """Write all pending states in one transaction"""
+        with self._flush_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                pending = self._flushing = self._pending
+                self._pending = {}
+            now = time.time()
+            upserts = [(sid, state, now, now + self.ttl) for sid, state in pending.items() if state is not None]
+            deletes = [(sid,) for sid, state in pending.items() if state is None]
+            try:
+                conn = self._conn()
+                with conn:
+                    if upserts:
+                        conn.executemany(self.UPSERT_SQL, upserts)
+                    if deletes:
+                        conn.executemany(self.DELETE_SQL, deletes)
+            finally:
+                with self._pending_lock:
+                    self._flushing = {}
+            self.writes += len(pending)
+            self.flushes += 1
+
+    def purge_expired(self) -> int:
+        conn = self._conn()
+        with conn:
+            deleted = conn.execute(self.PURGE_SQL, (time.time(),)).rowcount
+        self.purged += deleted
+        return deleted
+
+    def _flush_loop(self) -> None:
+        last_purge = time.monotonic()
+        while not self._closed.is_set():
+            self._flush_needed.wait(self.flush_interval)
+            self._flush_needed.clear()
+            try:
+                self.flush()
+                if time.monotonic() - last_purge > self.purge_interval:
+                    self.purge_expired()
+                    last_purge = time.monotonic()
+            except Exception as e:
+                print(f"Session store flush failed: {e}")
+
+    def close(self) -> None:
+        self._closed.set()
+        self._flush_needed.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        row = self._conn().execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": row[0],
+            "pending_writes": len(self._pending),
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "purged": self.purged,
+        }
+
+def create_session_store() -> SessionStore:
+    """Session store selected by the SESSION_STORE env var (memory or sqlite)"""
+    backend = os.getenv("SESSION_STORE", "memory")
+    ttl = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    if backend == "sqlite":
+        path = os.getenv("SESSION_DB_PATH", os.path.join(os.path.dirname(__file__), "sessions.db"))
+        return SQLiteSessionStore(
+            path,
+            ttl=ttl,
+            flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL", "0.05")),
+        )
+    return InMemorySessionStore(
+        ttl=ttl,
+        max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# ---- Single-flight submissions -----------------------------------------------
+
+def submission_key(*parts: Any) -> str:
+    """Hash of a submission, e.g. (session_id, question_id, answer)"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """Runs one handler per identical submission and shares its result.
+
+    A submission whose key is already running awaits the running task instead
+    of starting another generation ("in_flight"). Once it has finished, its
+    result is kept for ``ttl`` seconds so a client retry gets the same response
+    back ("replay"). The work runs in its own task: a client that disconnects
+    mid-request doesn't cancel it for the others. Failures are shared by the
+    waiters of that run but never cached, so the next retry runs again.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 10000, enabled: bool = True,
+                 listener: Optional[Callable[[str, str], None]] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.listener = listener  # (label, "in_flight" | "replay")
+        self._running: Dict[str, "asyncio.Task"] = {}
+        self._done: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.runs = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    def _coalesce(self, label: str, via: str) -> None:
+        if via == "in_flight":
+            self.coalesced += 1
+        else:
+            self.replayed += 1
+        if self.listener is not None:
+            self.listener(label, via)
+
+    def _finished(self, key: str, task: "asyncio.Task") -> None:
+        self._running.pop(key, None)
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        self._done[key] = (time.monotonic() + self.ttl, task.result())
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def _replay(self, key: str) -> Tuple[bool, Any]:
+        cached = self._done.get(key)
+        if cached is None:
+            return False, None
+        expires_at, result = cached
+        if expires_at <= time.monotonic():
+            del self._done[key]
+            return False, None
+        return True, result
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]], label: str = "") -> Any:
+        if not self.enabled:
+            return await work()
+        found, result = self._replay(key)
+        if found:
+            self._coalesce(label, "replay")
+            return result
+        task = self._running.get(key)
+        if task is not None:
+            self._coalesce(label, "in_flight")
+        else:
+            self.runs += 1
+            task = self._running[key] = asyncio.create_task(work())
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "in_flight": len(self._running),
+            "replayable": len(self._done),
+        }
@@ -0,0 +1,234 @@
+import copy
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sessions import decode_state, encode_state
+
+# ---- Generated-step cache ----------------------------------------------------
+
+def normalize_answer(answer: Dict[str, Any]) -> Any:
+    """Canonical form of an answer: what a prompt would see, minus case, spacing and selection order"""
+    value = answer.get("value")
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, list):
+        return sorted({str(v).strip().casefold() for v in value})
+    if isinstance(value, str):
+        text = " ".join(value.split()).casefold().rstrip(".!?")
+        if answer.get("kind") == "yes_no" and text in ("yes", "no", "true", "false"):
+            return text in ("yes", "true")
+        return text
+    return value
+
+def parse_skip_list(spec: str) -> Set[Tuple[Optional[str], int]]:
+    """"2,7,checkin:3" -> {(None, 2), (None, 7), ("checkin", 3)}; None matches every flow"""
+    skip = set()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        flow, _, sequence = item.rpartition(":")
+        skip.add((flow or None, int(sequence)))
+    return skip
+
+@dataclass
+class CacheEntry:
+    variants: List[Dict[str, Any]]
+    expires_at: float
+
+class StepCache:
+    """LRU + TTL cache of generated question steps, shared by every session.
+
+    The key is the flow version, the model, the step's sequence and target type,
+    and a hash of the session's normalized prior answers. A step is only
+    reused for the exact same (normalized) history, so nothing from another
+    user's free text can leak into a question. Each key collects up to
+    ``variants`` different steps before it is served from. Until then a lookup
+    counts as a miss and the new generation is added, so users don't all get
+    the same wording. Degraded (fallback) steps are never stored.
+
+    With ``spill_path``, entries evicted from memory go to a SQLite file and
+    are promoted back on their next hit; they also survive restarts.
+    Questions listed in ``skip`` (see ``parse_skip_list``) are never cached.
+    """
+
+    SELECT_SQL = "SELECT variants FROM step_cache WHERE key = ? AND expires_at > ?"
+    UPSERT_SQL = ("INSERT INTO step_cache (key, variants, expires_at) VALUES (?, ?, ?) "
+                  "ON CONFLICT(key) DO UPDATE SET variants = excluded.variants, expires_at = excluded.expires_at")
+    DELETE_SQL = "DELETE FROM step_cache WHERE key = ?"
+    PURGE_SQL = "DELETE FROM step_cache WHERE expires_at <= ?"
+    TRIM_SQL = ("DELETE FROM step_cache WHERE key IN "
+                "(SELECT key FROM step_cache ORDER BY expires_at LIMIT max(0, (SELECT count(*) FROM step_cache) - ?))")
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 86400.0, variants: int = 3,
+                 skip: Iterable[Tuple[Optional[str], int]] = (), spill_path: Optional[str] = None,
+                 max_spilled: int = 100000, enabled: bool = True,
+                 listener: Optional[Callable[[str], None]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.skip = set(skip)
+        self.enabled = enabled
+        self.max_spilled = max_spilled
+        self.listener = listener
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.evictions = 0
+        self.spills = 0
+        if spill_path and enabled:
+            self._db = sqlite3.connect(spill_path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS step_cache (
+                key TEXT PRIMARY KEY,
+                variants BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS step_cache_expires_at ON step_cache (expires_at)")
+            self._db.execute(self.PURGE_SQL, (time.time(),))
+            self._db.commit()
+
+    def _count(self, result: str) -> None:
+        if self.listener is not None:
+            self.listener(result)
+
+    def key(self, flow: str, flow_version: str, model: str, sequence: int, target_type: str,
+            answers: Dict[str, Any]) -> Optional[str]:
+        """Cache key for a step, or None when this question opted out"""
+        if not self.enabled:
+            return None
+        if (None, sequence) in self.skip or (flow, sequence) in self.skip:
+            self.skipped += 1
+            self._count("skip")
+            return None
+        history = json.dumps([normalize_answer(a) for a in answers.values()], sort_keys=True, ensure_ascii=False)
+        raw = f"{flow_version}|{model}|{sequence}|{target_type}|{history}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """A copy of a random cached variant, or None while the key is still collecting variants"""
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        from_disk = False
+        if entry is None and self._db is not None:
+            entry = self._load(key, now)
+            from_disk = entry is not None
+        if entry is None or len(entry.variants) < self.variants:
+            self.misses += 1
+            self._count("miss")
+            return None
+        if from_disk:
+            self.disk_hits += 1
+            self._count("disk_hit")
+        else:
+            self.hits += 1
+            self._count("hit")
+        return copy.deepcopy(random.choice(entry.variants))
+
+    def put(self, key: Optional[str], step: Dict[str, Any]) -> None:
+        if key is None:
+            return
+        spilled = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = CacheEntry([], time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(entry.variants) >= self.variants:
+                return
+            entry.variants.append(step)
+            self.stores += 1
+            spilled = self._evict()
+        if spilled and self._db is not None:
+            self._spill(spilled)
+
+    def _evict(self) -> List[Tuple[str, CacheEntry]]:
+        """Pop least recently used entries past max_entries; called with the lock held"""
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False))
+            self.evictions += 1
+        return evicted
+
+    # -- disk spill --
+
+    def _load(self, key: str, now: float) -> Optional[CacheEntry]:
+        with self._db_lock:
+            row = self._db.execute(self.SELECT_SQL, (key, now)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(self.DELETE_SQL, (key,))
+            self._db.commit()
+        stored = decode_state(row[0])
+        entry = CacheEntry(stored["variants"], stored["expires_at"])
+        with self._lock:
+            self._entries[key] = entry  # promoted back to memory
+            spilled = self._evict()
+        if spilled:
+            self._spill(spilled)
+        return entry
+
+    def _spill(self, entries: List[Tuple[str, CacheEntry]]) -> None:
+        with self._db_lock:
+            self._db.executemany(self.UPSERT_SQL, [
+                (key, encode_state({"variants": entry.variants, "expires_at": entry.expires_at}), entry.expires_at)
+                for key, entry in entries
+            ])
+            self.spills += len(entries)
+            if self.spills % 100 < len(entries):
+                self._db.execute(self.PURGE_SQL, (time.time(),))
+                self._db.execute(self.TRIM_SQL, (self.max_spilled,))
+            self._db.commit()
+
+    def close(self) -> None:
+        """Spill everything still in memory so the next process starts warm"""
+        if self._db is None:
+            return
+        with self._lock:
+            entries = list(self._entries.items())
+        if entries:
+            self._spill(entries)
+        with self._db_lock:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        spilled = None
+        if self._db is not None:
+            with self._db_lock:
+                spilled = self._db.execute("SELECT count(*) FROM step_cache").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "variants_per_key": self.variants,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+            "skipped": self.skipped,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "spilled": spilled,
+        }
@@ -0,0 +1,83 @@
+import copy
+import threading
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel, create_model
+
+# ---- Structured (JSON-schema) question output --------------------------------
+
+class QuestionOption(BaseModel):
+    value: str
+    label: str
+
+def question_payload_model(question_model: Type[BaseModel], input_model: Type[BaseModel]) -> Type[BaseModel]:
+    """Reply model for question generation, derived from the Question/Input API models.
+
+    Field names follow the JSON format the prompt asks for; every field is
+    required (nullable where the API model is optional), as strict mode demands.
+    """
+    question_fields = question_model.model_fields
+    input_fields = input_model.model_fields
+    return create_model(
+        "QuestionPayload",
+        question=(question_fields["label"].annotation, ...),
+        input_type=(input_fields["kind"].annotation, ...),
+        help=(question_fields["help"].annotation, ...),
+        placeholder=(input_fields["placeholder"].annotation, ...),
+        options=(Optional[List[QuestionOption]], ...),
+    )
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """model_json_schema() adapted to the provider's strict structured-output subset"""
+    def visit(node: Any) -> Any:
+        if isinstance(node, dict):
+            node.pop("title", None)
+            node.pop("default", None)
+            if "properties" in node:
+                node["additionalProperties"] = False
+                node["required"] = list(node["properties"].keys())
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for item in node:
+                visit(item)
+        return node
+    return visit(copy.deepcopy(model.model_json_schema()))
+
+def json_schema_response_format(name: str, model: Type[BaseModel]) -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": strict_json_schema(model)},
+    }
+
+class OutputStats:
+    """Counts how often question replies fail to parse and how often we fall back."""
+
+    def __init__(self, structured: bool, max_attempts: int):
+        self.structured = structured
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.steps = 0
+        self.responses = 0
+        self.parse_failures = 0
+        self.retries = 0
+        self.default_options = 0
+        self.fallbacks = 0
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "json_schema" if self.structured else "text",
+            "max_attempts": self.max_attempts,
+            "steps": self.steps,
+            "responses": self.responses,
+            "parse_failures": self.parse_failures,
+            "retries": self.retries,
+            "default_options": self.default_options,
+            "fallbacks": self.fallbacks,
+            "parse_failure_rate": round(self.parse_failures / self.responses, 4) if self.responses else None,
+            "fallback_rate": round(self.fallbacks / self.steps, 4) if self.steps else None,
+        }
@@ -0,0 +1,41 @@
+from routing import AUTO, LLM, TEMPLATE, QuestionRouter
+
+YES_NO = {"label": "Does this voice often affect your mood?", "options": None, "help": None, "placeholder": None}
+FREE_TEXT = {"label": "What does this voice say?", "options": None, "help": None, "placeholder": "Share your thoughts..."}
+
+def router(**kwargs) -> QuestionRouter:
+    return QuestionRouter(default=AUTO, min_samples=3, threshold=0.9, explore_rate=0.0, **kwargs)
+
+def test_matching_steps_switch_to_the_template_after_min_samples():
+    r = router()
+    generated = dict(YES_NO, help="Think about the last few days.")  # help the template doesn't write
+    for _ in range(2):
+        r.observe("v1", 4, YES_NO, generated)
+        assert r.route("default", "v1", 4, "yes_no", "s1") == LLM
+    r.observe("v1", 4, YES_NO, generated)
+    assert r.route("default", "v1", 4, "yes_no", "s1") == TEMPLATE
+    assert r.learned == 1
+    assert r.stats()["questions"]["v1:4"] == {"samples": 3, "similarity": 1.0}
+
+def test_personalized_placeholder_keeps_the_llm():
+    r = router()
+    generated = dict(FREE_TEXT, placeholder="Write down the exact words it used at work yesterday...")
+    for _ in range(5):
+        r.observe("v1", 2, FREE_TEXT, generated)
+    assert r.route("default", "v1", 2, "free_text", "s1") == LLM
+    assert r.learned == 0
+
+def test_samples_are_kept_per_flow_version():
+    r = router()
+    for _ in range(3):
+        r.observe("v1", 4, YES_NO, YES_NO)
+    assert r.route("default", "v1", 4, "yes_no", "s1") == TEMPLATE
+    assert r.route("default", "v2", 4, "yes_no", "s1") == LLM
+
+def test_uncounted_routes_avoid_nothing_until_served():
+    r = QuestionRouter(by_question={(None, 7): TEMPLATE})
+    assert r.route("default", "v1", 7, "free_text", "s1", count=False) == TEMPLATE
+    assert r.route("default", "v1", 7, "free_text", "s1", count=False) == TEMPLATE
+    assert r.avoided("s1") == 0 and r.routed[TEMPLATE] == 0
+    r.count(TEMPLATE, "s1")
+    assert r.avoided("s1") == 1 and r.routed[TEMPLATE] == 1
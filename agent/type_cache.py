@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional, Any
+
+# ---- Persistent question-type cache ------------------------------------------
+
+CACHE_VERSION = 1
+
+def question_key(question_text: str) -> str:
+    """Hash of the whitespace-normalized question text"""
+    normalized = " ".join(question_text.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+class QuestionTypeCache:
+    """Sidecar JSON file mapping question-text hashes to their classified input type.
+
+    Only types that came from the classifier are stored, so a question that had to
+    fall back to content analysis is retried on the next parse. Entries are keyed by
+    text (not by sequence number), which keeps them valid when questions are
+    reordered; an edited question simply misses under its new hash. Old entries
+    are not pruned: every flow shares the file, so one flow's parse can't tell
+    which of them are unused. Changing the classifier model (or deleting the
+    file) starts over.
+    """
+
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.model = model
+        self._types: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Ignoring unreadable type cache {self.path}: {e}")
+            return
+        if data.get("version") != CACHE_VERSION or data.get("model") != self.model:
+            print(f"Type cache {os.path.basename(self.path)} is stale, reclassifying")
+            return
+        self._types = data.get("types", {})
+
+    def get(self, question_text: str) -> Optional[str]:
+        with self._lock:
+            self._load()
+            entry = self._types.get(question_key(question_text))
+        if entry:
+            self.hits += 1
+            return entry["type"]
+        self.misses += 1
+        return None
+
+    def update(self, types_by_text: Dict[str, str]) -> None:
+        """Store newly classified types and rewrite the sidecar file atomically"""
+        if not types_by_text:
+            return
+        with self._lock:
+            self._load()
+            for text, question_type in types_by_text.items():
+                self._types[question_key(text)] = {"type": question_type, "text": text[:80]}
+            payload = {"version": CACHE_VERSION, "model": self.model, "types": self._types}
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self.writes += 1
+            except Exception as e:
+                print(f"Could not write type cache {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._types),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+        }
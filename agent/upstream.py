@@ -0,0 +1,112 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+
+# ---- Upstream connection pool and startup warm-up ----------------------------
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401 - installed by httpx[http2]
+        return True
+    except ImportError:
+        return False
+
+class UpstreamPool:
+    """Connection-pool settings shared by the OpenAI clients.
+
+    One httpx client per flavour (sync and async) carries every completion, so
+    connections and TLS sessions are reused across requests, hedges and
+    background work. Idle connections are kept for ``keepalive_expiry``
+    seconds (httpx defaults to 5), so a quiet minute doesn't mean a fresh TLS
+    handshake. HTTP/2 multiplexes concurrent calls over a few connections; it
+    needs the optional ``h2`` package and is skipped with a warning without it.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, keepalive_expiry: float = 30.0,
+                 http2: bool = True, connect_timeout: float = 5.0):
+        if http2 and not http2_available():
+            print("UPSTREAM_HTTP2 is on but the h2 package is missing (pip install 'httpx[http2]'); using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(600.0, connect=connect_timeout)
+
+    def sync_client(self) -> httpx.Client:
+        return openai.DefaultHttpxClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+
+    def async_client(self) -> httpx.AsyncClient:
+        return openai.DefaultAsyncHttpxClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "keepalive_seconds": self.limits.keepalive_expiry,
+        }
+
+async def open_connections(client: openai.AsyncOpenAI, count: int) -> Dict[str, int]:
+    """Open up to ``count`` pooled connections with concurrent cheap requests (GET /models)"""
+    probe = client.with_options(max_retries=0, timeout=10.0)
+
+    async def one() -> bool:
+        try:
+            await probe.models.list()
+        except openai.APIStatusError:
+            pass  # any HTTP reply means the connection is up and pooled
+        except Exception as e:
+            print(f"Warm-up connection failed: {e}")
+            return False
+        return True
+
+    results = await asyncio.gather(*(one() for _ in range(count)))
+    return {"opened": sum(results), "failed": len(results) - sum(results)}
+
+class Warmup:
+    """Startup warm-up steps run concurrently in the background; ``ready`` once all have finished.
+
+    A step that fails is recorded but does not keep the service unready: the
+    request path has its own fallbacks for an unreachable upstream.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.task: Optional["asyncio.Task"] = None
+
+    def start(self, steps: List[Tuple[str, Callable[[], Awaitable[Any]]]]) -> None:
+        self.task = asyncio.create_task(self.run(steps))
+
+    async def _step(self, name: str, step: Callable[[], Awaitable[Any]]) -> None:
+        started = time.monotonic()
+        try:
+            result = await step()
+            self.steps[name] = {"ok": True, "ms": round((time.monotonic() - started) * 1000), "result": result}
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+            self.steps[name] = {"ok": False, "ms": round((time.monotonic() - started) * 1000), "error": str(e)}
+
+    async def run(self, steps: List[Tuple[str, Callable[[], Awaitable[Any]]]]) -> None:
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.gather(*(self._step(name, step) for name, step in steps))
+        finally:
+            self.duration = time.monotonic() - self.started_at
+            self.ready = True
+            print(f"Warm-up finished in {self.duration:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup_ms": round(self.duration * 1000) if self.duration is not None else None,
+            "steps": self.steps,
+        }